@@ -0,0 +1,124 @@
+#!/usr/bin/env python3
+# fake_twilio.py
+"""
+Local stand-in for the part of the Twilio REST API that loadgen.py uses, so
+the generator can be tested and benchmarked offline.
+
+    POST /2010-04-01/Accounts/{AccountSid}/Calls.json   → 201 {"sid": "CA…", "status": "queued", …}
+
+Basic auth is required (any credentials). Behaviour is tunable to look like the
+real API under load: --latency-ms/--jitter-ms response time, --cps for
+Twilio's per-account calls-per-second limit (excess gets 429 / code 20429),
+and --error-rate for random 500s.
+
+    python fake_twilio.py --port 8085 --latency-ms 120 --cps 50
+"""
+import re
+import json
+import time
+import uuid
+import random
+import argparse
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+CALLS_RE = re.compile(r"^/2010-04-01/Accounts/([^/]+)/Calls\.json$")
+
+
+class Limiter:
+    """Token bucket: `rate` per second, burst of `rate`."""
+    def __init__(self, rate: float):
+        self.rate = rate
+        self.tokens = rate
+        self.at = time.monotonic()
+        self.lock = threading.Lock()
+
+    def allow(self) -> bool:
+        if self.rate <= 0:
+            return True
+        with self.lock:
+            now = time.monotonic()
+            self.tokens = min(self.rate, self.tokens + (now - self.at) * self.rate)
+            self.at = now
+            if self.tokens >= 1:
+                self.tokens -= 1
+                return True
+            return False
+
+
+class Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"   # keep-alive, like the real API
+    cfg: argparse.Namespace
+    limiter: Limiter
+    stats = {"created": 0, "throttled": 0, "errors": 0}
+    stats_lock = threading.Lock()
+
+    def log_message(self, fmt, *args):
+        if self.cfg.verbose:
+            super().log_message(fmt, *args)
+
+    def _reply(self, status: int, body: dict):
+        data = json.dumps(body).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _count(self, key: str):
+        with self.stats_lock:
+            self.stats[key] += 1
+
+    def do_GET(self):
+        if self.path == "/stats":
+            return self._reply(200, self.stats)
+        self._reply(404, {"code": 20404, "message": "not found", "status": 404})
+
+    def do_POST(self):
+        body = self.rfile.read(int(self.headers.get("Content-Length") or 0))
+        m = CALLS_RE.match(self.path)
+        if not m:
+            return self._reply(404, {"code": 20404, "message": "not found", "status": 404})
+        if not (self.headers.get("Authorization") or "").startswith("Basic "):
+            return self._reply(401, {"code": 20003, "message": "Authenticate", "status": 401})
+        delay = max(0.0, random.gauss(self.cfg.latency_ms, self.cfg.jitter_ms)) / 1000
+        time.sleep(delay)
+        if not self.limiter.allow():
+            self._count("throttled")
+            return self._reply(429, {"code": 20429, "message": "Too Many Requests", "status": 429})
+        if random.random() < self.cfg.error_rate:
+            self._count("errors")
+            return self._reply(500, {"code": 20500, "message": "Internal Server Error", "status": 500})
+        form = dict(p.split("=", 1) for p in body.decode().split("&") if "=" in p)
+        self._count("created")
+        self._reply(201, {
+            "sid": "CA" + uuid.uuid4().hex, "account_sid": m.group(1), "status": "queued",
+            "to": form.get("To", ""), "from": form.get("From", ""),
+            "date_created": time.strftime("%a, %d %b %Y %H:%M:%S +0000", time.gmtime()),
+        })
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--host", default="127.0.0.1")
+    ap.add_argument("--port", type=int, default=8085)
+    ap.add_argument("--latency-ms", type=float, default=100.0, help="mean response time")
+    ap.add_argument("--jitter-ms", type=float, default=30.0, help="response time std-dev")
+    ap.add_argument("--cps", type=float, default=0.0, help="calls/s limit (0 = unlimited)")
+    ap.add_argument("--error-rate", type=float, default=0.0, help="fraction of 500s")
+    ap.add_argument("--verbose", action="store_true")
+    args = ap.parse_args()
+    Handler.cfg = args
+    Handler.limiter = Limiter(args.cps)
+    server = ThreadingHTTPServer((args.host, args.port), Handler)
+    server.daemon_threads = True
+    print(f"fake Twilio API on http://{args.host}:{args.port} (latency {args.latency_ms}±{args.jitter_ms} ms, "
+          f"cps {args.cps or 'unlimited'}, errors {args.error_rate:.0%})")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    print(f"stats: {Handler.stats}")
+
+if __name__ == "__main__":
+    main()
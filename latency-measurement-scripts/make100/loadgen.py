@@ -0,0 +1,230 @@
+#!/usr/bin/env python3
+# loadgen.py
+"""
+Open-loop call load generator for the Twilio → SIP → LiveKit agent path.
+
+Calls are placed on a precomputed arrival schedule that does not wait for
+earlier calls to finish (open loop), so a slow API or agent shows up as
+latency instead of silently lowering the offered rate. Requests run on a
+thread pool (--max-inflight), each thread reusing one keep-alive session. Every
+call's placement latency is timed from its *scheduled* time, so queueing in
+the generator is counted rather than hidden.
+
+Profiles (--profile), rates in calls/s:
+    constant   --rate for the whole --duration
+    ramp       linear from --start-rate to --rate
+    step       --steps equal steps up to --rate
+    spike      --rate, with --spike-mult x --rate for --spike-len s at --spike-at s
+Arrivals (--arrivals): poisson (exponential gaps, thinned to the profile) or
+uniform (evenly spaced).
+
+    python loadgen.py --profile ramp --start-rate 0.5 --rate 5 --duration 60
+    python fake_twilio.py &  python loadgen.py --api-base http://127.0.0.1:8085 --rate 200 --duration 10
+"""
+import os
+import csv
+import time
+import math
+import random
+import asyncio
+import argparse
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Optional
+
+import requests
+from requests.adapters import HTTPAdapter
+
+API_BASE    = os.getenv("TWILIO_API_BASE", "https://api.twilio.com")
+ACCOUNT_SID = os.getenv("TWILIO_ACCOUNT_SID", "")
+AUTH_TOKEN  = os.getenv("TWILIO_AUTH_TOKEN", "")
+FROM        = os.getenv("TWILIO_FROM", "")
+TWIML_URL   = os.getenv("TWIML_URL", "")
+SIP_URI     = os.getenv("SIP_URI", "")
+CALL_TIMEOUT_S = int(os.getenv("CALL_TIMEOUT_S", "120"))
+
+
+# -------------------------
+# Arrival schedule
+# -------------------------
+def rate_fn(args) -> Callable[[float], float]:
+    """Offered rate (calls/s) at t seconds into the run."""
+    r, d = args.rate, args.duration
+    if args.profile == "constant":
+        return lambda t: r
+    if args.profile == "ramp":
+        return lambda t: args.start_rate + (r - args.start_rate) * min(1.0, t / d)
+    if args.profile == "step":
+        seg = d / args.steps
+        return lambda t: r * (min(args.steps - 1, int(t // seg)) + 1) / args.steps
+    if args.profile == "spike":
+        return lambda t: r * (args.spike_mult if args.spike_at <= t < args.spike_at + args.spike_len else 1.0)
+    raise ValueError(f"unknown profile: {args.profile}")
+
+def schedule(rate: Callable[[float], float], duration: float, arrivals: str, seed: Optional[int] = None) -> list[float]:
+    """Arrival offsets (s) in [0, duration)."""
+    rng = random.Random(seed)
+    out = []
+    if arrivals == "poisson":
+        # thinning: a homogeneous process at the peak rate, each point kept with p = rate(t) / peak
+        peak = max(rate(i * duration / 1000) for i in range(1001))
+        t = 0.0
+        while peak > 0:
+            t += rng.expovariate(peak)
+            if t >= duration:
+                break
+            if rng.random() * peak < rate(t):
+                out.append(t)
+    else:
+        # uniform: one call each time the integrated rate crosses an integer
+        dt, t, acc = 0.001, 0.0, 0.0
+        while t < duration:
+            acc += rate(t) * dt
+            if acc >= 1.0:
+                acc -= 1.0
+                out.append(t)
+            t += dt
+    return out
+
+
+# -------------------------
+# Dispatch
+# -------------------------
+class Placer:
+    """POSTs to {api_base}/2010-04-01/Accounts/{sid}/Calls.json on a pooled session."""
+    def __init__(self, api_base: str, account_sid: str, token: str, timeout_s: float):
+        self.url = f"{api_base.rstrip('/')}/2010-04-01/Accounts/{account_sid}/Calls.json"
+        self.timeout_s = timeout_s
+        self._local = threading.local()
+        self._auth = (account_sid, token)
+
+    def _session(self) -> requests.Session:
+        s = getattr(self._local, "session", None)
+        if s is None:
+            s = requests.Session()
+            s.auth = self._auth
+            s.mount("http://", HTTPAdapter(pool_connections=1, pool_maxsize=1))
+            s.mount("https://", HTTPAdapter(pool_connections=1, pool_maxsize=1))
+            self._local.session = s
+        return s
+
+    def place(self, to: str, from_: str, url: str) -> tuple[int, str]:
+        """→ (HTTP status, call sid or error text). Raises on transport errors."""
+        r = self._session().post(self.url, data={"To": to, "From": from_, "Url": url,
+                                                 "Timeout": str(CALL_TIMEOUT_S)}, timeout=self.timeout_s)
+        if r.status_code in (200, 201):
+            return r.status_code, r.json().get("sid", "")
+        return r.status_code, r.text[:200]
+
+
+async def run(args) -> list[dict]:
+    offsets = schedule(rate_fn(args), args.duration, args.arrivals, args.seed)
+    placer = Placer(args.api_base, args.account_sid, args.auth_token, args.http_timeout)
+    pool = ThreadPoolExecutor(max_workers=args.max_inflight, thread_name_prefix="place")
+    loop = asyncio.get_running_loop()
+    results: list[dict] = []
+    pending = set()
+
+    def _place(i: int, due: float) -> dict:
+        started = time.perf_counter()
+        row = {"n": i, "due_s": round(due - t0, 4), "queue_ms": (started - due) * 1000}
+        try:
+            status, info = placer.place(args.to, args.from_, args.url)
+            row.update(status=status, ok=status in (200, 201), sid=info if status in (200, 201) else "",
+                       error="" if status in (200, 201) else info)
+        except (requests.RequestException, ValueError) as e:
+            row.update(status=0, ok=False, sid="", error=type(e).__name__)
+        done = time.perf_counter()
+        row["service_ms"] = (done - started) * 1000
+        row["latency_ms"] = (done - due) * 1000       # from the scheduled time: includes queueing
+        return row
+
+    print(f"{len(offsets)} calls over {args.duration:.0f}s ({args.profile}, {args.arrivals}) → {placer.url}")
+    t0 = time.perf_counter()
+    next_report = 1.0
+    for i, off in enumerate(offsets):
+        due = t0 + off
+        delay = due - time.perf_counter()
+        if delay > 0:
+            await asyncio.sleep(delay)
+        fut = loop.run_in_executor(pool, _place, i, due)
+        pending.add(fut)
+        fut.add_done_callback(lambda f: (pending.discard(f), results.append(f.result())))
+        if off >= next_report:
+            ok = sum(r["ok"] for r in results)
+            print(f"  t={off:6.1f}s sent={i + 1} done={len(results)} ok={ok} inflight={len(pending)}")
+            next_report += args.report_every
+    if pending:
+        await asyncio.gather(*pending)
+    pool.shutdown()
+    return sorted(results, key=lambda r: r["n"])
+
+
+# -------------------------
+# Report
+# -------------------------
+def pct(values: list[float], q: float) -> Optional[float]:
+    if not values:
+        return None
+    s = sorted(values)
+    return s[min(len(s) - 1, max(0, math.ceil(q * len(s)) - 1))]
+
+def report(results: list[dict], duration: float):
+    ok = [r for r in results if r["ok"]]
+    print(f"\nplaced {len(results)} calls, {len(ok)} ok, {len(results) - len(ok)} failed "
+          f"({len(results) / duration:.2f} calls/s offered)")
+    for name in ("latency_ms", "service_ms", "queue_ms"):
+        v = [r[name] for r in results]
+        print(f"  {name:<11} p50={pct(v, .5) or 0:8.1f}  p95={pct(v, .95) or 0:8.1f}  "
+              f"p99={pct(v, .99) or 0:8.1f}  max={max(v, default=0):8.1f}")
+    errors: dict[str, int] = {}
+    for r in results:
+        if not r["ok"]:
+            key = f"{r['status']} {r['error'][:60]}"
+            errors[key] = errors.get(key, 0) + 1
+    for k, n in sorted(errors.items(), key=lambda kv: -kv[1]):
+        print(f"  error x{n}: {k}")
+
+def write_csv(path: str, results: list[dict]):
+    fields = ["n", "due_s", "status", "ok", "sid", "queue_ms", "service_ms", "latency_ms", "error"]
+    with open(path, "w", newline="") as f:
+        w = csv.DictWriter(f, fieldnames=fields)
+        w.writeheader()
+        for r in results:
+            w.writerow({k: round(r[k], 3) if isinstance(r[k], float) else r[k] for k in fields})
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--rate", type=float, default=1.0, help="target calls/s (peak for ramp/step)")
+    ap.add_argument("--duration", type=float, default=60.0, help="seconds")
+    ap.add_argument("--profile", choices=["constant", "ramp", "step", "spike"], default="constant")
+    ap.add_argument("--arrivals", choices=["poisson", "uniform"], default="poisson")
+    ap.add_argument("--start-rate", type=float, default=0.0, help="ramp: initial calls/s")
+    ap.add_argument("--steps", type=int, default=4, help="step: number of steps")
+    ap.add_argument("--spike-at", type=float, default=30.0, help="spike: start (s)")
+    ap.add_argument("--spike-len", type=float, default=5.0, help="spike: length (s)")
+    ap.add_argument("--spike-mult", type=float, default=5.0, help="spike: rate multiplier")
+    ap.add_argument("--max-inflight", type=int, default=64, help="concurrent API requests (pool size)")
+    ap.add_argument("--http-timeout", type=float, default=15.0)
+    ap.add_argument("--seed", type=int, default=None)
+    ap.add_argument("--report-every", type=float, default=5.0, help="progress line period (s)")
+    ap.add_argument("--api-base", default=API_BASE, help="Twilio REST base URL (or a fake_twilio.py address)")
+    ap.add_argument("--account-sid", default=ACCOUNT_SID)
+    ap.add_argument("--auth-token", default=AUTH_TOKEN)
+    ap.add_argument("--to", default=SIP_URI)
+    ap.add_argument("--from", dest="from_", default=FROM)
+    ap.add_argument("--url", default=TWIML_URL, help="TwiML URL")
+    ap.add_argument("--out", default="", help="per-call CSV")
+    args = ap.parse_args()
+    if not args.account_sid:
+        ap.error("--account-sid / TWILIO_ACCOUNT_SID is required")
+
+    results = asyncio.run(run(args))
+    report(results, args.duration)
+    if args.out:
+        write_csv(args.out, results)
+        print(f"wrote {args.out}")
+
+if __name__ == "__main__":
+    main()
@@ -11,8 +11,10 @@ SIP_URI    = "sip:+17622145814@28p3mcfarjq.sip.livekit.cloud;transport=tls"
 client = Client(ACCOUNT_SID, AUTH_TOKEN)
 
 async def place(n):
-    call = client.calls.create(
-        to=SIP_URI, from_=FROM, url=TWIML_URL, timeout=120
+    # calls.create blocks; run it in a thread so the batch really goes out concurrently
+    # (for rate-controlled / open-loop runs use loadgen.py)
+    call = await asyncio.to_thread(
+        client.calls.create, to=SIP_URI, from_=FROM, url=TWIML_URL, timeout=120
     )
     print(f"[{n}] {call.sid}")
 
@@ -0,0 +1,75 @@
+#!/usr/bin/env python3
+# latency-measurement-scripts/measure/bench_codec.py
+"""
+Per-frame cost of the inbound audio path at many concurrent streams: base64
+decode + μ-law LUT decode + windowed RMS/onset detection for one 20 ms Twilio
+payload per stream, i.e. one real-time tick. A tick must finish well inside
+20 ms for the meter to keep up.
+
+    python bench_codec.py --streams 1000 5000 10000
+"""
+import time
+import base64
+import argparse
+
+import numpy as np
+
+import codec
+
+
+def make_payloads(n: int, seed: int = 0) -> list[str]:
+    """n distinct base64 μ-law payloads of 160 bytes (noise at speech-ish levels)."""
+    rng = np.random.default_rng(seed)
+    raw = rng.integers(0, 256, size=(n, codec.FRAME), dtype=np.uint8)
+    return [base64.b64encode(r.tobytes()).decode() for r in raw]
+
+def legacy_rms(b: bytes) -> float:
+    """The old path: payload read as PCM16 (wrong for μ-law)."""
+    arr = np.frombuffer(b, dtype="<i2")
+    return float(np.sqrt(np.mean((arr / 32768.0) ** 2)))
+
+def bench(streams: int, ticks: int) -> dict:
+    payloads = make_payloads(streams)
+    detectors = [codec.OnsetDetector() for _ in range(streams)]
+    decoded = [base64.b64decode(p) for p in payloads]
+
+    t0 = time.perf_counter()
+    for _ in range(ticks):
+        for d, p in zip(detectors, payloads):
+            d.feed(base64.b64decode(p))
+    full = (time.perf_counter() - t0) / ticks
+
+    t0 = time.perf_counter()
+    for _ in range(ticks):
+        for b in decoded:
+            codec.frame_rms(codec.decode(b))
+    decode_rms = (time.perf_counter() - t0) / ticks
+
+    t0 = time.perf_counter()
+    for _ in range(ticks):
+        for b in decoded:
+            legacy_rms(b)
+    legacy = (time.perf_counter() - t0) / ticks
+
+    return {
+        "streams": streams,
+        "tick_ms": full * 1000,
+        "per_frame_us": full / streams * 1e6,
+        "decode_rms_us": decode_rms / streams * 1e6,
+        "legacy_us": legacy / streams * 1e6,
+        "core_pct": full / (codec.FRAME_MS / 1000) * 100,
+    }
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--streams", type=int, nargs="+", default=[1000, 5000, 10000])
+    ap.add_argument("--ticks", type=int, default=20)
+    args = ap.parse_args()
+    print(f"{'streams':>8} {'tick ms':>9} {'us/frame':>9} {'decode+rms':>11} {'old pcm16':>10} {'1 core':>8}")
+    for n in args.streams:
+        r = bench(n, args.ticks)
+        print(f"{r['streams']:>8} {r['tick_ms']:>9.2f} {r['per_frame_us']:>9.2f} {r['decode_rms_us']:>11.2f} "
+              f"{r['legacy_us']:>10.2f} {r['core_pct']:>7.1f}%")
+
+if __name__ == "__main__":
+    main()
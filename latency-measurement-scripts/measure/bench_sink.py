@@ -0,0 +1,86 @@
+#!/usr/bin/env python3
+# latency-measurement-scripts/measure/bench_sink.py
+"""
+Event-loop impact of writing results: a 20 ms media ticker (the cadence of
+Twilio frames) runs while bursts of results are written, and its lateness is
+reported. "sync" is the old per-row open/append/close on the loop; the other
+modes go through sink.ResultSink.
+
+    python bench_sink.py --calls 100 --bursts 20 --formats sync csv parquet
+"""
+import os
+import time
+import asyncio
+import argparse
+import tempfile
+
+import sink
+import turns
+import sketch
+
+
+def row(i: int) -> dict:
+    return {"streamSid": f"MZ{i:032x}", "encoding": "audio/x-mulaw", "turn": i % 7 + 1,
+            "rtt_local_ms": 700.0 + i % 97, "rtt_ts_ms": 690.0 + i % 89, "gap_ms": 450.0 + i % 61,
+            "agent_ms": 2400.0, "barge_in": 0, "barge_stop_ms": None, "answered": 1,
+            "in_ts_ms": 1000.0 + i, "out_ts_ms": 1700.0 + i, "onset_ago_ms": 60.0, "ts": int(time.time() * 1000)}
+
+def write_sync(path: str, r: dict):
+    """The previous write_csv_row: exists check + open/append/close per result."""
+    if not os.path.exists(path):
+        with open(path, "a", encoding="utf-8") as f:
+            f.write(",".join(turns.TURN_FIELDS) + "\n")
+    with open(path, "a", encoding="utf-8") as f:
+        f.write(",".join("" if r.get(k) is None else str(r[k]) for k in turns.TURN_FIELDS) + "\n")
+
+async def ticker(lag: sketch.LatencyHistogram, stop: asyncio.Event, period: float = 0.02):
+    nxt = time.perf_counter() + period
+    while not stop.is_set():
+        await asyncio.sleep(max(0.0, nxt - time.perf_counter()))
+        lag.record((time.perf_counter() - nxt) * 1000)
+        nxt += period
+
+async def run(mode: str, calls: int, bursts: int, directory: str) -> dict:
+    ext = {"sync": ".csv", "csv": ".csv", "parquet": ".parquet", "arrow": ".arrow"}[mode]
+    path = os.path.join(directory, f"results_{mode}{ext}")
+    lag, stop = sketch.LatencyHistogram(), asyncio.Event()
+    t = asyncio.create_task(ticker(lag, stop))
+    s = None
+    if mode != "sync":
+        s = sink.ResultSink(path, turns.TURN_FIELDS)
+        s.start()
+    await asyncio.sleep(0.1)
+    n = 0
+    for _ in range(bursts):
+        for _ in range(calls):        # a burst of calls all finishing their first turn together
+            if s:
+                s.put(row(n))
+            else:
+                write_sync(path, row(n))
+            n += 1
+        await asyncio.sleep(0.05)
+    if s:
+        await s.close()
+    stop.set()
+    await t
+    return {"mode": mode, "rows": n, "lag": lag.to_dict((0.5, 0.99)), "stats": s.stats if s else None}
+
+async def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--calls", type=int, default=100)
+    ap.add_argument("--bursts", type=int, default=20)
+    ap.add_argument("--formats", nargs="+", default=["sync", "csv", "parquet", "arrow"])
+    args = ap.parse_args()
+    with tempfile.TemporaryDirectory() as d:
+        print(f"{'mode':>8} {'rows':>6} {'tick lag p50':>13} {'p99':>8} {'max':>8}")
+        for mode in args.formats:
+            try:
+                r = await run(mode, args.calls, args.bursts, d)
+            except RuntimeError as e:      # pyarrow missing
+                print(f"{mode:>8}  skipped: {e}")
+                continue
+            lag = r["lag"]
+            print(f"{mode:>8} {r['rows']:>6} {lag['p50']:>11} ms {lag['p99']:>5} ms {lag['max']:>5} ms")
+
+if __name__ == "__main__":
+    asyncio.run(main())
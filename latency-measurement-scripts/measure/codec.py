@@ -0,0 +1,165 @@
+# latency-measurement-scripts/measure/codec.py
+"""
+Twilio Media Streams audio: G.711 decoding and speech-onset detection.
+
+Twilio sends 8 kHz mono μ-law (audio/x-mulaw), base64 in `media.payload`,
+normally 160 bytes = 20 ms per message. Decoding goes through a 256-entry
+lookup table (one NumPy fancy-index per payload, no per-sample Python), straight
+to float32 in [-1, 1).
+
+OnsetDetector replaces the old "RMS of one packet > ENERGY_THRESH" test:
+  - RMS over a sliding window of ONSET_WINDOW_MS, updated per 20 ms frame;
+  - an adaptive noise floor that follows quiet frames (fast down, slow up);
+  - onset when the window RMS is ONSET_MARGIN_DB above the floor (and above
+    ENERGY_THRESH) for ONSET_ATTACK_MS in a row;
+  - hangover: speech is considered to continue for ONSET_HANGOVER_MS after
+    the level drops, so short dips do not split a phrase.
+
+events() reports both edges (START/END), back-dated to where they happened in
+the audio; feed() is the onset-only shorthand.
+"""
+import os
+import math
+from typing import Optional
+
+import numpy as np
+
+SAMPLE_RATE       = 8000
+FRAME_MS          = 20
+FRAME             = SAMPLE_RATE * FRAME_MS // 1000      # samples per analysis frame
+
+ENERGY_THRESH     = float(os.getenv("ENERGY_THRESH", "0.02"))    # absolute RMS floor for "speech"
+ONSET_WINDOW_MS   = int(os.getenv("ONSET_WINDOW_MS", "60"))
+ONSET_MARGIN_DB   = float(os.getenv("ONSET_MARGIN_DB", "9"))
+ONSET_ATTACK_MS   = int(os.getenv("ONSET_ATTACK_MS", "40"))
+ONSET_HANGOVER_MS = int(os.getenv("ONSET_HANGOVER_MS", "200"))
+
+START, END = 1, -1
+
+
+# -------------------------
+# G.711 tables
+# -------------------------
+def _ulaw_to_linear(u: int) -> int:
+    u = ~u & 0xFF
+    t = (((u & 0x0F) << 3) + 0x84) << ((u & 0x70) >> 4)
+    return (0x84 - t) if u & 0x80 else (t - 0x84)
+
+def _alaw_to_linear(a: int) -> int:
+    a ^= 0x55
+    seg = (a & 0x70) >> 4
+    t = (a & 0x0F) << 4
+    t = t + 8 if seg == 0 else (t + 0x108) << (seg - 1)
+    return t if a & 0x80 else -t
+
+ULAW_PCM16 = np.array([_ulaw_to_linear(i) for i in range(256)], dtype=np.int16)
+ALAW_PCM16 = np.array([_alaw_to_linear(i) for i in range(256)], dtype=np.int16)
+ULAW_F32 = (ULAW_PCM16 / 32768.0).astype(np.float32)
+ALAW_F32 = (ALAW_PCM16 / 32768.0).astype(np.float32)
+
+_TABLES = {"audio/x-mulaw": ULAW_F32, "audio/x-alaw": ALAW_F32}
+
+
+def decode(payload: bytes, encoding: str = "audio/x-mulaw") -> np.ndarray:
+    """Twilio payload → float32 samples in [-1, 1). audio/l16 is big-endian PCM16."""
+    table = _TABLES.get(encoding)
+    if table is not None:
+        return table[np.frombuffer(payload, dtype=np.uint8)]
+    if encoding == "audio/l16":
+        return np.frombuffer(payload, dtype=">i2").astype(np.float32) / 32768.0
+    raise ValueError(f"unsupported media encoding: {encoding}")
+
+
+def frame_rms(samples: np.ndarray, frame: int = FRAME) -> np.ndarray:
+    """RMS of each complete `frame`-sample block (the remainder is ignored)."""
+    n = samples.size // frame
+    if n == 0:
+        return np.empty(0, dtype=np.float32)
+    blocks = samples[: n * frame].reshape(n, frame)
+    return np.sqrt(np.einsum("ij,ij->i", blocks, blocks) / frame)
+
+
+# -------------------------
+# Onset detection
+# -------------------------
+class OnsetDetector:
+    __slots__ = ("encoding", "floor", "speaking", "_pending", "_energy", "_sum", "_pos", "_run", "_hang",
+                 "_margin", "_attack", "_hangover", "frames")
+
+    def __init__(self, encoding: str = "audio/x-mulaw", attack_ms: int = ONSET_ATTACK_MS,
+                 hangover_ms: int = ONSET_HANGOVER_MS):
+        self.encoding = encoding
+        self.floor = ENERGY_THRESH / 4          # adaptive noise floor (RMS)
+        self.speaking = False
+        self.frames = 0
+        self._pending = np.empty(0, dtype=np.float32)   # samples short of a full frame
+        self._energy = [0.0] * max(1, ONSET_WINDOW_MS // FRAME_MS)   # per-frame mean square, ring
+        self._sum = 0.0
+        self._pos = 0
+        self._run = 0
+        self._hang = 0
+        self._margin = 10 ** (ONSET_MARGIN_DB / 20)
+        self._attack = max(1, attack_ms // FRAME_MS)
+        self._hangover = max(0, hangover_ms // FRAME_MS)
+
+    def feed(self, payload: bytes) -> Optional[float]:
+        """
+        Processes one media payload. On a speech onset returns how many ms
+        before the end of this payload the speech began (the attack run can
+        start in an earlier payload), else None.
+        """
+        for kind, ago in self.events(payload):
+            if kind == START:
+                return ago
+        return None
+
+    def events(self, payload: bytes) -> list[tuple[int, float]]:
+        """
+        Processes one media payload; returns (START|END, ms before the end of
+        this payload) for each edge. START is dated to the first frame of the
+        attack run, END to where the level actually dropped.
+        """
+        samples = decode(payload, self.encoding)
+        if self._pending.size:
+            samples = np.concatenate((self._pending, samples))
+        n = samples.size // FRAME
+        self._pending = samples[n * FRAME:]
+        if n == 0:
+            return []
+        out = []
+        tail_ms = self._pending.size * 1000 / SAMPLE_RATE
+        for i, ms in enumerate((frame_rms(samples[: n * FRAME]) ** 2).tolist()):
+            edge = self._step(ms)
+            if edge == START:
+                out.append((START, (n - i + self._attack - 1) * FRAME_MS + tail_ms))
+            elif edge == END:
+                # the sliding window keeps the level up for len(_energy) - 1 frames after the speech stops
+                out.append((END, (n - i + self._hangover + len(self._energy) - 1) * FRAME_MS + tail_ms))
+        return out
+
+    def _step(self, mean_square: float) -> int:
+        """One 20 ms frame; START/END on the frame where an edge is detected, else 0."""
+        self.frames += 1
+        self._sum += mean_square - self._energy[self._pos]
+        self._energy[self._pos] = mean_square
+        self._pos = (self._pos + 1) % len(self._energy)
+        rms = math.sqrt(max(0.0, self._sum) / len(self._energy))
+        loud = rms > ENERGY_THRESH and rms > self.floor * self._margin
+        if not loud and not self.speaking:
+            # track the noise floor: follow drops quickly, rises slowly
+            self.floor += (0.5 if rms < self.floor else 0.02) * (rms - self.floor)
+        if loud:
+            self._run += 1
+            self._hang = self._hangover
+            if not self.speaking and self._run >= self._attack:
+                self.speaking = True
+                return START
+        else:
+            self._run = 0
+            if self.speaking:
+                if self._hang > 0:
+                    self._hang -= 1
+                else:
+                    self.speaking = False
+                    return END
+        return 0
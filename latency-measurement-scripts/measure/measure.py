@@ -1,29 +1,47 @@
 #!/usr/bin/env python3
+import argparse
 import asyncio
 import base64
+import http
 import json
 import logging
 import os
 import signal
 import sys
 import time
-from collections import defaultdict, deque
-from typing import Deque, Dict, Optional, Tuple
+from typing import Dict, Optional
 
-import numpy as np
 import websockets
 from websockets.server import WebSocketServerProtocol
 
+try:
+    import orjson                # ~3-5x faster than json on the per-frame media messages
+    loads = orjson.loads
+except ImportError:
+    loads = json.loads
+
+import codec
+import sink
+import turns
+import sketch
+import workers
+import recording
+
 # -------------------------
 # Config (env overrides)
 # -------------------------
 HOST = os.getenv("HOST", "0.0.0.0")
 PORT = int(os.getenv("PORT", "8082"))
 WS_PATH = os.getenv("WS_PATH", "/stream")  # Twilio will connect to wss://host/stream
+METRICS_PATH = os.getenv("METRICS_PATH", "/metrics")  # plain HTTP on the same port: /metrics, /metrics.json
 LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO").upper()
-ENERGY_THRESH = float(os.getenv("ENERGY_THRESH", "0.02"))   # RMS threshold for "user started speaking"
 PRINT_EVERY = int(os.getenv("PRINT_EVERY", "20"))           # print agg stats every N results
-CSV_PATH = os.getenv("CSV_PATH", "")                        # optional: write results to CSV file
+CSV_PATH = os.getenv("CSV_PATH", "")                        # optional: per-turn results (.csv, .parquet, .arrow; see sink.py)
+CALLS_PATH = os.getenv("CALLS_PATH", "")                    # per-call aggregates; default <CSV_PATH stem>.calls<ext>
+AGENT_HANGOVER_MS = int(os.getenv("AGENT_HANGOVER_MS", "700"))  # agent audio gap that still counts as one reply
+WORKERS = int(os.getenv("WORKERS", "1"))                    # processes sharing PORT (SO_REUSEPORT); --workers
+LAG_PROBE_MS = float(os.getenv("LAG_PROBE_MS", "50"))       # event-loop lag sampling period
+RECORD_DIR = os.getenv("RECORD_DIR", "")                    # save every stream as <dir>/<streamSid>.twrec (replay.py); --record
 
 logging.basicConfig(
     level=getattr(logging, LOG_LEVEL, logging.INFO),
@@ -35,35 +53,106 @@ log = logging.getLogger("measure")
 # State & helpers
 # -------------------------
 class CallState:
-    __slots__ = ("t_in_local", "t_in_ts", "done")
-    def __init__(self) -> None:
-        self.t_in_local: Optional[float] = None  # time.perf_counter() when inbound voice onset detected
-        self.t_in_ts: Optional[float] = None     # Twilio-provided timestamp (ms) at inbound onset
-        self.done: bool = False                  # set True after first outbound audio detected
-
-STATE: Dict[str, CallState] = defaultdict(CallState)
-
-LAT_MS_LOCAL: Deque[float] = deque(maxlen=10000)  # local RTTs
-LAT_MS_TS: Deque[float] = deque(maxlen=10000)     # RTTs via Twilio timestamps
-CSV_HEADER_WRITTEN = False
-
-def rms_from_pcm16le(b: bytes) -> float:
-    """Compute RMS for 16-bit little-endian PCM mono samples."""
-    if not b:
-        return 0.0
-    arr = np.frombuffer(b, dtype="<i2")
-    if arr.size == 0:
-        return 0.0
-    return float(np.sqrt(np.mean((arr / 32768.0) ** 2)))
-
-def p50_p95(values) -> Tuple[Optional[float], Optional[float]]:
-    if not values:
-        return None, None
-    s = sorted(values)
-    n = len(s)
-    p50 = s[int(0.50 * (n - 1))]
-    p95 = s[int(0.95 * (n - 1))]
-    return p50, p95
+    __slots__ = ("encoding", "inbound", "outbound", "timeline")
+    def __init__(self, sid: str, encoding: str = "audio/x-mulaw") -> None:
+        self.encoding = encoding                 # start.mediaFormat.encoding
+        self.inbound = codec.OnsetDetector(encoding)     # caller speech
+        # agent audio: TTS starts cleanly, but sentences are separated by ~0.5 s of silence
+        self.outbound = codec.OnsetDetector(encoding, attack_ms=codec.FRAME_MS, hangover_ms=AGENT_HANGOVER_MS)
+        self.timeline = turns.CallTimeline(sid, encoding)
+
+STATE: Dict[str, CallState] = {}
+
+# Aggregates over every turn of every call (sketch.WindowedHistogram: 1m / 5m / all)
+SERIES = {
+    "local":      sketch.WindowedHistogram(),  # RTT, local clock
+    "ts":         sketch.WindowedHistogram(),  # RTT, Twilio timestamps
+    "first_turn": sketch.WindowedHistogram(),  # RTT of each call's first answered turn
+    "later_turn": sketch.WindowedHistogram(),  # RTT of the turns after it
+    "gap":        sketch.WindowedHistogram(),  # caller speech end → agent audio
+    "barge_stop": sketch.WindowedHistogram(),  # barge-in → agent audio stops
+}
+LOOP_LAG = sketch.WindowedHistogram()  # how late this process's event loop runs (measurement error floor)
+TOTALS = {"calls": 0, "turns": 0, "answered": 0, "barge_ins": 0, "media_msgs": 0}
+STARTED_AT = time.time()
+WORKER: Optional[int] = None  # worker index in --workers mode
+SINK: Optional[sink.ResultSink] = None       # per-turn records; set in main() when CSV_PATH is given
+CALL_SINK: Optional[sink.ResultSink] = None  # per-call aggregates
+
+def payload_ms(payload: bytes, encoding: str) -> float:
+    """Duration of a media payload: 1 byte/sample for G.711, 2 for L16."""
+    per_sample = 2 if encoding == "audio/l16" else 1
+    return len(payload) / per_sample * 1000 / codec.SAMPLE_RATE
+
+def with_suffix(path: str, suffix: str) -> str:
+    """results.csv, "calls" → results.calls.csv"""
+    root, ext = os.path.splitext(path)
+    return f"{root}.{suffix}{ext}"
+
+def snapshot() -> dict:
+    """This process's mergeable metrics state (published to peers in --workers mode)."""
+    return {
+        "worker": WORKER,
+        "pid": os.getpid(),
+        "active_streams": len(STATE),
+        "totals": dict(TOTALS),
+        "series": {name: wh.state() for name, wh in SERIES.items()},
+        "loop_lag": LOOP_LAG.state(),
+        "sink": SINK.stats if SINK else None,
+    }
+
+async def gather_snapshots() -> list:
+    snaps = [snapshot()]
+    if WORKER is not None:
+        snaps += await asyncio.to_thread(workers.read_peers, PORT, WORKER)
+    return snaps
+
+def metrics_json(snaps: list) -> dict:
+    series = sketch.merge_views(s["series"] for s in snaps)
+    lag = sketch.merge_views({"lag": s["loop_lag"]} for s in snaps).get("lag", {})
+    totals: Dict[str, int] = {}
+    for s in snaps:
+        for k, v in s["totals"].items():
+            totals[k] = totals.get(k, 0) + v
+    return {
+        "uptime_s": round(time.time() - STARTED_AT, 1),
+        "workers": len(snaps),
+        "active_streams": sum(s["active_streams"] for s in snaps),
+        **totals,
+        "rtt_ms": {name: {w: h.to_dict() for w, h in views.items()} for name, views in series.items()},
+        "loop_lag_ms": {w: h.to_dict() for w, h in lag.items()},
+        # raw bucket counts, so snapshots from several meters can be merged (sketch.merge_views)
+        "state": {name: {w: h.state() for w, h in views.items()} for name, views in series.items()},
+        "per_worker": [{"worker": s["worker"], "pid": s["pid"], "active_streams": s["active_streams"],
+                        "loop_lag_p99_ms": sketch.LatencyHistogram.from_state(s["loop_lag"]["1m"]).quantile(0.99),
+                        "sink": s["sink"]} for s in snaps],
+    }
+
+def metrics_text(snaps: list) -> str:
+    series = sketch.merge_views(s["series"] for s in snaps)
+    lag = sketch.merge_views({"event_loop": s["loop_lag"]} for s in snaps)
+    return (sketch.prometheus(series)
+            + sketch.prometheus(lag, "measure_loop_lag_ms", "How late the meter's event loop ran (ms); adds to measured RTTs."))
+
+async def monitor_loop_lag() -> None:
+    """Samples how late a timer fires: everything measured on this loop is that much late too."""
+    period = LAG_PROBE_MS / 1000.0
+    loop = asyncio.get_running_loop()
+    while True:
+        expected = loop.time() + period
+        await asyncio.sleep(period)
+        LOOP_LAG.record(max(0.0, (loop.time() - expected) * 1000.0))
+
+async def publish_snapshots() -> None:
+    while True:
+        await asyncio.sleep(workers.SHARD_PUBLISH_S)
+        try:
+            await asyncio.to_thread(workers.publish, PORT, WORKER, snapshot())
+        except OSError as e:
+            log.warning("Could not publish worker snapshot: %s", e)
+
+def fmt_ms(v: Optional[float]) -> str:
+    return "n/a" if v is None else f"{v:.1f}"
 
 def to_float_or_none(x) -> Optional[float]:
     if x is None:
@@ -73,36 +162,71 @@ def to_float_or_none(x) -> Optional[float]:
     except (TypeError, ValueError):
         return None
 
-async def write_csv_row(sid: str, rtt_local_ms: float, rtt_ts_ms: Optional[float]) -> None:
-    global CSV_HEADER_WRITTEN
-    if not CSV_PATH:
-        return
-    line = None
-    if not CSV_HEADER_WRITTEN and not os.path.exists(CSV_PATH):
-        header = "streamSid,rtt_local_ms,rtt_ts_ms,ts\n"
-        with open(CSV_PATH, "a", encoding="utf-8") as f:
-            f.write(header)
-        CSV_HEADER_WRITTEN = True
-    ts = int(time.time() * 1000)
-    line = f"{sid},{rtt_local_ms:.3f},{'' if rtt_ts_ms is None else f'{rtt_ts_ms:.3f}'},{ts}\n"
-    try:
-        with open(CSV_PATH, "a", encoding="utf-8") as f:
-            f.write(line)
-    except Exception as e:
-        log.warning("CSV write failed: %s", e)
-
 # -------------------------
 # WebSocket handler
 # -------------------------
+def record_turn(t: dict) -> None:
+    TOTALS["turns"] += 1
+    if t["answered"]:
+        TOTALS["answered"] += 1
+        rtt_local, rtt_ts = t["rtt_local_ms"], t["rtt_ts_ms"]
+        SERIES["local"].record(rtt_local)
+        if rtt_ts is not None:
+            SERIES["ts"].record(rtt_ts)
+        rtt = rtt_local if rtt_ts is None else rtt_ts
+        SERIES["first_turn" if t["first"] else "later_turn"].record(rtt)
+        if t["gap_ms"] is not None:
+            SERIES["gap"].record(max(0.0, t["gap_ms"]))
+        log.info(
+            "%s turn %d RTT local=%.1f ms ts=%s ms gap=%s ms%s",
+            t["streamSid"], t["turn"], rtt_local, fmt_ms(rtt_ts), fmt_ms(t["gap_ms"]),
+            " (barge-in)" if t["barge_in"] else "",
+        )
+    if t["barge_in"]:
+        TOTALS["barge_ins"] += 1
+        if t["barge_stop_ms"] is not None:
+            SERIES["barge_stop"].record(t["barge_stop_ms"])
+            log.info("%s turn %d barge-in: agent audio stopped after %.1f ms",
+                     t["streamSid"], t["turn"], t["barge_stop_ms"])
+    if SINK:
+        SINK.put(t)
+
+    # Periodic aggregate
+    if t["answered"] and SERIES["local"].all.count % PRINT_EVERY == 0:
+        hl, ht = SERIES["local"].all, SERIES["ts"].all
+        log.info(
+            "[agg] local p50=%s p95=%s p99=%s | ts p50=%s p95=%s p99=%s (n=%d) | later turns p50=%s gap p50=%s",
+            *(fmt_ms(hl.quantile(q)) for q in (0.5, 0.95, 0.99)),
+            *(fmt_ms(ht.quantile(q)) for q in (0.5, 0.95, 0.99)),
+            hl.count,
+            fmt_ms(SERIES["later_turn"].all.quantile(0.5)),
+            fmt_ms(SERIES["gap"].all.quantile(0.5)),
+        )
+
+def end_call(sid: str) -> None:
+    st = STATE.pop(sid, None)
+    if st is None:
+        return
+    for t in st.timeline.close():
+        record_turn(t)
+    TOTALS["calls"] += 1
+    summary = st.timeline.summary()
+    log.info("%s call: %d turns (%d answered, %d barge-ins) first RTT=%s later p50=%s",
+             sid, summary["turns"], summary["answered"], summary["barge_ins"],
+             fmt_ms(summary["first_rtt_ms"]), fmt_ms(summary["later_rtt_p50_ms"]))
+    if CALL_SINK:
+        CALL_SINK.put(summary)
+
 async def handle(ws: WebSocketServerProtocol) -> None:
     """
     Twilio sends JSON messages with events: start, media, stop.
-    We detect:
-      - first inbound voice onset (energy threshold)
-      - first outbound audio after that
-    Then compute:
-      - RTT via local clock (now - t_in_local)
-      - RTT via Twilio timestamps (out_ts - in_ts), if present
+    Both tracks run an onset detector; their edges drive the call's
+    turns.CallTimeline, which segments the call into turns:
+      - caller speech start/end (inbound), agent audio start/end (outbound)
+      - barge-in: caller speech while agent audio is playing
+    For every turn it computes:
+      - RTT via local clock and via Twilio timestamps (caller onset → agent audio)
+      - gap (caller speech end → agent audio), barge-in stop time
     """
     # Path gate: only accept connections to the configured WS_PATH
     path = ws.path or "/"
@@ -113,89 +237,89 @@ async def handle(ws: WebSocketServerProtocol) -> None:
         return
 
     sid: Optional[str] = None
+    rec: Optional[recording.Recorder] = None
     try:
         async for raw in ws:
             try:
-                msg = json.loads(raw)
+                msg = loads(raw)
             except Exception:
                 # Ignore non-JSON frames
                 continue
 
             ev = msg.get("event")
             if ev == "start":
-                sid = msg.get("start", {}).get("streamSid")
+                start = msg.get("start", {})
+                sid = start.get("streamSid")
                 if not sid:
                     # If Twilio didn't include streamSid, fabricate one for safety
                     sid = f"no_sid_{int(time.time()*1000)}"
-                STATE[sid] = CallState()
-                log.info("start %s", sid)
+                encoding = (start.get("mediaFormat") or {}).get("encoding") or "audio/x-mulaw"
+                STATE[sid] = CallState(sid, encoding)
+                log.info("start %s (%s)", sid, encoding)
+                if RECORD_DIR:
+                    try:
+                        rec = recording.Recorder.for_stream(RECORD_DIR, sid, msg)
+                    except OSError as e:
+                        log.warning("%s: not recording: %s", sid, e)
 
             elif ev == "media":
-                if not sid:
-                    continue  # ignore media before 'start'
-                st = STATE[sid]
-                if st.done:
-                    continue
+                TOTALS["media_msgs"] += 1
+                st = STATE.get(sid) if sid else None
+                if st is None:
+                    continue  # ignore media before 'start' (or after an unsupported encoding)
 
                 media = msg.get("media", {})
                 track = (media.get("track") or "inbound_track").lower()  # inbound_track/outbound_track
                 payload_b64 = media.get("payload") or ""
-                payload = base64.b64decode(payload_b64) if payload_b64 else b""
+                if not payload_b64:
+                    continue
+                payload = base64.b64decode(payload_b64)
 
                 # Twilio-provided timestamp in ms since stream start (string → float)
                 ts_ms = to_float_or_none(media.get("timestamp"))
+                end_ts = None if ts_ms is None else ts_ms + payload_ms(payload, st.encoding)
 
-                energy = rms_from_pcm16le(payload)
                 now = time.perf_counter()
+                inbound = track.startswith("inbound")
+                if rec:
+                    rec.media(now, inbound, ts_ms, int(to_float_or_none(media.get("chunk")) or 0), payload)
+                try:
+                    edges = (st.inbound if inbound else st.outbound).events(payload)
+                except ValueError as e:
+                    log.warning("%s: %s; measurement disabled for this stream", sid, e)
+                    STATE.pop(sid, None)
+                    continue
 
-                # First inbound speech onset
-                if track.startswith("inbound") and st.t_in_local is None and energy > ENERGY_THRESH:
-                    st.t_in_local = now
-                    st.t_in_ts = ts_ms
-                    log.debug("%s inbound onset energy=%.3f ts_ms=%s", sid, energy, st.t_in_ts)
-
-                # First outbound audio after onset → compute RTT once
-                if track.startswith("outbound") and st.t_in_local is not None:
-                    rtt_local_ms = (now - st.t_in_local) * 1000.0
-                    rtt_ts_ms: Optional[float] = None
-                    if ts_ms is not None and st.t_in_ts is not None:
-                        rtt_ts_ms = ts_ms - st.t_in_ts
-
-                    LAT_MS_LOCAL.append(rtt_local_ms)
-                    if rtt_ts_ms is not None:
-                        LAT_MS_TS.append(rtt_ts_ms)
-
-                    log.info(
-                        "%s RTT local=%.1f ms ts=%s ms",
-                        sid,
-                        rtt_local_ms,
-                        f"{rtt_ts_ms:.1f}" if rtt_ts_ms is not None else "n/a",
-                    )
-
-                    await write_csv_row(sid, rtt_local_ms, rtt_ts_ms)
-
-                    st.done = True  # stop after first outbound packet post-onset
-
-                    # Periodic aggregate
-                    if len(LAT_MS_LOCAL) % PRINT_EVERY == 0:
-                        p50l, p95l = p50_p95(list(LAT_MS_LOCAL))
-                        p50t, p95t = p50_p95(list(LAT_MS_TS))
-                        log.info(
-                            "[agg] local p50=%.1f p95=%.1f | ts p50=%s p95=%s (n=%d)",
-                            p50l or -1,
-                            p95l or -1,
-                            f"{p50t:.1f}" if p50t is not None else "n/a",
-                            f"{p95t:.1f}" if p95t is not None else "n/a",
-                            len(LAT_MS_LOCAL),
-                        )
+                # Each edge is back-dated to where it happened in the audio
+                tl = st.timeline
+                for kind, ago_ms in edges:
+                    local = now - ago_ms / 1000.0
+                    at_ts = None if end_ts is None else end_ts - ago_ms
+                    if inbound and kind == codec.START:
+                        done = tl.user_start(local, at_ts, ago_ms)
+                    elif inbound:
+                        done = tl.user_end(local, at_ts)
+                    elif kind == codec.START:
+                        done = tl.agent_start(local, at_ts)
+                    else:
+                        done = tl.agent_end(local, at_ts)
+                    for t in done:
+                        record_turn(t)
+                    if done and rec:
+                        rec.flush(now)
 
             elif ev == "stop":
+                if rec:
+                    rec.event(time.perf_counter(), recording.STOP, raw if isinstance(raw, bytes) else raw.encode())
                 if sid:
                     log.info("stop %s", sid)
+                    end_call(sid)
 
             else:
-                # ignore other events
-                pass
+                # not measured; recorded so a replay sends the same stream (marks, dtmf)
+                if rec:
+                    kind = recording.MARK if ev == "mark" else recording.EVENT
+                    rec.event(time.perf_counter(), kind, raw if isinstance(raw, bytes) else raw.encode())
 
     except websockets.ConnectionClosedOK:
         pass
@@ -203,11 +327,33 @@ async def handle(ws: WebSocketServerProtocol) -> None:
         pass
     except Exception as e:
         log.exception("WS handler error: %s", e)
+    finally:
+        if rec:
+            rec.close()
+            log.info("%s: recorded %d frames to %s", sid, rec.frames, rec.path)
+        if sid:
+            end_call(sid)  # no 'stop' (dropped connection): still account for the call
+
+# -------------------------
+# HTTP metrics (served by the websocket server itself, same loop and port)
+# -------------------------
+async def process_request(path: str, headers):
+    """Answers GET /metrics (Prometheus text) and /metrics.json; everything else goes on to the WS handshake."""
+    route = path.split("?", 1)[0].rstrip("/")
+    base = METRICS_PATH.rstrip("/")
+    if route == base:
+        body = metrics_text(await gather_snapshots()).encode()
+        return http.HTTPStatus.OK, [("Content-Type", "text/plain; version=0.0.4")], body
+    if route == f"{base}.json":
+        body = json.dumps(metrics_json(await gather_snapshots())).encode()
+        return http.HTTPStatus.OK, [("Content-Type", "application/json")], body
+    return None
 
 # -------------------------
 # Server bootstrap
 # -------------------------
 async def main() -> None:
+    global SINK, CALL_SINK
     stop_event = asyncio.Event()
 
     def _graceful(*_):
@@ -221,19 +367,61 @@ async def main() -> None:
             # Windows
             pass
 
-    log.info("Starting measurement WS on ws://%s:%d%s", HOST, PORT, WS_PATH)
+    if CSV_PATH:
+        # one file per worker: processes never interleave rows or headers
+        turns_path = CSV_PATH if WORKER is None else with_suffix(CSV_PATH, f"w{WORKER}")
+        calls = CALLS_PATH or with_suffix(CSV_PATH, "calls")
+        SINK = sink.ResultSink(turns_path, turns.TURN_FIELDS)
+        SINK.start()
+        CALL_SINK = sink.ResultSink(calls if WORKER is None else with_suffix(calls, f"w{WORKER}"), turns.CALL_FIELDS)
+        CALL_SINK.start()
+
+    background = [asyncio.create_task(monitor_loop_lag())]
+    if WORKER is not None:
+        background.append(asyncio.create_task(publish_snapshots()))
+
+    log.info("Starting measurement WS on ws://%s:%d%s (metrics at http://%s:%d%s)%s",
+             HOST, PORT, WS_PATH, HOST, PORT, METRICS_PATH,
+             "" if WORKER is None else f" worker {WORKER} pid {os.getpid()}")
     async with websockets.serve(
         handle,
         HOST,
         PORT,
         subprotocols=["audio"],  # Twilio uses 'audio'
-        process_request=None,    # path check happens inside handler
+        process_request=process_request,  # /metrics; WS path check happens inside handler
         max_size=2**22,          # safe headroom for frames (~4MB)
+        reuse_port=WORKER is not None,  # workers share the port; the kernel balances connections
     ):
         await stop_event.wait()
+    for t in background:
+        t.cancel()
+    for sid in list(STATE):
+        end_call(sid)
+    for s in (SINK, CALL_SINK):
+        if s:
+            await s.close()  # flush buffered results before exit
     log.info("Server stopped.")
 
+def run_worker(index: int) -> None:
+    global WORKER
+    WORKER = index
+    try:
+        asyncio.run(main())
+    except KeyboardInterrupt:
+        pass
+
 if __name__ == "__main__":
+    ap = argparse.ArgumentParser(description="Twilio media stream latency meter")
+    ap.add_argument("--workers", type=int, default=WORKERS,
+                    help="processes sharing the port via SO_REUSEPORT (default: $WORKERS or 1)")
+    ap.add_argument("--record", default=RECORD_DIR, metavar="DIR",
+                    help="save each stream to DIR/<streamSid>.twrec for replay.py (default: $RECORD_DIR)")
+    args = ap.parse_args()
+    if args.record:
+        os.makedirs(args.record, exist_ok=True)
+        RECORD_DIR = os.environ["RECORD_DIR"] = args.record  # env too: spawned workers re-read it
+    if args.workers > 1:
+        sys.exit(workers.supervise(args.workers, PORT, run_worker))
     try:
         asyncio.run(main())
     except KeyboardInterrupt:
@@ -0,0 +1,162 @@
+# latency-measurement-scripts/measure/recording.py
+"""
+Binary recordings of Twilio media streams (measure.py --record DIR, replay.py).
+
+One file per stream, <streamSid>.twrec, little-endian, every section 8-byte
+aligned so the file can be mmap'd and walked (or viewed with numpy) in place:
+
+    header   8s magic "TWMREC01" | u32 version | u32 meta_len
+    meta     the 'start' message, JSON, meta_len bytes (+ pad)
+    records  i64 t_ns      arrival, ns after the 'start' message (local clock)
+             f64 ts_ms     Twilio media timestamp (NaN when absent)
+             u8  kind      MEDIA / MARK / STOP / EVENT
+             u8  track     INBOUND / OUTBOUND (media only)
+             u16 chunk     Twilio chunk number (mod 2^16)
+             u32 length    payload bytes
+             payload       media: the base64-decoded audio exactly as sent
+                           (G.711 or L16); others: the message JSON (+ pad)
+
+A media frame of 20 ms G.711 costs 184 bytes, ~9 KB per second per track,
+against ~25 KB/s for the JSON Twilio sends. Writes go through a large file
+buffer, never one write() per frame; the buffer is handed to the OS once it
+holds RECORD_BUFFER bytes, RECORD_FLUSH_MS after the last flush, and at each
+turn boundary (flush()). A process crash loses at most that unflushed tail
+(about RECORD_FLUSH_MS of frames); the file reads back up to its last
+complete record.
+"""
+import os
+import json
+import mmap
+import time
+import struct
+from typing import Iterator, NamedTuple, Optional
+
+MAGIC   = b"TWMREC01"
+VERSION = 1
+HEADER  = struct.Struct("<8sII")
+RECORD  = struct.Struct("<qdBBHI")      # 24 bytes
+SUFFIX  = ".twrec"
+RECORD_BUFFER = int(os.getenv("RECORD_BUFFER", str(256 * 1024)))
+RECORD_FLUSH_MS = float(os.getenv("RECORD_FLUSH_MS", "1000"))   # max age of unflushed frames
+
+MEDIA, MARK, STOP, EVENT = 1, 2, 3, 4
+INBOUND, OUTBOUND = 0, 1
+NAN = float("nan")
+
+
+def _pad(n: int) -> int:
+    return -n % 8
+
+
+class Frame(NamedTuple):
+    t_ns: int
+    ts_ms: float
+    kind: int
+    track: int
+    chunk: int
+    payload: bytes
+
+
+# -------------------------
+# Writer
+# -------------------------
+class Recorder:
+    __slots__ = ("path", "frames", "_f", "_t0", "_flushed")
+
+    def __init__(self, path: str, start: dict, t0: Optional[float] = None):
+        self.path = path
+        self.frames = 0
+        meta = json.dumps(start, separators=(",", ":")).encode()
+        self._f = open(path, "wb", buffering=RECORD_BUFFER)
+        self._f.write(HEADER.pack(MAGIC, VERSION, len(meta)) + meta + bytes(_pad(len(meta))))
+        self._t0 = time.perf_counter() if t0 is None else t0
+        self._flushed = self._t0
+
+    @classmethod
+    def for_stream(cls, directory: str, sid: str, start: dict, t0: Optional[float] = None) -> "Recorder":
+        safe = "".join(c if c.isalnum() or c in "-_" else "_" for c in sid)
+        return cls(os.path.join(directory, safe + SUFFIX), start, t0)
+
+    def _write(self, now: float, ts_ms: Optional[float], kind: int, track: int, chunk: int, payload: bytes):
+        self._f.write(RECORD.pack(int((now - self._t0) * 1e9), NAN if ts_ms is None else ts_ms,
+                                  kind, track, chunk & 0xFFFF, len(payload)))
+        self._f.write(payload)
+        pad = _pad(len(payload))
+        if pad:
+            self._f.write(bytes(pad))
+        self.frames += 1
+        if (now - self._flushed) * 1000 >= RECORD_FLUSH_MS:
+            self.flush(now)
+
+    def media(self, now: float, inbound: bool, ts_ms: Optional[float], chunk: int, payload: bytes):
+        self._write(now, ts_ms, MEDIA, INBOUND if inbound else OUTBOUND, chunk, payload)
+
+    def event(self, now: float, kind: int, raw: bytes):
+        """Non-media message (mark, stop, dtmf, ...), kept as its JSON."""
+        self._write(now, None, kind, 0, 0, raw)
+
+    def flush(self, now: Optional[float] = None):
+        """Hands buffered records to the OS (no fsync), so a crash does not lose them."""
+        self._f.flush()
+        self._flushed = time.perf_counter() if now is None else now
+
+    def close(self):
+        if not self._f.closed:
+            self._f.close()
+
+
+# -------------------------
+# Reader
+# -------------------------
+class Recording:
+    """A .twrec file, memory-mapped. Iterating yields Frames in arrival order."""
+
+    def __init__(self, path: str):
+        self.path = path
+        with open(path, "rb") as f:
+            self._mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        if len(self._mm) < HEADER.size:
+            raise ValueError(f"{path}: not a recording (too short)")
+        magic, version, meta_len = HEADER.unpack_from(self._mm, 0)
+        if magic != MAGIC or version != VERSION:
+            raise ValueError(f"{path}: not a v{VERSION} recording")
+        self.start: dict = json.loads(self._mm[HEADER.size:HEADER.size + meta_len])
+        self._data = HEADER.size + meta_len + _pad(meta_len)
+
+    @property
+    def sid(self) -> str:
+        return (self.start.get("start") or {}).get("streamSid") or self.start.get("streamSid") or ""
+
+    @property
+    def encoding(self) -> str:
+        return ((self.start.get("start") or {}).get("mediaFormat") or {}).get("encoding") or "audio/x-mulaw"
+
+    def __iter__(self) -> Iterator[Frame]:
+        mm, off, end = self._mm, self._data, len(self._mm)
+        while off + RECORD.size <= end:
+            t_ns, ts_ms, kind, track, chunk, length = RECORD.unpack_from(mm, off)
+            body = off + RECORD.size
+            if body + length > end:
+                break  # truncated tail
+            yield Frame(t_ns, ts_ms, kind, track, chunk, mm[body:body + length])
+            off = body + length + _pad(length)
+
+    def info(self) -> dict:
+        n = media = 0
+        audio = {INBOUND: 0, OUTBOUND: 0}
+        last = 0
+        for fr in self:
+            n += 1
+            last = fr.t_ns
+            if fr.kind == MEDIA:
+                media += 1
+                audio[fr.track] += len(fr.payload)
+        per_s = 8000 * (2 if self.encoding == "audio/l16" else 1)
+        return {"path": self.path, "streamSid": self.sid, "encoding": self.encoding, "records": n,
+                "media": media, "duration_s": round(last / 1e9, 2),
+                "inbound_audio_s": round(audio[INBOUND] / per_s, 2),
+                "outbound_audio_s": round(audio[OUTBOUND] / per_s, 2),
+                "bytes": len(self._mm)}
+
+    def close(self):
+        self._mm.close()
@@ -0,0 +1,275 @@
+#!/usr/bin/env python3
+# latency-measurement-scripts/measure/replay.py
+"""
+Replays .twrec recordings (measure.py --record DIR) as Twilio media streams.
+
+    in-process (default)  each stream is fed straight into measure.handle()
+                          through a stand-in websocket: onset detection, turn
+                          segmentation and metrics run exactly as in the server,
+                          with no network and no PSTN call
+    --target ws://…       streams go over real websockets to a running meter
+                          (server throughput, --workers scaling)
+
+--speed 1 replays in real time, N at N×, 0 as fast as possible. --streams N
+runs N streams at once, cycling through the recordings, each under its own
+streamSid. Every recording is re-encoded to Twilio's JSON once, before the
+clock starts, so the replayer adds little work of its own.
+
+Local-clock RTTs scale with the speed. The Twilio-timestamp clock ("ts") comes
+from the recording and gives the same turns at any speed; in-process runs
+print a digest of them, so two runs (or two onset settings) can be compared
+exactly.
+
+    python measure.py --record rec/                      # record real calls
+    python replay.py rec/ --speed 0 --streams 200        # detector/handler throughput
+    python replay.py rec/ --speed 1 --streams 500 --target ws://127.0.0.1:8082/stream
+"""
+import os
+import sys
+import glob
+import json
+import time
+import base64
+import asyncio
+import hashlib
+import logging
+import argparse
+import resource
+import urllib.parse
+import urllib.request
+from typing import AsyncIterator
+
+import websockets
+
+import sink
+import turns
+import sketch
+import measure
+import recording
+
+log = logging.getLogger("measure.replay")
+
+
+def expand(paths: list[str]) -> list[str]:
+    out = []
+    for p in paths:
+        out += sorted(glob.glob(os.path.join(p, "*" + recording.SUFFIX))) if os.path.isdir(p) else [p]
+    return out
+
+
+def cpu_s() -> float:
+    r = resource.getrusage(resource.RUSAGE_SELF)
+    return r.ru_utime + r.ru_stime
+
+
+# -------------------------
+# Encoding
+# -------------------------
+class Encoded:
+    """One recording as Twilio JSON: the 'start' message and (offset_s, message) pairs."""
+
+    def __init__(self, rec: recording.Recording):
+        self.sid = rec.sid
+        self.start = rec.start
+        self.messages: list[tuple[float, str]] = []
+        self.media = 0
+        self.duration_s = 0.0
+        seq = 1
+        for fr in rec:
+            t = fr.t_ns / 1e9
+            if fr.kind == recording.MEDIA:
+                media = {"track": "inbound" if fr.track == recording.INBOUND else "outbound",
+                         "chunk": str(fr.chunk), "payload": base64.b64encode(fr.payload).decode()}
+                if fr.ts_ms == fr.ts_ms:  # not NaN
+                    media["timestamp"] = str(int(fr.ts_ms)) if fr.ts_ms.is_integer() else str(fr.ts_ms)
+                seq += 1
+                msg = json.dumps({"event": "media", "sequenceNumber": str(seq), "streamSid": self.sid,
+                                  "media": media}, separators=(",", ":"))
+                self.media += 1
+            else:
+                msg = fr.payload.decode()
+            self.messages.append((t, msg))
+            self.duration_s = t
+
+    def start_for(self, n: int) -> str:
+        """The 'start' message under a per-stream streamSid."""
+        sid = f"{self.sid}-r{n}"
+        msg = dict(self.start, streamSid=sid)
+        if isinstance(msg.get("start"), dict):
+            msg["start"] = dict(msg["start"], streamSid=sid)
+        return json.dumps(msg)
+
+
+async def paced(start: str, messages: list[tuple[float, str]], speed: float,
+                lateness: sketch.LatencyHistogram) -> AsyncIterator[str]:
+    """Yields the stream's messages on the recording's schedule / speed (0: no waiting)."""
+    loop = asyncio.get_running_loop()
+    yield start
+    t0 = loop.time()
+    for i, (t, msg) in enumerate(messages):
+        if speed > 0:
+            due = t0 + t / speed
+            delay = due - loop.time()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            lateness.record(max(0.0, (loop.time() - due) * 1000))
+        elif i % 50 == 0:
+            await asyncio.sleep(0)  # let the other streams interleave
+        yield msg
+
+
+class InprocWS:
+    """What measure.handle() uses of a websocket: .path, async iteration, close()."""
+
+    def __init__(self, messages: AsyncIterator[str]):
+        self.path = measure.WS_PATH
+        self._messages = messages
+
+    def __aiter__(self):
+        return self._messages.__aiter__()
+
+    async def close(self, code: int = 1000, reason: str = ""):
+        pass
+
+
+class TurnCollector:
+    """Stands in for measure.SINK: keeps every turn record of the run."""
+
+    def __init__(self):
+        self.rows: list[dict] = []
+
+    @property
+    def stats(self) -> dict:
+        return {"rows": len(self.rows)}
+
+    def put(self, row: dict):
+        self.rows.append(row)
+
+
+# -------------------------
+# Run
+# -------------------------
+async def send_ws(target: str, messages: AsyncIterator[str]):
+    async with websockets.connect(target, subprotocols=["audio"], max_size=2**22, compression=None) as ws:
+        async for msg in messages:
+            await ws.send(msg)
+
+
+async def run(args, encoded: list[Encoded]) -> dict:
+    lateness = sketch.LatencyHistogram()
+    failed = 0
+
+    async def _stream(n: int):
+        nonlocal failed
+        await asyncio.sleep(args.stagger * n / args.streams)
+        e = encoded[n % len(encoded)]
+        messages = paced(e.start_for(n), e.messages, args.speed, lateness)
+        try:
+            if args.target:
+                await send_ws(args.target, messages)
+            else:
+                await measure.handle(InprocWS(messages))
+        except (OSError, websockets.WebSocketException) as ex:
+            failed += 1
+            log.warning("stream %d: %s", n, ex)
+
+    probe = None if args.target else asyncio.create_task(measure.monitor_loop_lag())
+    c0, t0 = cpu_s(), time.perf_counter()
+    await asyncio.gather(*(_stream(n) for n in range(args.streams)))
+    wall, cpu = time.perf_counter() - t0, cpu_s() - c0
+    if probe:
+        probe.cancel()
+    chosen = [encoded[n % len(encoded)] for n in range(args.streams)]
+    msgs = sum(len(e.messages) + 1 for e in chosen)
+    media = sum(e.media for e in chosen)
+    audio_s = sum(e.duration_s for e in chosen)
+    return {
+        "streams": args.streams, "failed": failed, "speed": args.speed or "max",
+        "wall_s": round(wall, 3), "messages": msgs, "msgs_per_s": round(msgs / wall),
+        "stream_s_per_s": round(audio_s / wall, 1),   # seconds of call replayed per second
+        "cpu_s": round(cpu, 3), "cpu_us_per_media": round(cpu * 1e6 / max(1, media), 1),
+        "lateness_ms": lateness.to_dict() if args.speed > 0 else None,
+    }
+
+
+def server_metrics(target: str) -> dict:
+    u = urllib.parse.urlsplit(target)
+    url = urllib.parse.urlunsplit(("https" if u.scheme == "wss" else "http", u.netloc,
+                                   measure.METRICS_PATH.rstrip("/") + ".json", "", ""))
+    with urllib.request.urlopen(url, timeout=5) as r:
+        return json.load(r)
+
+
+def digest(rows: list[dict]) -> str:
+    """Stable over runs and speeds: Twilio-clock fields of every turn, in stream/turn order."""
+    keys = ("turn", "rtt_ts_ms", "gap_ms", "agent_ms", "barge_in", "barge_stop_ms", "answered", "in_ts_ms")
+    canon = sorted(json.dumps([r["streamSid"]] + [r[k] for k in keys]) for r in rows)
+    return hashlib.sha1("\n".join(canon).encode()).hexdigest()[:16]
+
+
+def report(r: dict, m: dict, rows: list[dict]):
+    print(f"\n{r['streams']} streams ({r['failed']} failed) at speed {r['speed']}: {r['messages']} messages "
+          f"in {r['wall_s']} s = {r['msgs_per_s']} msg/s, {r['stream_s_per_s']} call-s/s")
+    print(f"  cpu {r['cpu_s']} s, {r['cpu_us_per_media']} µs per media message")
+    if r["lateness_ms"]:
+        d = r["lateness_ms"]
+        print(f"  send lateness p50={d['p50']} p99={d['p99']} max={d['max']} ms")
+    if m:
+        print(f"  meter: {m.get('calls', 0)} calls, {m.get('turns', 0)} turns ({m.get('answered', 0)} answered, "
+              f"{m.get('barge_ins', 0)} barge-ins), {m.get('media_msgs', 0)} media msgs")
+        for name in ("ts", "local", "gap"):
+            d = m["rtt_ms"].get(name, {}).get("all", {})
+            if d.get("n"):
+                print(f"  rtt {name:<6} n={d['n']} p50={d['p50']} p95={d['p95']} p99={d['p99']} ms")
+        lag = m.get("loop_lag_ms", {}).get("all", {})
+        if lag.get("n"):
+            print(f"  meter loop lag p99={lag['p99']} max={lag['max']} ms")
+    if rows:
+        print(f"  turn digest (ts clock) {digest(rows)}")
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("paths", nargs="+", help=".twrec files or directories of them")
+    ap.add_argument("--speed", type=float, default=1.0, help="1 = real time, N = N× faster, 0 = as fast as possible")
+    ap.add_argument("--streams", type=int, default=0, help="parallel streams (default: one per recording)")
+    ap.add_argument("--stagger", type=float, default=0.0, help="spread stream starts over this many seconds")
+    ap.add_argument("--target", default="", help="ws://host:port/stream of a running meter (default: in-process)")
+    ap.add_argument("--out", default="", help="in-process: write every turn record here (.csv/.parquet/.arrow)")
+    ap.add_argument("--info", action="store_true", help="describe the recordings and exit")
+    ap.add_argument("--verbose", action="store_true", help="keep the meter's per-turn logging")
+    args = ap.parse_args()
+
+    paths = expand(args.paths)
+    if not paths:
+        ap.error("no recordings found")
+    recs = [recording.Recording(p) for p in paths]
+    if args.info:
+        for rec in recs:
+            print(json.dumps(rec.info()))
+        return
+    if not args.verbose:
+        logging.getLogger("measure").setLevel(logging.WARNING)
+    args.streams = args.streams or len(recs)
+    encoded = [Encoded(rec) for rec in recs]
+    for rec in recs:
+        rec.close()
+
+    collector = None
+    if not args.target:
+        collector = measure.SINK = TurnCollector()
+    r = asyncio.run(run(args, encoded))
+    m = server_metrics(args.target) if args.target else measure.metrics_json([measure.snapshot()])
+    report(r, m, collector.rows if collector else [])
+    if args.out and collector:
+        w = sink.open_writer(args.out, turns.TURN_FIELDS)
+        w.write(collector.rows)
+        w.close()
+        print(f"wrote {len(collector.rows)} turns to {args.out}")
+
+
+if __name__ == "__main__":
+    try:
+        main()
+    except KeyboardInterrupt:
+        sys.exit(130)
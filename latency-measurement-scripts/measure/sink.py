@@ -0,0 +1,178 @@
+# latency-measurement-scripts/measure/sink.py
+"""
+Buffered result sink for the meter.
+
+Each sink writes one record shape, given as {column: "str" | "float" | "int"}
+(turns.TURN_FIELDS, turns.CALL_FIELDS); missing values are written empty / null.
+
+Rows go into a bounded asyncio queue (put() never blocks the media path). A
+background task drains it in batches of SINK_BATCH_ROWS or every SINK_FLUSH_S,
+whichever comes first, and hands each batch to a writer in a worker thread, so
+file I/O never runs on the event loop. close() drains what is queued and
+closes the file (Parquet needs that for its footer).
+
+Formats, picked by SINK_FORMAT or the file extension:
+    csv                    .csv (header written once, when the file is new)
+    parquet                .parquet            (needs pyarrow)
+    arrow                  .arrow/.ipc/.feather, Arrow IPC stream (needs pyarrow)
+"""
+import os
+import csv
+import time
+import asyncio
+import logging
+from typing import Optional
+
+log = logging.getLogger("measure.sink")
+
+SINK_FORMAT     = os.getenv("SINK_FORMAT", "")              # empty = from the extension
+SINK_BATCH_ROWS = int(os.getenv("SINK_BATCH_ROWS", "256"))
+SINK_FLUSH_S    = float(os.getenv("SINK_FLUSH_S", "1.0"))
+SINK_QUEUE      = int(os.getenv("SINK_QUEUE", "100000"))    # rows; beyond this rows are dropped and counted
+
+_STOP = object()
+
+_EXT = {".csv": "csv", ".parquet": "parquet", ".arrow": "arrow", ".ipc": "arrow", ".feather": "arrow"}
+
+
+# -------------------------
+# Writers (run in a worker thread)
+# -------------------------
+class CsvWriter:
+    def __init__(self, path: str, fields: dict):
+        self.fields = list(fields)
+        new = not os.path.exists(path) or os.path.getsize(path) == 0
+        self._f = open(path, "a", encoding="utf-8", newline="")
+        self._w = csv.DictWriter(self._f, fieldnames=self.fields, extrasaction="ignore")
+        if new:
+            self._w.writeheader()
+
+    def write(self, rows: list[dict]):
+        self._w.writerows({k: _csv_value(r.get(k)) for k in self.fields} for r in rows)
+        self._f.flush()
+
+    def close(self):
+        self._f.close()
+
+
+def _csv_value(v):
+    if v is None:
+        return ""
+    if isinstance(v, float):
+        return f"{v:.3f}"
+    return v
+
+
+class ArrowWriter:
+    """Parquet (one row group per batch) or an Arrow IPC stream."""
+    def __init__(self, path: str, fields: dict, fmt: str):
+        try:
+            import pyarrow as pa
+        except ImportError as e:
+            raise RuntimeError(f"SINK format {fmt!r} needs pyarrow (pip install pyarrow)") from e
+        types = {"str": pa.string(), "float": pa.float64(), "int": pa.int64()}
+        self._pa = pa
+        self.schema = pa.schema([(k, types[t]) for k, t in fields.items()])
+        if fmt == "parquet":
+            import pyarrow.parquet as pq
+            self._w = pq.ParquetWriter(path, self.schema)
+            self._write = lambda t: self._w.write_table(t)
+        else:
+            self._sink = pa.OSFile(path, "wb")
+            self._w = pa.ipc.new_stream(self._sink, self.schema)
+            self._write = lambda t: self._w.write_table(t)
+
+    def write(self, rows: list[dict]):
+        cols = {f.name: [r.get(f.name) for r in rows] for f in self.schema}
+        self._write(self._pa.Table.from_pydict(cols, schema=self.schema))
+
+    def close(self):
+        self._w.close()
+        if hasattr(self, "_sink"):
+            self._sink.close()
+
+
+def open_writer(path: str, fields: dict, fmt: str = SINK_FORMAT):
+    fmt = fmt or _EXT.get(os.path.splitext(path)[1].lower(), "csv")
+    if fmt == "csv":
+        return CsvWriter(path, fields)
+    if fmt in ("parquet", "arrow"):
+        return ArrowWriter(path, fields, fmt)
+    raise ValueError(f"unknown SINK_FORMAT: {fmt}")
+
+
+# -------------------------
+# Sink
+# -------------------------
+class ResultSink:
+    def __init__(self, path: str, fields: dict, fmt: str = SINK_FORMAT, batch_rows: int = SINK_BATCH_ROWS,
+                 flush_s: float = SINK_FLUSH_S, max_queue: int = SINK_QUEUE):
+        self.path = path
+        self.fields = fields
+        self.fmt = fmt
+        self.batch_rows = batch_rows
+        self.flush_s = flush_s
+        self._q: asyncio.Queue = asyncio.Queue(maxsize=max_queue)
+        self._task: Optional[asyncio.Task] = None
+        self._writer = None
+        self.stats = {"written": 0, "dropped": 0, "batches": 0, "errors": 0}
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    def put(self, row: dict):
+        """Non-blocking; safe to call from the media handler."""
+        try:
+            self._q.put_nowait(row)
+        except asyncio.QueueFull:
+            self.stats["dropped"] += 1
+            if self.stats["dropped"] == 1 or self.stats["dropped"] % 1000 == 0:
+                log.warning("Result sink %s queue full, %d rows dropped", self.path, self.stats["dropped"])
+
+    async def _run(self):
+        stopping = False
+        while not stopping:
+            batch = []
+            item = await self._q.get()
+            deadline = time.monotonic() + self.flush_s
+            while True:
+                if item is _STOP:
+                    stopping = True
+                    break
+                batch.append(item)
+                timeout = deadline - time.monotonic()
+                if len(batch) >= self.batch_rows or timeout <= 0:
+                    break
+                try:
+                    item = await asyncio.wait_for(self._q.get(), timeout)
+                except asyncio.TimeoutError:
+                    break
+            await self._flush(batch)
+
+    async def _flush(self, batch: list[dict]):
+        if not batch:
+            return
+        try:
+            await asyncio.to_thread(self._write, batch)
+            self.stats["written"] += len(batch)
+            self.stats["batches"] += 1
+        except Exception as e:
+            self.stats["errors"] += 1
+            log.warning("Result sink write failed (%d rows lost): %s", len(batch), e)
+
+    def _write(self, batch: list[dict]):
+        if self._writer is None:
+            self._writer = open_writer(self.path, self.fields, self.fmt)
+        self._writer.write(batch)
+
+    async def close(self):
+        """Writes whatever is still queued and closes the file."""
+        if self._task:
+            await self._q.put(_STOP)   # behind every queued row
+            await self._task
+            self._task = None
+        if self._writer is not None:
+            await asyncio.to_thread(self._writer.close)
+            self._writer = None
+        log.info("Result sink %s closed: %s", self.path, self.stats)
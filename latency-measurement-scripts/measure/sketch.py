@@ -0,0 +1,199 @@
+# latency-measurement-scripts/measure/sketch.py
+"""
+Streaming latency quantiles for the meter.
+
+LatencyHistogram is an HDR-style log-linear histogram over microseconds:
+values below 2*SUB land in exact buckets, above that every power of two is
+split into SUB linear buckets (~3% relative error at SUB=32). Record is O(1),
+memory is a sparse dict of a few hundred buckets at most, and two histograms
+merge by adding counts, so per-process snapshots (state()/from_state()) can be
+combined into one exact-to-bucket view.
+
+WindowedHistogram keeps a ring of SLOT_S-second histograms plus an all-time
+one, so the same series answers "last 1 min", "last 5 min" and "all".
+"""
+import os
+import math
+import time
+from typing import Iterable, Optional
+
+SLOT_S   = float(os.getenv("SKETCH_SLOT_S", "10"))
+WINDOWS  = {"1m": 60, "5m": 300}                       # seconds; "all" is always kept
+QUANTILES = (0.5, 0.9, 0.95, 0.99, 0.999)
+
+
+class LatencyHistogram:
+    SUB_BITS = 5
+    SUB = 1 << SUB_BITS
+
+    __slots__ = ("counts", "count", "total_us", "min_us", "max_us")
+
+    def __init__(self):
+        self.counts: dict[int, int] = {}
+        self.count = 0
+        self.total_us = 0
+        self.min_us = 0
+        self.max_us = 0
+
+    @classmethod
+    def _index(cls, v: int) -> int:
+        if v < 2 * cls.SUB:
+            return v
+        shift = v.bit_length() - cls.SUB_BITS - 1
+        return (shift + 1) * cls.SUB + (v >> shift) - cls.SUB
+
+    @classmethod
+    def _value(cls, idx: int) -> int:
+        """Midpoint of bucket `idx`."""
+        if idx < 2 * cls.SUB:
+            return idx
+        shift = idx // cls.SUB - 1
+        sub = idx % cls.SUB + cls.SUB
+        return (sub << shift) + (1 << shift) // 2
+
+    def record(self, ms: float):
+        v = max(0, int(ms * 1000))
+        i = self._index(v)
+        self.counts[i] = self.counts.get(i, 0) + 1
+        if not self.count or v < self.min_us:
+            self.min_us = v
+        if v > self.max_us:
+            self.max_us = v
+        self.count += 1
+        self.total_us += v
+
+    def merge(self, other: "LatencyHistogram") -> "LatencyHistogram":
+        if not other.count:
+            return self
+        for i, c in other.counts.items():
+            self.counts[i] = self.counts.get(i, 0) + c
+        self.min_us = other.min_us if not self.count else min(self.min_us, other.min_us)
+        self.max_us = max(self.max_us, other.max_us)
+        self.count += other.count
+        self.total_us += other.total_us
+        return self
+
+    def quantile(self, q: float) -> Optional[float]:
+        """Value (ms) at quantile q in [0, 1]."""
+        if not self.count:
+            return None
+        rank = max(1, math.ceil(q * self.count))
+        seen = 0
+        for i in sorted(self.counts):
+            seen += self.counts[i]
+            if seen >= rank:
+                return min(max(self._value(i), self.min_us), self.max_us) / 1000
+        return self.max_us / 1000
+
+    def to_dict(self, quantiles: Iterable[float] = QUANTILES) -> dict:
+        def r(v):
+            return None if v is None else round(v, 1)
+        out = {"n": self.count}
+        for q in quantiles:
+            out[_qname(q)] = r(self.quantile(q))
+        out["min"] = r(self.min_us / 1000) if self.count else None
+        out["max"] = r(self.max_us / 1000) if self.count else None
+        out["mean"] = r(self.total_us / self.count / 1000) if self.count else None
+        return out
+
+    # -------------------------
+    # snapshots (JSON-safe, mergeable)
+    # -------------------------
+    def state(self) -> dict:
+        return {"counts": {str(i): c for i, c in self.counts.items()}, "count": self.count,
+                "total_us": self.total_us, "min_us": self.min_us, "max_us": self.max_us}
+
+    @classmethod
+    def from_state(cls, s: dict) -> "LatencyHistogram":
+        h = cls()
+        h.counts = {int(i): c for i, c in s.get("counts", {}).items()}
+        h.count = s.get("count", 0)
+        h.total_us = s.get("total_us", 0)
+        h.min_us = s.get("min_us", 0)
+        h.max_us = s.get("max_us", 0)
+        return h
+
+
+def _qname(q: float) -> str:
+    """0.5 → p50, 0.999 → p99.9"""
+    s = f"{q * 100:.1f}".rstrip("0").rstrip(".")
+    return f"p{s}"
+
+
+class WindowedHistogram:
+    """Sliding-window view over a ring of SLOT_S-second histograms."""
+
+    def __init__(self, slot_s: float = SLOT_S, horizon_s: float = max(WINDOWS.values())):
+        self.slot_s = slot_s
+        self.slots = int(math.ceil(horizon_s / slot_s)) + 1
+        self._ring: list[Optional[tuple[int, LatencyHistogram]]] = [None] * self.slots
+        self.all = LatencyHistogram()
+
+    def record(self, ms: float, now: Optional[float] = None):
+        tick = int((time.time() if now is None else now) // self.slot_s)
+        i = tick % self.slots
+        entry = self._ring[i]
+        if entry is None or entry[0] != tick:
+            entry = (tick, LatencyHistogram())
+            self._ring[i] = entry
+        entry[1].record(ms)
+        self.all.record(ms)
+
+    def window(self, seconds: float, now: Optional[float] = None) -> LatencyHistogram:
+        """Merged histogram of the last `seconds` (rounded up to whole slots)."""
+        tick = int((time.time() if now is None else now) // self.slot_s)
+        oldest = tick - int(math.ceil(seconds / self.slot_s)) + 1
+        out = LatencyHistogram()
+        for entry in self._ring:
+            if entry is not None and oldest <= entry[0] <= tick:
+                out.merge(entry[1])
+        return out
+
+    def views(self, now: Optional[float] = None) -> dict[str, LatencyHistogram]:
+        """{window name: histogram}, "all" included."""
+        out = {name: self.window(s, now) for name, s in WINDOWS.items()}
+        out["all"] = self.all
+        return out
+
+    def to_dict(self, now: Optional[float] = None) -> dict:
+        return {w: h.to_dict() for w, h in self.views(now).items()}
+
+    def state(self, now: Optional[float] = None) -> dict:
+        """Mergeable snapshot: one histogram state per window."""
+        return {w: h.state() for w, h in self.views(now).items()}
+
+
+def merge_views(states: Iterable[dict]) -> dict[str, dict[str, LatencyHistogram]]:
+    """
+    Combines {series: WindowedHistogram.state()} snapshots (e.g. one per
+    worker process) → {series: {window: LatencyHistogram}}.
+    """
+    merged: dict[str, dict[str, LatencyHistogram]] = {}
+    for snap in states:
+        for series, windows in snap.items():
+            for w, hs in windows.items():
+                merged.setdefault(series, {}).setdefault(w, LatencyHistogram()).merge(LatencyHistogram.from_state(hs))
+    return merged
+
+
+# -------------------------
+# Prometheus text format
+# -------------------------
+def prometheus(views: dict[str, dict[str, LatencyHistogram]], prefix: str = "measure_rtt_ms",
+               help_text: str = "Per-turn latency (ms): RTT on both clocks, first/later turns, gap, barge-in stop.") -> str:
+    """
+    Summary-style exposition of {series: {window: histogram}}: one quantile set
+    per series and window. _sum/_count come from window="all" only, since they
+    must be monotonic counters and the sliding windows shrink.
+    """
+    lines = [f"# HELP {prefix} {help_text}", f"# TYPE {prefix} summary"]
+    for name, windows in views.items():
+        for w, h in windows.items():
+            labels = f'series="{name}",window="{w}"'
+            for q in QUANTILES:
+                v = h.quantile(q)
+                lines.append(f'{prefix}{{{labels},quantile="{q}"}} {"NaN" if v is None else round(v, 3)}')
+            if w == "all":
+                lines.append(f"{prefix}_sum{{{labels}}} {h.total_us / 1000:.3f}")
+                lines.append(f"{prefix}_count{{{labels}}} {h.count}")
+    return "\n".join(lines) + "\n"
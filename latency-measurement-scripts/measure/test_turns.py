@@ -0,0 +1,71 @@
+# latency-measurement-scripts/measure/test_turns.py
+"""
+CallTimeline segmentation. Edges are fed in the order measure.py delivers
+them: the agent's end edge fires AGENT_HANGOVER_MS after its audio stopped,
+back-dated to the stop, so a quick answer arrives before it.
+"""
+import turns
+
+HANGOVER_S = 0.7
+
+
+def _call(answer_gap_s: float) -> tuple[turns.CallTimeline, list[dict]]:
+    """Caller asks, agent talks 1.5 s, caller answers answer_gap_s after it stopped."""
+    tl = turns.CallTimeline("MZtest")
+    out = []
+    out += tl.user_start(0.0, 0.0)
+    out += tl.user_end(1.0, 1000.0)
+    out += tl.agent_start(1.5, 1500.0)
+    stop = 3.0
+    answer = stop + answer_gap_s
+    edges = [(answer, lambda: tl.user_start(answer, answer * 1000)),
+             (stop + HANGOVER_S, lambda: tl.agent_end(stop, stop * 1000))]
+    for _, edge in sorted(edges, key=lambda e: e[0]):
+        out += edge()
+    out += tl.user_end(answer + 1.0, (answer + 1.0) * 1000)
+    out += tl.agent_start(answer + 1.4, (answer + 1.4) * 1000)
+    out += tl.agent_end(answer + 2.5, (answer + 2.5) * 1000)
+    out += tl.close()
+    return tl, out
+
+
+def test_answer_within_hangover_is_not_a_barge_in():
+    tl, out = _call(0.5)
+    assert tl.barge_ins == 0
+    assert [t["barge_in"] for t in out] == [0, 0]
+    assert all(t["barge_stop_ms"] is None for t in out)
+    assert out[0]["agent_ms"] == 1500.0
+
+
+def test_answer_after_hangover_is_not_a_barge_in():
+    tl, out = _call(1.0)
+    assert tl.barge_ins == 0
+    assert [t["barge_in"] for t in out] == [0, 0]
+
+
+def test_talking_over_the_agent_is_a_barge_in():
+    tl, out = _call(-0.4)
+    assert tl.barge_ins == 1
+    assert out[0]["barge_in"] == 1
+    assert out[0]["barge_stop_ms"] == 400.0
+
+
+def test_onset_over_a_greeting_that_already_stopped_is_not_a_barge_in():
+    tl = turns.CallTimeline("MZtest")
+    tl.agent_start(0.0, 0.0)
+    tl.user_start(2.3, 2300.0)
+    tl.agent_end(2.0, 2000.0)
+    assert tl.barge_ins == 0
+
+
+def test_first_answered_turn_is_flagged():
+    _, out = _call(0.5)
+    assert [t["first"] for t in out] == [1, 0]
+    tl = turns.CallTimeline("MZtest")
+    tl.agent_start(0.0, 0.0)
+    tl.user_start(0.5, 500.0)      # talks over the greeting
+    tl.agent_end(1.0, 1000.0)
+    tl.user_end(1.5, 1500.0)
+    tl.agent_start(2.0, 2000.0)
+    out = tl.agent_end(3.0, 3000.0)
+    assert tl.barge_ins == 1 and out[0]["first"] == 1
@@ -0,0 +1,231 @@
+# latency-measurement-scripts/measure/turns.py
+"""
+Turn segmentation over a whole call.
+
+The caller's track and the agent's track each run an OnsetDetector, and their
+edges drive a CallTimeline:
+
+    user_start   caller speech begins: opens a turn (a pause before the agent
+                 answers keeps the same turn)
+    user_end     caller speech ends (the last end before the answer counts)
+    agent_start  first agent audio after user_start: the turn's RTT
+    agent_end    agent audio stops: the turn is emitted
+    barge-in     user_start while agent audio is playing: the playing turn is
+                 marked, and emitted once its audio stops, with
+                 barge_stop_ms = how long the agent kept talking over the caller.
+                 The agent's end edge only fires after its hangover, back-dated
+                 to where the audio stopped; if that is not after the caller's
+                 (back-dated) onset, the caller answered rather than barged in,
+                 and the mark is taken back
+
+Every instant is kept on both clocks: local perf_counter seconds, and Twilio
+media timestamps in ms (NaN when absent). A turn is a fixed array('d') of
+those pairs. A call holds at most two turns (the open one and one draining
+after a barge-in) plus per-call histograms, so memory does not grow with
+call length.
+"""
+import math
+import time
+from array import array
+from typing import Optional
+
+import sketch
+
+USER_START, USER_END, AGENT_START, AGENT_END, BARGE = range(5)
+_AGO = 10        # slot after the five (local, ts) pairs: onset back-dating, ms
+NAN = float("nan")
+
+# Per-turn record (sink columns)
+TURN_FIELDS = {
+    "streamSid":      "str",
+    "encoding":       "str",
+    "turn":           "int",
+    "rtt_local_ms":   "float",   # caller onset → first agent audio, local clock
+    "rtt_ts_ms":      "float",   # same, Twilio media timestamps
+    "gap_ms":         "float",   # caller speech end → first agent audio (what the caller hears as silence)
+    "agent_ms":       "float",   # agent audio duration
+    "barge_in":       "int",     # 1 if the caller talked over this turn's agent audio
+    "barge_stop_ms":  "float",   # barge-in → agent audio actually stopping
+    "answered":       "int",     # 0 if the call ended before the agent replied
+    "first":          "int",     # 1 for the call's first answered turn (setup-dominated RTT)
+    "in_ts_ms":       "float",   # Twilio timestamp of the caller onset
+    "out_ts_ms":      "float",   # Twilio timestamp of the first agent audio
+    "onset_ago_ms":   "float",   # how far the caller onset was back-dated
+    "ts":             "int",     # wall clock, ms since epoch
+}
+
+# Per-call aggregate record
+CALL_FIELDS = {
+    "streamSid":         "str",
+    "duration_s":        "float",
+    "turns":             "int",
+    "answered":          "int",
+    "barge_ins":         "int",
+    "first_rtt_ms":      "float",   # first turn is dominated by connection setup
+    "later_rtt_p50_ms":  "float",
+    "later_rtt_p95_ms":  "float",
+    "gap_p50_ms":        "float",
+    "barge_stop_max_ms": "float",
+    "ts":                "int",
+}
+
+
+def _diff_ms(turn: array, a: int, b: int) -> Optional[float]:
+    """b − a in ms, on the Twilio clock when both ends have it, else the local clock."""
+    ts = turn[2 * b + 1] - turn[2 * a + 1]
+    if not math.isnan(ts):
+        return ts
+    local = turn[2 * b] - turn[2 * a]
+    return None if math.isnan(local) else local * 1000
+
+
+def _after(turn: array, ev: int, local: float, ts: Optional[float]) -> bool:
+    """Whether (local, ts) is later than event `ev` of `turn`, on the Twilio clock when both have it."""
+    at = turn[2 * ev + 1]
+    if ts is not None and not math.isnan(at):
+        return ts > at
+    return local > turn[2 * ev]
+
+
+def _none(v: float) -> Optional[float]:
+    return None if math.isnan(v) else v
+
+
+class CallTimeline:
+    __slots__ = ("sid", "encoding", "started", "turns", "answered", "barge_ins", "agent_speaking",
+                 "first_rtt_ms", "_cur", "_draining", "_greeting_barge", "_rtt", "_gap", "_barge_max")
+
+    def __init__(self, sid: str, encoding: str = "audio/x-mulaw"):
+        self.sid = sid
+        self.encoding = encoding
+        self.started = time.time()
+        self.turns = 0
+        self.answered = 0
+        self.barge_ins = 0
+        self.agent_speaking = False
+        self.first_rtt_ms: Optional[float] = None
+        self._cur: Optional[array] = None          # turn being built
+        self._draining: Optional[array] = None     # barged-in turn whose audio is still playing
+        self._greeting_barge: Optional[array] = None  # onset over agent audio that answers no turn
+        self._rtt = sketch.LatencyHistogram()      # later turns only
+        self._gap = sketch.LatencyHistogram()
+        self._barge_max = 0.0
+
+    @staticmethod
+    def _set(turn: array, ev: int, local: float, ts: Optional[float]):
+        turn[2 * ev] = local
+        turn[2 * ev + 1] = NAN if ts is None else ts
+
+    # -------------------------
+    # edges (each returns the turn records it completes)
+    # -------------------------
+    def user_start(self, local: float, ts: Optional[float], ago_ms: float = 0.0) -> list[dict]:
+        out = []
+        cur = self._cur
+        if cur is not None and not math.isnan(cur[2 * AGENT_START]):
+            if self.agent_speaking:
+                self.barge_ins += 1
+                self._set(cur, BARGE, local, ts)
+                if self._draining is not None:
+                    out.append(self._emit(self._draining))
+                self._draining = cur
+            else:
+                out.append(self._emit(cur))
+            cur = None
+        elif cur is None and self.agent_speaking and self._draining is None:
+            # talking over agent audio that answers no turn of ours (e.g. a greeting)
+            self.barge_ins += 1
+            self._greeting_barge = array("d", [NAN] * (_AGO + 1))
+            self._set(self._greeting_barge, BARGE, local, ts)
+        if cur is None:
+            self._cur = cur = array("d", [NAN] * (_AGO + 1))
+            self._set(cur, USER_START, local, ts)
+            cur[_AGO] = ago_ms
+        # else: caller paused and resumed before the answer; same turn
+        return out
+
+    def user_end(self, local: float, ts: Optional[float]) -> list[dict]:
+        if self._cur is not None and math.isnan(self._cur[2 * AGENT_START]):
+            self._set(self._cur, USER_END, local, ts)
+        return []
+
+    def agent_start(self, local: float, ts: Optional[float]) -> list[dict]:
+        self.agent_speaking = True
+        cur = self._cur
+        if cur is not None and math.isnan(cur[2 * AGENT_START]):
+            self._set(cur, AGENT_START, local, ts)
+        return []
+
+    def agent_end(self, local: float, ts: Optional[float]) -> list[dict]:
+        self.agent_speaking = False
+        out = []
+        if self._greeting_barge is not None:
+            if not _after(self._greeting_barge, BARGE, local, ts):
+                self.barge_ins -= 1   # the greeting had already stopped
+            self._greeting_barge = None
+        if self._draining is not None:
+            if not _after(self._draining, BARGE, local, ts):
+                # audio had stopped by the caller's onset: an answer, not a barge-in
+                self.barge_ins -= 1
+                self._draining[2 * BARGE] = self._draining[2 * BARGE + 1] = NAN
+            self._set(self._draining, AGENT_END, local, ts)
+            out.append(self._emit(self._draining))
+            self._draining = None
+        cur = self._cur
+        if cur is not None and not math.isnan(cur[2 * AGENT_START]):
+            self._set(cur, AGENT_END, local, ts)
+            out.append(self._emit(cur))
+            self._cur = None
+        return out
+
+    def close(self) -> list[dict]:
+        """Call ended: emits whatever is still open."""
+        out = []
+        for t in (self._draining, self._cur):
+            if t is not None:
+                out.append(self._emit(t))
+        self._draining = self._cur = self._greeting_barge = None
+        return out
+
+    # -------------------------
+    # records
+    # -------------------------
+    def _emit(self, t: array) -> dict:
+        self.turns += 1
+        answered = not math.isnan(t[2 * AGENT_START])
+        rtt_local = (t[2 * AGENT_START] - t[2 * USER_START]) * 1000
+        rtt_ts = t[2 * AGENT_START + 1] - t[2 * USER_START + 1]
+        gap = _diff_ms(t, USER_END, AGENT_START)
+        barge_stop = _diff_ms(t, BARGE, AGENT_END)
+        first = answered and self.first_rtt_ms is None
+        if answered:
+            self.answered += 1
+            rtt = rtt_local if math.isnan(rtt_ts) else rtt_ts
+            if first:
+                self.first_rtt_ms = rtt
+            else:
+                self._rtt.record(rtt)
+            if gap is not None:
+                self._gap.record(max(0.0, gap))
+        if barge_stop is not None:
+            self._barge_max = max(self._barge_max, barge_stop)
+        return {
+            "streamSid": self.sid, "encoding": self.encoding, "turn": self.turns,
+            "rtt_local_ms": _none(rtt_local), "rtt_ts_ms": _none(rtt_ts), "gap_ms": gap,
+            "agent_ms": _diff_ms(t, AGENT_START, AGENT_END),
+            "barge_in": int(not math.isnan(t[2 * BARGE])), "barge_stop_ms": barge_stop,
+            "answered": int(answered), "first": int(first), "in_ts_ms": _none(t[2 * USER_START + 1]),
+            "out_ts_ms": _none(t[2 * AGENT_START + 1]), "onset_ago_ms": _none(t[_AGO]),
+            "ts": int(time.time() * 1000),
+        }
+
+    def summary(self) -> dict:
+        return {
+            "streamSid": self.sid, "duration_s": round(time.time() - self.started, 1),
+            "turns": self.turns, "answered": self.answered, "barge_ins": self.barge_ins,
+            "first_rtt_ms": self.first_rtt_ms,
+            "later_rtt_p50_ms": self._rtt.quantile(0.5), "later_rtt_p95_ms": self._rtt.quantile(0.95),
+            "gap_p50_ms": self._gap.quantile(0.5),
+            "barge_stop_max_ms": self._barge_max if self.barge_ins else None,
+            "ts": int(time.time() * 1000),
+        }
@@ -0,0 +1,93 @@
+# latency-measurement-scripts/measure/workers.py
+"""
+Multi-process mode for the meter (measure.py --workers N).
+
+N worker processes each run the full asyncio server on the same port with
+SO_REUSEPORT, so the kernel spreads incoming Twilio connections across them.
+The supervisor process only starts them, forwards SIGTERM and waits.
+
+Metrics are shared through small snapshot files in SHARD_DIR (tmpfs,
+/dev/shm, when available). Every SHARD_PUBLISH_S each worker atomically
+replaces its own measure-<port>-w<i>.json with the mergeable state of its
+sketches and counters. Whichever worker answers /metrics merges its live
+state with its peers' files, so every request gets the whole server's view,
+at most SHARD_PUBLISH_S old.
+"""
+import os
+import json
+import glob
+import time
+import signal
+import logging
+import tempfile
+import multiprocessing as mp
+from typing import Callable
+
+log = logging.getLogger("measure.workers")
+
+SHARD_DIR       = os.getenv("SHARD_DIR", "/dev/shm" if os.path.isdir("/dev/shm") else tempfile.gettempdir())
+SHARD_PUBLISH_S = float(os.getenv("SHARD_PUBLISH_S", "1.0"))
+SHARD_STALE_S   = float(os.getenv("SHARD_STALE_S", "10"))   # ignore snapshots of workers that stopped publishing
+
+
+def shard_path(port: int, worker: int) -> str:
+    return os.path.join(SHARD_DIR, f"measure-{port}-w{worker}.json")
+
+
+def publish(port: int, worker: int, snapshot: dict):
+    path = shard_path(port, worker)
+    tmp = f"{path}.{os.getpid()}.tmp"
+    with open(tmp, "w") as f:
+        json.dump(snapshot, f)
+    os.replace(tmp, path)  # readers never see a partial file
+
+
+def read_peers(port: int, worker: int) -> list[dict]:
+    """Snapshots published by the other workers on `port` (stale ones skipped)."""
+    out = []
+    now = time.time()
+    for path in glob.glob(os.path.join(SHARD_DIR, f"measure-{port}-w*.json")):
+        if path == shard_path(port, worker):
+            continue
+        try:
+            if now - os.path.getmtime(path) > SHARD_STALE_S:
+                continue
+            with open(path) as f:
+                out.append(json.load(f))
+        except (OSError, ValueError):
+            continue  # worker exiting or file being replaced
+    return out
+
+
+def clear(port: int):
+    for path in glob.glob(os.path.join(SHARD_DIR, f"measure-{port}-w*.json*")):
+        try:
+            os.unlink(path)
+        except OSError:
+            pass
+
+
+def supervise(n: int, port: int, target: Callable[[int], None]) -> int:
+    """Runs target(worker_index) in n processes; returns when all have exited."""
+    clear(port)
+    ctx = mp.get_context("spawn")   # workers start clean: no inherited loop or sockets
+    procs = [ctx.Process(target=target, args=(i,), name=f"measure-w{i}") for i in range(n)]
+    for p in procs:
+        p.start()
+    log.info("Started %d workers on port %d: pids %s", n, port, [p.pid for p in procs])
+
+    def _forward(sig, _frame):
+        for p in procs:
+            if p.is_alive():
+                os.kill(p.pid, sig)
+
+    # Ctrl-C already reaches every process in the group; SIGTERM is sent to us only
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    signal.signal(signal.SIGTERM, _forward)
+    code = 0
+    for p in procs:
+        p.join()
+        code = code or (p.exitcode or 0)
+    clear(port)
+    log.info("All workers stopped.")
+    return code
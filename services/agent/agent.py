@@ -1,9 +1,13 @@
 import os, asyncio, logging, time
+from typing import Optional
+
+import startup                      # first, so the startup profile sees the imports below
+from startup import PROFILE
 
 from pipecat.pipeline.pipeline import Pipeline
-from pipecat.pipeline.task import PipelineTask
+from pipecat.pipeline.task import PipelineTask, PipelineParams
 from pipecat.pipeline.runner import PipelineRunner
-from pipecat.frames.frames import TranscriptionFrame, TextFrame
+from pipecat.frames.frames import TranscriptionFrame, TextFrame, EndFrame
 
 from pipecat.processors.frame_processor import FrameProcessor
 try:
@@ -11,23 +15,39 @@ try:
 except ImportError:
     from pipecat.processors.frame_processor import Direction as FrameDirection
 
-from pipecat.transports.services.livekit import LiveKitTransport, LiveKitParams
+from pipecat.transports.services.livekit import LiveKitParams
+from pipecat.audio.vad.vad_analyzer import VADParams
 
-try:
-    from pipecat.audio.vad.silero import SileroVADAnalyzer
-    VAD = SileroVADAnalyzer()
-except Exception:
-    VAD = None
-# STT/TTS services
-from pipecat.services.deepgram.stt import DeepgramSTTService
-from pipecat.services.elevenlabs.tts import ElevenLabsTTSService
+import audio_profile
+from vad import room_vad, shared_vad, preload as preload_vad
+from prewarm import PrewarmDeepgramSTT, PrewarmElevenLabsTTS, PREWARM_ENABLED
+import tracing
+import speculative
+import tts_cache
+from tts_cache import CachedElevenLabsTTS, TTS_CACHE_ENABLED
+from speculative import SpeculativeReplier, SpeculationGate, SPECULATIVE_ENABLED
+import turn_detect
+from turn_detect import TurnDetector, TURN_DETECT_ENABLED, TURN_VAD_STOP_S
+import barge_in
+from barge_in import BargeIn, BARGE_IN_MIN_SPEECH_MS
+import health
 
 logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(name)s: %(message)s")
 log = logging.getLogger("agent")
 
-LIVEKIT_URL   = os.environ["LIVEKIT_URL"]
-LIVEKIT_TOKEN = os.environ["LIVEKIT_TOKEN"]
-ROOM_NAME     = os.environ["ROOM_NAME"]
+# AGENT_MODE=single: join ROOM_NAME with LIVEKIT_TOKEN from env (one task per call).
+# AGENT_MODE=pool:   load models, then wait on the control port for a room (warm pool).
+# AGENT_MODE=worker: like pool, but serve up to AGENT_MAX_ROOMS rooms concurrently.
+AGENT_MODE    = os.getenv("AGENT_MODE", "single").lower()
+
+LIVEKIT_URL   = os.getenv("LIVEKIT_URL", "")
+LIVEKIT_TOKEN = os.getenv("LIVEKIT_TOKEN", "")
+ROOM_NAME     = os.getenv("ROOM_NAME", "")
+
+AGENT_CONTROL_PORT   = int(os.getenv("AGENT_CONTROL_PORT", "8090"))
+AGENT_CONTROL_SECRET = os.getenv("AGENT_CONTROL_SECRET", "")
+AGENT_IDLE_TIMEOUT_S = float(os.getenv("AGENT_IDLE_TIMEOUT_S", "1800"))  # pool agent exits if never assigned
+AGENT_MAX_ROOMS      = int(os.getenv("AGENT_MAX_ROOMS", "8"))               # worker admission limit
 
 DEEPGRAM_API_KEY = os.environ["DEEPGRAM_API_KEY"]
 DG_MODEL         = os.getenv("DG_MODEL", "nova-3-general")
@@ -35,69 +55,217 @@ DG_MODEL         = os.getenv("DG_MODEL", "nova-3-general")
 ELEVEN_API_KEY   = os.environ["ELEVEN_API_KEY"]
 ELEVEN_VOICE_ID  = os.environ["ELEVEN_VOICE_ID"]
 
-try:
-    VAD = SileroVADAnalyzer()
-except Exception:
-    VAD = None  
+# Fixed up front so the STT/TTS sockets can be opened before the pipeline starts.
+# AUDIO_PROFILE=telephony runs both at TELEPHONY_SAMPLE_RATE, end to end (audio_profile.py)
+STT_SAMPLE_RATE  = int(os.getenv("STT_SAMPLE_RATE", str(audio_profile.IN_SAMPLE_RATE)))
+TTS_SAMPLE_RATE  = int(os.getenv("TTS_SAMPLE_RATE", str(audio_profile.OUT_SAMPLE_RATE)))
+
+PROFILE.mark("imports_done")
+# One Silero load per process, in the background: single mode joins the room meanwhile
+# (vad.DeferredVAD). start_secs is the barge-in guard: speech shorter than that never
+# interrupts the agent. With turn detection the VAD only reports the pause; TurnDetector
+# decides how long to wait.
+VAD_PARAMS = VADParams(start_secs=BARGE_IN_MIN_SPEECH_MS / 1000,
+                       **({"stop_secs": TURN_VAD_STOP_S} if TURN_DETECT_ENABLED else {}))
+preload_vad(VAD_PARAMS)
 
 class EchoLite(FrameProcessor):
+    @staticmethod
+    def reply(text: str) -> str:
+        # Simple "echo with twist" reply
+        return f"You said: {text}. Got it!"
+
     async def process_frame(self, frame, direction: FrameDirection):
         await super().process_frame(frame, direction)
         if isinstance(frame, TranscriptionFrame) and frame.text:
-            # Simple "echo with twist" reply
-            reply = f"You said: {frame.text}. Got it!"
-            await self.push_frame(TextFrame(reply), FrameDirection.DOWNSTREAM)
+            await self.push_frame(TextFrame(self.reply(frame.text)), FrameDirection.DOWNSTREAM)
         # Forwarding original frames
         await self.push_frame(frame, direction)
 
-async def main():
+def build_pipeline(transport, stt, tts, trace: Optional[tracing.CallTrace] = None,
+                   turns: Optional[TurnDetector] = None) -> Pipeline:
+    """The call pipeline shape, shared by run_room() and bench_pipeline.py."""
+    # Per-stage latency probes (see tracing.py); any stage boundary can take one
+    probe = trace.probe if trace is not None else (lambda: None)
+    return Pipeline([p for p in (
+        transport.input(),  # room → audio frames
+        stt,                # audio → TranscriptionFrame (streaming)
+        probe(),            # VAD start/end, interim + final transcripts
+        turns,              # holds finals until the caller's turn is over (TURN_DETECT_ENABLED)
+        # TranscriptionFrame → TextFrame; speculative mode starts on stable interims
+        SpeculativeReplier(EchoLite.reply) if SPECULATIVE_ENABLED else EchoLite(),
+        probe(),            # reply text
+        tts,                # TextFrame → AudioFrame (streaming)
+        SpeculationGate() if SPECULATIVE_ENABLED else None,  # holds speculative audio until the final
+        probe(),            # first TTS audio
+        transport.output(), # AudioFrame → room
+        probe(),            # first audio written to the room
+    ) if p is not None])
+
+async def run_room(room_name: str, livekit_url: str, livekit_token: str, vad=None):
+    """
+    Runs one call: joins `room_name` and serves it until the pipeline ends.
+    `vad` defaults to a fresh analyzer on the shared Silero model (vad.room_vad).
+    """
+    t_assigned = time.perf_counter()
+    PROFILE.mark("room_start")
 
-    transport = LiveKitTransport(
-        url=LIVEKIT_URL,
-        token=LIVEKIT_TOKEN,
-        room_name=ROOM_NAME,
+    transport = audio_profile.livekit_transport(
+        url=livekit_url,
+        token=livekit_token,
+        room_name=room_name,
         params=LiveKitParams(
             audio_in_enabled=True,
             audio_out_enabled=True,
-            vad_analyzer=VAD,    # enables better turn-taking
+            audio_in_sample_rate=STT_SAMPLE_RATE,   # transport, VAD and Deepgram share one rate
+            audio_out_sample_rate=TTS_SAMPLE_RATE,  # ElevenLabs renders what the room is sent
+            vad_analyzer=vad or room_vad(),    # enables better turn-taking
         ),
     )
 
     # Streaming STT (Deepgram)
-    stt = DeepgramSTTService(
+    stt = PrewarmDeepgramSTT(
         api_key=DEEPGRAM_API_KEY,
         model=DG_MODEL,
+        sample_rate=STT_SAMPLE_RATE,
         interim_results=True, 
         punctuation=True,
+        live_options=turn_detect.deepgram_options(DG_MODEL) if TURN_DETECT_ENABLED else None,
     )
+    turns = TurnDetector(room_name) if TURN_DETECT_ENABLED else None
+    if turns:
+        turns.attach(stt)   # Deepgram UtteranceEnd events
 
-    # Streaming TTS (ElevenLabs over WebSocket)
-    tts = ElevenLabsTTSService(
+    # Streaming TTS (ElevenLabs over WebSocket); fixed reply phrases come from the PCM cache
+    tts = (CachedElevenLabsTTS if TTS_CACHE_ENABLED else PrewarmElevenLabsTTS)(
         api_key=ELEVEN_API_KEY,
         voice_id=ELEVEN_VOICE_ID,
+        sample_rate=TTS_SAMPLE_RATE,
     )
+    if PREWARM_ENABLED:
+        # Vendor handshakes run while the pipeline joins the room
+        stt.prewarm()
+        tts.prewarm()
 
-    pipeline = Pipeline([
-        transport.input(),  # room → audio frames
-        stt,                # audio → TranscriptionFrame (streaming)
-        EchoLite(),         # TranscriptionFrame → TextFrame
-        tts,                # TextFrame → AudioFrame (streaming)
-        transport.output(), # AudioFrame → room
-    ])
+    # Caller speech cuts the agent off, including audio LiveKit has already queued
+    barge = BargeIn(room_name)
+    barge_in.install(transport, barge)
+
+    trace = tracing.CallTrace(room_name)
+    pipeline = build_pipeline(transport, stt, tts, trace if tracing.TRACE_ENABLED else None, turns)
+    call_health = health.watch(room_name, pipeline, transport)   # HEALTH_ENABLED: frame timing, audio late/drops
 
-    t0 = {"start": None}
-    @transport.event_handler("on_audio_track_subscribed")
-    async def _on_audio(_t, participant_id):
-        t0["start"] = time.perf_counter()
+    @transport.event_handler("on_connected")
+    async def _on_connected(*_):
+        PROFILE.mark("room_joined")
+        log.info("[prewarm] room=%s LiveKit join %.1f ms", room_name, (time.perf_counter() - t_assigned) * 1000)
 
-    @tts.event_handler("on_first_audio_chunk")
-    async def _on_first_tts_chunk(*_):
-        if t0["start"]:
-            log.info("[latency] user→tts-first ~%.1f ms", (time.perf_counter() - t0["start"]) * 1000)
+    task = PipelineTask(pipeline, params=PipelineParams(
+        audio_in_sample_rate=STT_SAMPLE_RATE,
+        audio_out_sample_rate=TTS_SAMPLE_RATE,
+        allow_interruptions=True,     # VAD speech start → StartInterruptionFrame (barge_in.py)
+    ))                                # manage lifecycle & events
 
-    task = PipelineTask(pipeline)     # manage lifecycle & events
+    # The pipeline only ends when told to: without these a worker holds the room's slot
+    # until PipelineTask's idle timeout, long after the controller has freed it
+    @transport.event_handler("on_participant_left")
+    async def _on_participant_left(_transport, participant_id, reason):
+        if not transport.get_participants():
+            log.info("Caller %s left room=%s (%s); ending the call", participant_id, room_name, reason)
+            await task.queue_frame(EndFrame())
+
+    @transport.event_handler("on_disconnected")
+    async def _on_disconnected(*_):
+        log.info("Disconnected from room=%s; ending the call", room_name)
+        await task.cancel()
+
+    if not PROFILE.reported:
+        startup.watch(task)           # pipeline start + first caller frame of a cold start
     runner = PipelineRunner()         # runs the task
-    await runner.run(task) 
+    try:
+        await runner.run(task)
+    finally:
+        trace.close()
+        barge.close()
+        health.MONITOR.unwatch(call_health)
+        await stt.discard_prewarm()
+        await tts.discard_prewarm()
+
+def _metrics() -> dict:
+    return {**tracing.snapshot(), "speculation": speculative.stats(), "tts_cache": tts_cache.stats(),
+            "turn_detect": turn_detect.stats(), "barge_in": barge_in.stats(), "health": health.stats(),
+            "startup": PROFILE.to_dict()}
+
+async def _ready(control):
+    await asyncio.to_thread(shared_vad)   # a pool agent is only ready once Silero is loaded
+    control.ready = True
+    PROFILE.mark("ready")
+    PROFILE.report()
+
+async def _serve_assignment(control: "ControlServer", a: "Assignment", vad=None):
+    log.info("Assigned room=%s (%d/%d rooms)", a.room, len(control.rooms), control.capacity)
+    try:
+        await run_room(a.room, a.url or LIVEKIT_URL, a.token, vad=vad)
+    except Exception:
+        log.exception("Room %s failed", a.room)
+    finally:
+        control.release(a.room)
+
+async def serve_pool():
+    """Pool mode: report ready on the control port, serve the first room assigned, then exit."""
+    from control import ControlServer   # only pool/worker serve the control port
+    control = ControlServer(port=AGENT_CONTROL_PORT, secret=AGENT_CONTROL_SECRET, capacity=1,
+                            metrics=_metrics, health=health.MONITOR.samples, profile=health.profile)
+    await control.start()
+    await _ready(control)
+    try:
+        a = await asyncio.wait_for(control.next_assignment(), timeout=AGENT_IDLE_TIMEOUT_S)
+    except asyncio.TimeoutError:
+        log.info("No room assigned within %.0fs; exiting", AGENT_IDLE_TIMEOUT_S)
+        await control.stop()
+        return
+    try:
+        await _serve_assignment(control, a)
+    finally:
+        await control.stop()
+
+async def serve_worker():
+    """
+    Worker mode: one process, one pipeline per room, up to AGENT_MAX_ROOMS at once.
+    Rooms share the interpreter, the pipecat imports and the Silero weights; each
+    keeps its own transport, STT/TTS streaming sockets and VAD state.
+    """
+    from control import ControlServer
+    control = ControlServer(port=AGENT_CONTROL_PORT, secret=AGENT_CONTROL_SECRET, capacity=AGENT_MAX_ROOMS,
+                            metrics=_metrics, health=health.MONITOR.samples, profile=health.profile)
+    await control.start()
+    await _ready(control)
+    running: set[asyncio.Task] = set()
+    try:
+        while True:
+            a = await control.next_assignment()
+            t = asyncio.create_task(_serve_assignment(control, a, vad=room_vad()), name=f"room-{a.room}")
+            running.add(t)
+            t.add_done_callback(running.discard)
+    finally:
+        control.ready = False
+        for t in running:
+            t.cancel()
+        await asyncio.gather(*running, return_exceptions=True)
+        await control.stop()
+
+async def main():
+    PROFILE.mode = AGENT_MODE
+    health.start()   # HEALTH_ENABLED monitor; SIGUSR1 logs a profile in every mode
+    if AGENT_MODE == "pool":
+        await serve_pool()
+        return
+    if AGENT_MODE == "worker":
+        await serve_worker()
+        return
+    if not (LIVEKIT_URL and LIVEKIT_TOKEN and ROOM_NAME):
+        raise RuntimeError("LIVEKIT_URL, LIVEKIT_TOKEN and ROOM_NAME are required in single mode")
+    await run_room(ROOM_NAME, LIVEKIT_URL, LIVEKIT_TOKEN)
 
 if __name__ == "__main__":
     asyncio.run(main())
@@ -0,0 +1,89 @@
+# services/agent/audio_profile.py
+"""
+Audio profiles: which sample rate each stage of the call pipeline runs at.
+
+    default    LiveKit delivers 48 kHz, pipecat resamples it (soxr, on the event
+               loop) to 16 kHz for VAD and Deepgram; ElevenLabs renders 24 kHz,
+               which LiveKit resamples to 48 kHz for Opus.
+    telephony  one rate, TELEPHONY_SAMPLE_RATE (8 kHz: PSTN narrowband through
+               LiveKit SIP), end to end: LiveKit's native audio stream decodes
+               straight to it, Silero runs its 8 kHz model, Deepgram gets
+               linear16 at that rate and ElevenLabs renders pcm_8000, which is
+               also the rate published back to the room. pipecat's own
+               resamplers see equal rates and pass frames through.
+
+Whatever conversion is still left in a transport (a frame at an unexpected
+rate) goes through resample.StreamResampler in the telephony profile. The
+per-call CPU of both profiles is compared by bench_audio.py.
+"""
+import os
+import logging
+
+from livekit import rtc
+from pipecat.transports.services.livekit import LiveKitTransport, LiveKitTransportClient
+
+from resample import StreamResampler
+
+log = logging.getLogger("agent.audio")
+
+AUDIO_PROFILE         = os.getenv("AUDIO_PROFILE", "default").lower()
+TELEPHONY_SAMPLE_RATE = int(os.getenv("TELEPHONY_SAMPLE_RATE", "8000"))   # 16000 for wideband SIP (G.722)
+
+# profile → (STT / transport in / VAD rate, TTS / transport out rate)
+SAMPLE_RATES = {
+    "default":   (16000, 24000),
+    "telephony": (TELEPHONY_SAMPLE_RATE, TELEPHONY_SAMPLE_RATE),
+}
+if AUDIO_PROFILE not in SAMPLE_RATES:
+    raise ValueError(f"AUDIO_PROFILE must be one of {', '.join(SAMPLE_RATES)}, not {AUDIO_PROFILE!r}")
+if TELEPHONY_SAMPLE_RATE not in (8000, 16000):
+    raise ValueError("TELEPHONY_SAMPLE_RATE must be 8000 or 16000 (the rates Silero VAD runs at)")
+
+TELEPHONY = AUDIO_PROFILE == "telephony"
+IN_SAMPLE_RATE, OUT_SAMPLE_RATE = SAMPLE_RATES[AUDIO_PROFILE]
+
+
+def use_stream_resampler(transport):
+    """Routes the transport's remaining rate conversions (input and output) through StreamResampler."""
+    inp, out = transport.input(), transport.output()
+    if hasattr(inp, "_resampler"):
+        inp._resampler = StreamResampler()
+    set_ready = out.set_transport_ready
+
+    async def _set_transport_ready(frame):
+        await set_ready(frame)   # creates the output's media senders
+        for sender in out._media_senders.values():
+            sender._resampler = StreamResampler()
+    out.set_transport_ready = _set_transport_ready
+    return transport
+
+
+class _NativeRateClient(LiveKitTransportClient):
+    """Subscribes to caller audio at the transport's input rate instead of LiveKit's 48 kHz default."""
+    async def _async_on_track_subscribed(self, track: rtc.Track, publication: rtc.RemoteTrackPublication,
+                                         participant: rtc.RemoteParticipant):
+        if track.kind != rtc.TrackKind.KIND_AUDIO:
+            return await super()._async_on_track_subscribed(track, publication, participant)
+        rate = self._params.audio_in_sample_rate or 48000
+        log.info("Audio track %s from %s subscribed at %d Hz", track.sid, participant.sid, rate)
+        self._audio_tracks[participant.sid] = track
+        # the Opus decode → `rate` conversion runs in LiveKit's native thread, not on the event loop
+        stream = rtc.AudioStream(track, sample_rate=rate, num_channels=1)
+        self._task_manager.create_task(self._process_audio_stream(stream, participant.sid),
+                                       f"{self}::_process_audio_stream")
+        await self._callbacks.on_audio_track_subscribed(participant.sid)
+
+
+class NativeRateLiveKitTransport(LiveKitTransport):
+    """LiveKitTransport whose caller audio arrives at params.audio_in_sample_rate."""
+    def __init__(self, url: str, token: str, room_name: str, params, **kwargs):
+        super().__init__(url, token, room_name, params, **kwargs)
+        c = self._client
+        self._client = _NativeRateClient(url, token, room_name, self._params, c._callbacks, c._transport_name)
+
+
+def livekit_transport(url: str, token: str, room_name: str, params):
+    """The room transport for AUDIO_PROFILE; params carry the profile's in/out rates."""
+    if not TELEPHONY:
+        return LiveKitTransport(url=url, token=token, room_name=room_name, params=params)
+    return use_stream_resampler(NativeRateLiveKitTransport(url, token, room_name, params))
@@ -0,0 +1,126 @@
+# services/agent/barge_in.py
+"""
+Barge-in: stop the agent's audio as soon as the caller talks over it.
+
+pipecat already interrupts when the VAD reports speech: the input transport
+pushes a StartInterruptionFrame ahead of all queued frames. Processors drop
+their pending TextFrames, ElevenLabs closes the websocket context that is
+still generating, and the output transport drops the audio chunks it has not
+written yet. What it leaves playing is LiveKit's AudioSource queue: up to a
+second of agent speech already captured by the native side. install() adds
+the missing step, and times it:
+
+    detect   StartInterruptionFrame leaves transport.input(); LiveKit's queue
+             is cleared right away (the fast path: the caller stops hearing the
+             agent before the frame has crossed the pipeline)
+    silent   transport.output() has handled the frame (its own queue and the
+             TTS generation are gone) and the LiveKit queue is cleared again
+             for anything written in between
+
+The guard against noise is the VAD's start_secs: BARGE_IN_MIN_SPEECH_MS of
+speech before the VAD reports it, and so before anything is cancelled.
+
+Each barge-in (the agent was speaking at detect) records:
+    cancel_ms   detect → silent, held to BARGE_IN_BUDGET_MS (over-budget
+                cancellations are counted and logged)
+    total_ms    caller speech onset (detect − guard) → silent
+plus the agent audio discarded from LiveKit's queue (flushed_ms). Per call in
+the "[barge-in]" log line, process-wide in stats() (served in /metrics).
+"""
+import os
+import time
+import logging
+from typing import Optional
+
+from pipecat.frames.frames import StartInterruptionFrame
+
+from tracing import LatencyHistogram
+
+log = logging.getLogger("agent.barge_in")
+
+BARGE_IN_MIN_SPEECH_MS = float(os.getenv("BARGE_IN_MIN_SPEECH_MS", "200"))   # VAD start_secs
+BARGE_IN_BUDGET_MS     = float(os.getenv("BARGE_IN_BUDGET_MS", "100"))       # detect → silent
+
+_stats = {"barge_ins": 0, "over_budget": 0, "quiet_interruptions": 0}
+CANCEL_MS = LatencyHistogram()
+TOTAL_MS = LatencyHistogram()
+FLUSHED_MS = LatencyHistogram()
+
+
+def stats() -> dict:
+    return {**_stats, "min_speech_ms": BARGE_IN_MIN_SPEECH_MS, "budget_ms": BARGE_IN_BUDGET_MS,
+            "cancel_ms": CANCEL_MS.to_dict(), "total_ms": TOTAL_MS.to_dict(), "flushed_ms": FLUSHED_MS.to_dict()}
+
+
+def _flush_playout(transport) -> float:
+    """Drops the audio LiveKit has queued but not sent; returns how much (ms)."""
+    source = getattr(getattr(transport, "_client", None), "_audio_source", None)
+    if source is None:
+        return 0.0
+    queued = source.queued_duration * 1000
+    try:
+        source.clear_queue()
+    except Exception as e:   # the room is already gone
+        log.debug("clear_queue failed: %s", e)
+        return 0.0
+    return queued
+
+
+class BargeIn:
+    """Per-call barge-in timing; see install()."""
+    def __init__(self, room: str, guard_ms: float = BARGE_IN_MIN_SPEECH_MS, budget_ms: float = BARGE_IN_BUDGET_MS):
+        self.room = room
+        self.guard_ms = guard_ms
+        self.budget_ms = budget_ms
+        self.cancel_ms = LatencyHistogram()
+        self.over_budget = 0
+        self._detected: Optional[float] = None
+        self._flushed_ms = 0.0
+
+    def detected(self, agent_speaking: bool, flushed_ms: float):
+        if not agent_speaking:
+            _stats["quiet_interruptions"] += 1   # nothing audible to cut: a reply in flight, or none
+            return
+        self._detected = time.perf_counter()
+        self._flushed_ms = flushed_ms
+
+    def silenced(self, flushed_ms: float):
+        if self._detected is None:
+            return
+        ms = (time.perf_counter() - self._detected) * 1000
+        self._detected = None
+        self.cancel_ms.record(ms)
+        CANCEL_MS.record(ms)
+        TOTAL_MS.record(self.guard_ms + ms)
+        FLUSHED_MS.record(self._flushed_ms + flushed_ms)
+        _stats["barge_ins"] += 1
+        if ms > self.budget_ms:
+            self.over_budget += 1
+            _stats["over_budget"] += 1
+            log.warning("[barge-in] room=%s cancel took %.1f ms (budget %.0f ms)", self.room, ms, self.budget_ms)
+
+    def close(self):
+        if self.cancel_ms.count:
+            log.info("[barge-in] room=%s n=%d cancel p50 %.1f ms max %.1f ms, speech→silent p50 ~%.1f ms, "
+                     "%d over budget", self.room, self.cancel_ms.count, self.cancel_ms.quantile(.5),
+                     self.cancel_ms.max_us / 1000, self.guard_ms + self.cancel_ms.quantile(.5), self.over_budget)
+
+
+def install(transport, barge: BargeIn):
+    """Hooks the transport's input and output for the barge-in fast path."""
+    inp, out = transport.input(), transport.output()
+    push_frame, process_frame = inp.push_frame, out.process_frame
+
+    async def _push_frame(frame, *args, **kwargs):
+        if isinstance(frame, StartInterruptionFrame):
+            barge.detected(getattr(inp, "_bot_speaking", False), _flush_playout(transport))
+        await push_frame(frame, *args, **kwargs)
+
+    async def _process_frame(frame, direction):
+        await process_frame(frame, direction)
+        if isinstance(frame, StartInterruptionFrame):
+            barge.silenced(_flush_playout(transport))
+
+    inp.push_frame = _push_frame
+    out.process_frame = _process_frame
+    return transport
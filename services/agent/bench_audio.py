@@ -0,0 +1,107 @@
+# services/agent/bench_audio.py
+"""
+CPU per call of the audio profiles (audio_profile.py), default vs. telephony.
+
+Each profile runs bench_pipeline.py in a fresh interpreter (the rates are read
+at import) on the same synthetic call, fed at --wire-rate like LiveKit feeds
+the transport. The default profile converts it with pipecat's soxr resampler
+and runs STT at 16 kHz / TTS at 24 kHz; the telephony profile converts with
+resample.StreamResampler and runs everything at TELEPHONY_SAMPLE_RATE. In
+production the telephony transport has LiveKit's native stream do that first
+conversion instead (--wire-rate 8000 leaves it out).
+
+It also times one 20 ms input frame through each resampler.
+
+    python bench_audio.py --concurrency 1,20
+    python bench_audio.py --concurrency 20 --wav call8k.wav --wire-rate 8000   # Silero VAD
+"""
+import os
+import sys
+import json
+import time
+import asyncio
+import argparse
+import tempfile
+import subprocess
+
+import numpy as np
+
+PROFILES = ("default", "telephony")
+FRAME_MS = 20
+
+
+def time_resamplers(wire_rate: int, n: int = 5000) -> dict:
+    from pipecat.audio.utils import create_stream_resampler
+    from resample import StreamResampler
+
+    t = np.arange(wire_rate * FRAME_MS // 1000) / wire_rate
+    frame = (8000 * np.sin(2 * np.pi * 440 * t)).astype(np.int16).tobytes()
+
+    async def _time(r, out_rate):
+        await r.resample(frame, wire_rate, out_rate)
+        t0 = time.perf_counter()
+        for _ in range(n):
+            await r.resample(frame, wire_rate, out_rate)
+        return round((time.perf_counter() - t0) / n * 1e6, 1)
+
+    async def _all():
+        return {"soxr → 16000": await _time(create_stream_resampler(), 16000),
+                "StreamResampler → 16000": await _time(StreamResampler(), 16000),
+                "soxr → 8000": await _time(create_stream_resampler(), 8000),
+                "StreamResampler → 8000": await _time(StreamResampler(), 8000)}
+    return asyncio.run(_all())
+
+
+def run_profile(profile: str, args) -> list[dict]:
+    with tempfile.NamedTemporaryFile(suffix=".json") as out:
+        cmd = [sys.executable, os.path.join(os.path.dirname(os.path.abspath(__file__)), "bench_pipeline.py"),
+               "--concurrency", args.concurrency, "--wire-rate", str(args.wire_rate), "--tail", str(args.tail),
+               "--json", out.name]
+        if args.wav:
+            cmd += ["--wav", args.wav]
+        env = {**os.environ, "AUDIO_PROFILE": profile}
+        for k in ("STT_SAMPLE_RATE", "TTS_SAMPLE_RATE"):
+            env.pop(k, None)
+        p = subprocess.run(cmd, env=env, capture_output=True, text=True)
+        if p.returncode:
+            sys.stderr.write(p.stdout[-2000:] + p.stderr[-3000:])
+            sys.exit(f"{profile}: bench_pipeline.py failed (exit {p.returncode})")
+        with open(out.name) as f:
+            return json.load(f)
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--concurrency", default="1,20", help="comma-separated pipeline counts")
+    ap.add_argument("--wire-rate", type=int, default=48000, help="rate the transport receives")
+    ap.add_argument("--tail", type=float, default=2.0)
+    ap.add_argument("--wav", default="", help="caller audio at --wire-rate (uses Silero VAD)")
+    ap.add_argument("--json", default="", help="write both profiles' results here")
+    args = ap.parse_args()
+    for k in ("DEEPGRAM_API_KEY", "ELEVEN_API_KEY", "ELEVEN_VOICE_ID"):
+        os.environ.setdefault(k, "bench")
+
+    print(f"one {FRAME_MS} ms frame at {args.wire_rate} Hz (µs):")
+    for name, us in time_resamplers(args.wire_rate).items():
+        print(f"   {name:<26} {us:>7}")
+
+    results = {p: run_profile(p, args) for p in PROFILES}
+    print(f"\n{'calls':>6} {'profile':<10} {'cpu ms/call-s':>14} {'rss MB/call':>12} {'lag p99':>8} "
+          f"{'e2e p50':>8} {'turns':>7}")
+    for i, n in enumerate(int(x) for x in args.concurrency.split(",") if x):
+        for p in PROFILES:
+            r = results[p][i]
+            print(f"{n:>6} {p:<10} {r['cpu_ms_per_call_s']:>14} {r['rss_mb_per_call']:>12} "
+                  f"{r['loop_lag_ms']['p99']:>8} {r['stages_ms']['e2e']['p50']!s:>8} {r['turns']:>7}"
+                  + ("  saturated" if r["saturated"] else ""))
+        d, t = results["default"][i]["cpu_ms_per_call_s"], results["telephony"][i]["cpu_ms_per_call_s"]
+        if d:
+            print(f"{'':>6} telephony uses {t / d:.0%} of the default profile's CPU per call")
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(results, f, indent=2)
+        print(f"\nwrote {args.json}")
+
+
+if __name__ == "__main__":
+    main()
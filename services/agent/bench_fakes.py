@@ -0,0 +1,304 @@
+# services/agent/bench_fakes.py
+"""
+Local stand-ins for LiveKit, Deepgram and ElevenLabs, used by bench_pipeline.py.
+
+FileTransport   input() plays a 16-bit mono WAV (or a synthetic one) into the
+                pipeline in real time, 20 ms per frame; output() plays the
+                agent's audio against a real-time clock like a device would,
+                and keeps it for inspection or a WAV dump. `join_s` stands in
+                for the LiveKit join (then "on_connected" fires, as in LiveKit).
+                With `wire_rate` the file is at that rate (LiveKit delivers
+                48 kHz by default) and input() converts it to the pipeline's
+                rate with its `_resampler`, like LiveKitInputTransport.
+FakeSTT         tracks speech energy in the audio it is given and emits
+                InterimTranscriptionFrames every `interim_every_ms` while the
+                caller talks, then a TranscriptionFrame `endpoint_ms` of
+                silence + a sampled finalization latency after speech ends.
+FakeTTS         streams PCM for the reply text after a sampled time-to-first-
+                byte, faster than real time by `rtf`.
+EnergyVAD       RMS-based VADAnalyzer for synthetic input (Silero needs speech).
+
+Latency models are (mean_ms, jitter_ms) pairs sampled from a normal
+distribution clipped at 0.
+"""
+import time
+import wave
+import random
+import asyncio
+from typing import AsyncGenerator, Optional
+
+import numpy as np
+
+from pipecat.audio.utils import create_stream_resampler
+from pipecat.audio.vad.vad_analyzer import VADAnalyzer, VADParams
+from pipecat.frames.frames import (
+    Frame, InputAudioRawFrame, InterimTranscriptionFrame, OutputAudioRawFrame, TranscriptionFrame,
+    TTSAudioRawFrame, TTSStartedFrame, TTSStoppedFrame,
+)
+from pipecat.services.stt_service import STTService
+from pipecat.services.tts_service import TTSService
+from pipecat.transports.base_input import BaseInputTransport
+from pipecat.transports.base_output import BaseOutputTransport
+from pipecat.transports.base_transport import BaseTransport, TransportParams
+from pipecat.utils.time import time_now_iso8601
+
+FRAME_MS = 20
+
+DEFAULT_SCRIPT = [
+    "what time does the store open tomorrow",
+    "can you move my appointment to friday",
+    "I would like to check my balance",
+    "thanks that is all for today",
+]
+
+
+def sample_ms(model: tuple[float, float], rng: random.Random) -> float:
+    mean, jitter = model
+    return max(0.0, rng.gauss(mean, jitter))
+
+
+def rms(pcm: bytes) -> float:
+    a = np.frombuffer(pcm, dtype="<i2").astype(np.float32) / 32768.0
+    return float(np.sqrt(np.mean(a * a))) if a.size else 0.0
+
+
+# -------------------------
+# Audio
+# -------------------------
+def synth_call(sample_rate: int, turns: int = 4, speech_s: float = 1.6, gap_s: float = 4.0,
+               lead_s: float = 0.5, seed: int = 0) -> bytes:
+    """Speech-like PCM16: syllable-rate modulated harmonics, `turns` utterances separated by `gap_s`."""
+    rng = np.random.default_rng(seed)
+    parts = [np.zeros(int(lead_s * sample_rate), dtype=np.float32)]
+    for _ in range(turns):
+        t = np.arange(int(speech_s * sample_rate)) / sample_rate
+        f0 = 120 + 40 * rng.random()
+        voice = sum(np.sin(2 * np.pi * f0 * k * t) / k for k in range(1, 6))
+        envelope = (0.75 - 0.25 * np.cos(2 * np.pi * 4.0 * t)) * np.minimum(1.0, np.minimum(t, t[-1] - t) * 20)
+        parts.append((0.3 * voice * envelope + 0.002 * rng.standard_normal(t.size)).astype(np.float32))
+        parts.append((0.002 * rng.standard_normal(int(gap_s * sample_rate))).astype(np.float32))
+    audio = np.concatenate(parts)
+    return (np.clip(audio, -1, 1) * 32767).astype("<i2").tobytes()
+
+
+def read_wav(path: str, sample_rate: int) -> bytes:
+    with wave.open(path, "rb") as w:
+        if w.getsampwidth() != 2 or w.getnchannels() != 1 or w.getframerate() != sample_rate:
+            raise ValueError(f"{path}: need 16-bit mono {sample_rate} Hz, got {w.getsampwidth() * 8}-bit "
+                             f"{w.getnchannels()}ch {w.getframerate()} Hz")
+        return w.readframes(w.getnframes())
+
+
+def write_wav(path: str, pcm: bytes, sample_rate: int):
+    with wave.open(path, "wb") as w:
+        w.setnchannels(1)
+        w.setsampwidth(2)
+        w.setframerate(sample_rate)
+        w.writeframes(pcm)
+
+
+class EnergyVAD(VADAnalyzer):
+    """VADAnalyzer on plain RMS: cheap, and works on synthetic audio."""
+    def __init__(self, threshold: float = 0.02, **kwargs):
+        super().__init__(params=kwargs.pop("params", None) or VADParams(), **kwargs)
+        self.threshold = threshold
+
+    def num_frames_required(self) -> int:
+        return int(self.sample_rate * 0.02) if self.sample_rate else 320
+
+    def voice_confidence(self, buffer) -> float:
+        return min(1.0, rms(buffer) / (2 * self.threshold))
+
+
+# -------------------------
+# Transport
+# -------------------------
+class FileInputTransport(BaseInputTransport):
+    def __init__(self, transport: "FileTransport", params: TransportParams, **kwargs):
+        super().__init__(params, **kwargs)
+        self._transport = transport
+        self._task: Optional[asyncio.Task] = None
+        self._resampler = create_stream_resampler()
+
+    async def start(self, frame):
+        await super().start(frame)
+        if self._transport.join_s:
+            await asyncio.sleep(self._transport.join_s)
+        await self._transport.connected()
+        await self.set_transport_ready(frame)
+        self._task = self.create_task(self._play())
+
+    async def stop(self, frame):
+        await self._stop_playing()
+        await super().stop(frame)
+
+    async def cancel(self, frame):
+        await self._stop_playing()
+        await super().cancel(frame)
+
+    async def _stop_playing(self):
+        # Stop feeding and empty the VAD task's queue before the base class cancels
+        # it: that task reads through asyncio.wait_for, which on Python 3.11 drops a
+        # cancel landing as a queued frame is handed over, and the pipeline then never
+        # finishes. With nothing queued it is parked on a pending get(), which cancels.
+        if self._task:
+            await self.cancel_task(self._task)
+            self._task = None
+        queue = getattr(self, "_audio_in_queue", None)
+        for _ in range(2 if queue is not None else 0):
+            while not queue.empty():
+                queue.get_nowait()
+                queue.task_done()
+            await asyncio.sleep(FRAME_MS / 1000)  # let it finish the frame it holds
+
+    async def _play(self):
+        pcm, rate = self._transport.pcm, self.sample_rate
+        wire = self._transport.wire_rate or rate
+        step = wire * FRAME_MS // 1000 * 2
+        frames = len(pcm) // step
+        silence = bytes(step)
+        t0 = time.perf_counter()
+        n = 0
+        while True:
+            # a live line keeps delivering (silent) frames after the caller's audio ends
+            chunk = pcm[n * step:(n + 1) * step] if n < frames else silence
+            chunk = await self._resampler.resample(chunk, wire, rate)
+            await self.push_audio_frame(InputAudioRawFrame(chunk, rate, 1))
+            n += 1
+            if n == frames:
+                self._transport.input_done.set()
+            delay = t0 + n * FRAME_MS / 1000 - time.perf_counter()
+            if delay > 0:
+                await asyncio.sleep(delay)
+
+
+class FileOutputTransport(BaseOutputTransport):
+    def __init__(self, transport: "FileTransport", params: TransportParams, **kwargs):
+        super().__init__(params, **kwargs)
+        self._transport = transport
+        self._play_until = 0.0
+
+    async def start(self, frame):
+        await super().start(frame)
+        await self.set_transport_ready(frame)
+
+    async def write_audio_frame(self, frame: OutputAudioRawFrame):
+        # a sound card consumes audio in real time: block until this chunk would have played
+        now = time.perf_counter()
+        self._play_until = max(self._play_until, now) + len(frame.audio) / 2 / frame.sample_rate
+        self._transport.out.extend(frame.audio)
+        ahead = self._play_until - now - len(frame.audio) / 2 / frame.sample_rate
+        if ahead > 0:
+            await asyncio.sleep(ahead)
+
+
+class FileTransport(BaseTransport):
+    def __init__(self, pcm: bytes, params: TransportParams, join_s: float = 0.0, wire_rate: int = 0, **kwargs):
+        super().__init__(**kwargs)
+        self.pcm = pcm
+        self.join_s = join_s
+        self.wire_rate = wire_rate
+        self.out = bytearray()
+        self.input_done = asyncio.Event()
+        self._params = params
+        self._input = FileInputTransport(self, params, name=self._input_name)
+        self._output = FileOutputTransport(self, params, name=self._output_name)
+        self._register_event_handler("on_connected")
+
+    async def connected(self):
+        await self._call_event_handler("on_connected")
+
+    def input(self) -> FileInputTransport:
+        return self._input
+
+    def output(self) -> FileOutputTransport:
+        return self._output
+
+
+# -------------------------
+# STT / TTS
+# -------------------------
+class FakeSTT(STTService):
+    def __init__(self, *, script: list[str] = DEFAULT_SCRIPT, interim_ms: tuple[float, float] = (150, 40),
+                 final_ms: tuple[float, float] = (250, 80), endpoint_ms: float = 300, interim_every_ms: float = 250,
+                 words_per_s: float = 3.0, threshold: float = 0.02, seed: Optional[int] = None, **kwargs):
+        super().__init__(**kwargs)
+        self.script = script
+        self.interim_ms = interim_ms
+        self.final_ms = final_ms
+        self.endpoint_s = endpoint_ms / 1000
+        self.interim_every_s = interim_every_ms / 1000
+        self.words_per_s = words_per_s
+        self.threshold = threshold
+        self._rng = random.Random(seed)
+        self._utt = 0
+        self._speaking = False
+        self._started = 0.0
+        self._last_loud = 0.0
+        self._interims: Optional[asyncio.Task] = None
+
+    def can_generate_metrics(self) -> bool:
+        return True
+
+    async def run_stt(self, audio: bytes) -> AsyncGenerator[Frame, None]:
+        now = time.perf_counter()
+        if rms(audio) > self.threshold:
+            self._last_loud = now
+            if not self._speaking:
+                self._speaking = True
+                self._started = now
+                self._interims = self.create_task(self._interim_loop(self._text()))
+        elif self._speaking and now - self._last_loud >= self.endpoint_s:
+            self._speaking = False
+            if self._interims:
+                await self.cancel_task(self._interims)
+                self._interims = None
+            self.create_task(self._finalize(self._text()))
+            self._utt += 1
+        yield None
+
+    def _text(self) -> str:
+        return self.script[self._utt % len(self.script)]
+
+    async def _interim_loop(self, text: str):
+        words = text.split()
+        while True:
+            await asyncio.sleep(self.interim_every_s)
+            heard = max(1, int((time.perf_counter() - self._started) * self.words_per_s))
+            await asyncio.sleep(sample_ms(self.interim_ms, self._rng) / 1000)
+            await self.push_frame(InterimTranscriptionFrame(" ".join(words[:heard]), "", time_now_iso8601()))
+
+    async def _finalize(self, text: str):
+        await asyncio.sleep(sample_ms(self.final_ms, self._rng) / 1000)
+        await self.push_frame(TranscriptionFrame(text + ".", "", time_now_iso8601()))
+
+
+class FakeTTS(TTSService):
+    def __init__(self, *, ttfb_ms: tuple[float, float] = (180, 50), chunk_ms: int = 40, rtf: float = 0.25,
+                 ms_per_char: float = 60.0, seed: Optional[int] = None, **kwargs):
+        # replies arrive as whole TextFrames; skip the NLTK sentence splitter
+        kwargs.setdefault("aggregate_sentences", False)
+        super().__init__(**kwargs)
+        self.ttfb_ms = ttfb_ms
+        self.chunk_ms = chunk_ms
+        self.rtf = rtf
+        self.ms_per_char = ms_per_char
+        self._rng = random.Random(seed)
+
+    def can_generate_metrics(self) -> bool:
+        return True
+
+    async def run_tts(self, text: str) -> AsyncGenerator[Frame, None]:
+        await self.start_ttfb_metrics()
+        yield TTSStartedFrame()
+        await asyncio.sleep(sample_ms(self.ttfb_ms, self._rng) / 1000)
+        await self.stop_ttfb_metrics()
+        rate = self.sample_rate
+        n = int(len(text) * self.ms_per_char / 1000 * rate)
+        t = np.arange(n) / rate
+        pcm = (0.2 * np.sin(2 * np.pi * 220 * t) * 32767).astype("<i2").tobytes()
+        step = rate * self.chunk_ms // 1000 * 2
+        for i in range(0, len(pcm), step):
+            yield TTSAudioRawFrame(pcm[i:i + step], rate, 1)
+            await asyncio.sleep(self.chunk_ms / 1000 * self.rtf)
+        yield TTSStoppedFrame()
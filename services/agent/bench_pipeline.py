@@ -0,0 +1,326 @@
+# services/agent/bench_pipeline.py
+"""
+Offline end-to-end benchmark of the agent pipeline.
+
+Builds the exact pipeline shape run_room() uses (agent.build_pipeline: probes,
+EchoLite or the speculative pair, the gate) but with the network replaced by
+bench_fakes: a FileTransport that plays a WAV in real time, and FakeSTT /
+FakeTTS with configurable latency models. No LiveKit, Deepgram or ElevenLabs
+account is needed, so it runs in CI or on a laptop and isolates what the
+process itself costs per call.
+
+For each concurrency level it starts N pipelines (staggered over --stagger
+seconds), lets each play the input plus --tail seconds, and reports:
+
+    stage p50/p95/p99    from each call's tracing.CallTrace, merged
+    cpu ms / call-s      process CPU time (user+sys) per second of call audio
+    rss MB / call        peak RSS growth over the idle baseline, divided by N
+    loop lag p99         event-loop scheduling delay while the calls run
+
+Stage latencies include the fakes' modelled vendor delays; compare runs with
+the same --stt-*/--tts-* settings. Input is synthetic speech-like audio with an
+energy VAD unless --wav is given (16-bit mono at the input rate), in which
+case the agent's Silero VAD is used. --wire-rate feeds the input at that rate
+(48000: what LiveKit delivers by default) and has the transport resample it,
+with resample.StreamResampler under AUDIO_PROFILE=telephony; bench_audio.py
+compares the profiles.
+
+    python bench_pipeline.py --concurrency 1,10,50,100
+    SPECULATIVE_ENABLED=1 python bench_pipeline.py --concurrency 10 --json out.json
+    python bench_pipeline.py --concurrency 10 --turn-detect       # adds decisions / false endpoints
+    python bench_pipeline.py --concurrency 10 --gap 1.0           # caller talks over replies: barge-ins
+    python bench_pipeline.py --concurrency 1,20 --health          # health.py windows: lag, frame times, late audio
+"""
+import os
+import sys
+import json
+import time
+import asyncio
+import logging
+import argparse
+import resource
+from typing import Optional
+
+# agent.py reads these at import; the fakes never use them
+for _k in ("DEEPGRAM_API_KEY", "ELEVEN_API_KEY", "ELEVEN_VOICE_ID"):
+    os.environ.setdefault(_k, "bench")
+
+from loguru import logger
+from pipecat.audio.vad.vad_analyzer import VADParams
+from pipecat.pipeline.task import PipelineTask, PipelineParams
+from pipecat.pipeline.runner import PipelineRunner
+from pipecat.transports.base_transport import TransportParams
+
+import agent
+import tracing
+import health
+import barge_in
+import audio_profile
+from barge_in import BargeIn, BARGE_IN_MIN_SPEECH_MS
+from turn_detect import TurnDetector
+from vad import room_vad
+from bench_fakes import FakeSTT, FakeTTS, FileTransport, EnergyVAD, synth_call, read_wav, write_wav
+
+HANGUP_TIMEOUT_S = 5.0
+PAGE_MB = os.sysconf("SC_PAGE_SIZE") / 2**20
+
+
+def rss_mb() -> float:
+    with open("/proc/self/statm") as f:
+        return int(f.read().split()[1]) * PAGE_MB
+
+
+def cpu_s() -> float:
+    r = resource.getrusage(resource.RUSAGE_SELF)
+    return r.ru_utime + r.ru_stime
+
+
+def model(s: str) -> tuple[float, float]:
+    """"180" or "180:50" → (mean_ms, jitter_ms)"""
+    mean, _, jitter = s.partition(":")
+    return float(mean), float(jitter or 0)
+
+
+# -------------------------
+# One call
+# -------------------------
+async def run_call(name: str, pcm: bytes, args, seed: int) -> tuple[tracing.CallTrace, bool, Optional[TurnDetector], BargeIn]:
+    vad = room_vad() if args.wav else EnergyVAD(params=VADParams(start_secs=BARGE_IN_MIN_SPEECH_MS / 1000,
+                                                                 stop_secs=args.vad_stop))
+    transport = FileTransport(pcm, TransportParams(audio_in_enabled=True, audio_out_enabled=True, vad_analyzer=vad),
+                              wire_rate=args.wire_rate)
+    if audio_profile.TELEPHONY:
+        audio_profile.use_stream_resampler(transport)
+    barge = BargeIn(name)
+    barge_in.install(transport, barge)
+    stt = FakeSTT(sample_rate=agent.STT_SAMPLE_RATE, interim_ms=args.stt_interim, final_ms=args.stt_final,
+                  endpoint_ms=args.stt_endpoint, seed=seed)
+    tts = FakeTTS(sample_rate=agent.TTS_SAMPLE_RATE, ttfb_ms=args.tts_ttfb, rtf=args.tts_rtf, seed=seed)
+    trace = tracing.CallTrace(name, jsonl_path="")
+    turns = TurnDetector(name) if args.turn_detect else None
+    pipeline = agent.build_pipeline(transport, stt, tts, trace, turns)
+    call_health = health.MONITOR.watch(name, pipeline, transport) if args.health else None
+    task = PipelineTask(pipeline, params=PipelineParams(
+        audio_in_sample_rate=agent.STT_SAMPLE_RATE,
+        audio_out_sample_rate=agent.TTS_SAMPLE_RATE,
+        allow_interruptions=True,
+    ), check_dangling_tasks=False)
+
+    run = asyncio.create_task(PipelineRunner(handle_sigint=False).run(task))
+    hung = False
+
+    async def _hangup():
+        nonlocal hung
+        await transport.input_done.wait()
+        await asyncio.sleep(args.tail)
+        try:
+            # the caller hangs up, possibly mid-reply
+            await asyncio.wait_for(task.cancel(), HANGUP_TIMEOUT_S)
+        except asyncio.TimeoutError:
+            # a pipeline that ignores the hangup (see FileInputTransport._stop_playing)
+            # would leak its room in the agent; counted, then torn down
+            hung = True
+            run.cancel()
+
+    hangup = asyncio.create_task(_hangup())
+    try:
+        await run
+    except asyncio.CancelledError:
+        if not hung:
+            raise
+    finally:
+        hangup.cancel()
+        trace.close()
+        barge.close()
+        health.MONITOR.unwatch(call_health)
+    if args.out_wav and seed == 0:
+        write_wav(args.out_wav, bytes(transport.out), agent.TTS_SAMPLE_RATE)
+    return trace, hung, turns, barge
+
+
+# -------------------------
+# One concurrency level
+# -------------------------
+async def run_level(n: int, pcm: bytes, args) -> dict:
+    call_s = len(pcm) / 2 / in_rate(args) + args.tail
+    lag = tracing.LatencyHistogram()
+    peak = [rss_mb()]
+    done = asyncio.Event()
+
+    async def _monitor():
+        period = 0.05
+        while not done.is_set():
+            t = time.perf_counter()
+            await asyncio.sleep(period)
+            lag.record(max(0.0, (time.perf_counter() - t - period) * 1000))
+            peak[0] = max(peak[0], rss_mb())
+
+    async def _call(i: int):
+        await asyncio.sleep(args.stagger * i / n)
+        return await run_call(f"bench-{n}-{i}", pcm, args, seed=i)
+
+    if args.health:
+        health.MONITOR.interval_s = 1.0
+        health.MONITOR.ring.clear()
+        health.MONITOR.start()
+    base_rss, c0, t0 = rss_mb(), cpu_s(), time.perf_counter()
+    monitor = asyncio.create_task(_monitor())
+    calls = await asyncio.gather(*(_call(i) for i in range(n)))
+    await health.MONITOR.stop()
+    traces = [c[0] for c in calls]
+    detectors = [c[2] for c in calls if c[2]]
+    done.set()
+    await monitor
+    wall, cpu = time.perf_counter() - t0, cpu_s() - c0
+
+    stages = {s: tracing.LatencyHistogram() for s in tracing.STAGES}
+    for t in traces:
+        for s, h in t.stages.items():
+            stages[s].merge(h)
+    decide = tracing.LatencyHistogram()
+    for d in detectors:
+        decide.merge(d.decide_ms)
+    cancel = tracing.LatencyHistogram()
+    for c in calls:
+        cancel.merge(c[3].cancel_ms)
+    return {
+        "concurrency": n,
+        "wall_s": round(wall, 2),
+        "call_s": round(call_s, 2),
+        "turns": sum(len(t.turns) for t in traces),
+        "expected_turns": None if args.wav else n * args.turns,
+        "incomplete_turns": sum(t.incomplete for t in traces),
+        "hung_hangups": sum(c[1] for c in calls),
+        "cpu_ms_per_call_s": round(cpu * 1000 / (n * call_s), 2),
+        "cpu_util": round(cpu / wall, 3),
+        # one event loop: saturated at one core, whatever the machine has
+        "saturated": cpu / wall >= 0.9 or (lag.quantile(0.99) or 0) > 100,
+        "rss_mb_per_call": round(max(0.0, peak[0] - base_rss) / n, 2),
+        "rss_peak_mb": round(peak[0], 1),
+        "loop_lag_ms": lag.to_dict(),
+        "stages_ms": {s: h.to_dict() for s, h in stages.items()},
+        "turn_detect": {
+            "decisions": sum(d.decisions for d in detectors),
+            "false_endpoints": sum(d.false_endpoints for d in detectors),
+            "decide_ms": decide.to_dict(),
+        } if detectors else None,
+        "health": health_summary(health.MONITOR.samples()) if args.health else None,
+        "barge_in": {
+            "barge_ins": cancel.count,
+            "over_budget": sum(c[3].over_budget for c in calls),
+            "cancel_ms": cancel.to_dict(),
+        },
+    }
+
+
+def health_summary(samples: list[dict]) -> dict:
+    """The level's health windows folded together: worst lag and frame times, summed audio counters."""
+    procs: dict[str, dict] = {}
+    for w in samples:
+        for k, p in w["processors"].items():
+            a = procs.setdefault(k, {"frames": 0, "p99": 0.0, "max": 0.0, "queue_max": 0})
+            a["frames"] += p["frames"]
+            a["p99"] = max(a["p99"], p["p99"] or 0)
+            a["max"] = max(a["max"], p["max"] or 0)
+            a["queue_max"] = max(a["queue_max"], p["queue_max"])
+    audio = {k: 0 for k in samples[0]["audio"]} if samples else {}
+    for w in samples:
+        for k, v in w["audio"].items():
+            audio[k] = max(audio[k], v) if k == "in_backlog_ms" else round(audio[k] + v, 1)
+    return {
+        "windows": len(samples),
+        "loop_lag_p99_ms": max((w["loop_lag_ms"]["p99"] or 0 for w in samples), default=None),
+        "loop_lag_max_ms": max((w["loop_lag_ms"]["max"] or 0 for w in samples), default=None),
+        "cpu": max((w["cpu"] for w in samples), default=None),
+        "processors": procs,
+        "audio": audio,
+    }
+
+
+def print_level(r: dict):
+    expected = f"/{r['expected_turns']}" if r["expected_turns"] is not None else ""
+    print(f"\n== {r['concurrency']} concurrent pipelines: {r['turns']}{expected} turns "
+          f"({r['incomplete_turns']} incomplete), {r['hung_hangups']} hung hangups, wall {r['wall_s']} s"
+          + ("  [CPU SATURATED: latencies are queueing]" if r["saturated"] else ""))
+    print(f"   cpu {r['cpu_ms_per_call_s']} ms per call-second (process util {r['cpu_util']:.0%}), "
+          f"rss +{r['rss_mb_per_call']} MB per call (peak {r['rss_peak_mb']} MB), "
+          f"loop lag p99 {r['loop_lag_ms']['p99']} ms")
+    print(f"   {'stage':<12} {'n':>5} {'p50':>8} {'p95':>8} {'p99':>8} {'max':>8}")
+    for s, d in r["stages_ms"].items():
+        print(f"   {s:<12} {d['n']:>5} " + " ".join(f"{'-' if d[k] is None else d[k]:>8}"
+                                                for k in ("p50", "p95", "p99", "max")))
+    td = r["turn_detect"]
+    if td:
+        d = td["decide_ms"]
+        print(f"   turn detect: {td['decisions']} decisions, {td['false_endpoints']} false endpoints, "
+              f"silence waited p50 {d['p50']} p95 {d['p95']} ms")
+    h = r["health"]
+    if h:
+        print(f"   health ({h['windows']} windows): loop lag p99 {h['loop_lag_p99_ms']} max {h['loop_lag_max_ms']} ms, "
+              f"cpu {h['cpu']}, audio {h['audio']}")
+        print(f"   {'processor':<28} {'frames':>7} {'p99 ms':>8} {'max ms':>8} {'queue':>6}")
+        for k, p in h["processors"].items():
+            print(f"   {k:<28} {p['frames']:>7} {p['p99']:>8} {p['max']:>8} {p['queue_max']:>6}")
+    b = r["barge_in"]
+    if b["barge_ins"]:
+        c = b["cancel_ms"]
+        print(f"   barge-in: {b['barge_ins']} cancellations, detect→silent p50 {c['p50']} p99 {c['p99']} "
+              f"max {c['max']} ms, {b['over_budget']} over the {barge_in.BARGE_IN_BUDGET_MS:g} ms budget")
+
+
+def in_rate(args) -> int:
+    return args.wire_rate or agent.STT_SAMPLE_RATE
+
+
+async def main(args):
+    if args.wav:
+        pcm = read_wav(args.wav, in_rate(args))
+    else:
+        pcm = synth_call(in_rate(args), turns=args.turns, gap_s=args.gap)
+    print(f"input {len(pcm) / 2 / in_rate(args):.1f} s at {in_rate(args)} Hz, profile={audio_profile.AUDIO_PROFILE} "
+          f"(stt {agent.STT_SAMPLE_RATE} Hz, tts {agent.TTS_SAMPLE_RATE} Hz), speculative={agent.SPECULATIVE_ENABLED}, "
+          f"turn_detect={args.turn_detect}, vad={'silero' if args.wav else 'energy'}")
+    results = []
+    for n in args.concurrency:
+        r = await run_level(n, pcm, args)
+        print_level(r)
+        results.append(r)
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(results, f, indent=2)
+        print(f"\nwrote {args.json}")
+
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--concurrency", default="1,10,50,100", help="comma-separated pipeline counts")
+    ap.add_argument("--wav", default="", help="caller audio (16-bit mono at the input rate); default synthetic")
+    ap.add_argument("--wire-rate", type=int, default=0, help="input audio rate, resampled by the transport "
+                                                             "(default: STT_SAMPLE_RATE, no conversion)")
+    ap.add_argument("--turns", type=int, default=4, help="synthetic input: utterances per call")
+    ap.add_argument("--gap", type=float, default=4.0, help="synthetic input: silence between utterances, s "
+                                                           "(under ~2 s the caller talks over the replies)")
+    ap.add_argument("--tail", type=float, default=2.0, help="seconds to keep the call up after the input ends")
+    ap.add_argument("--stagger", type=float, default=1.0, help="spread call starts over this many seconds")
+    ap.add_argument("--vad-stop", type=float, default=0.2, help="energy VAD: silence before user-stopped, s")
+    ap.add_argument("--turn-detect", action="store_true", help="put a TurnDetector after STT (see turn_detect.py)")
+    ap.add_argument("--stt-interim", type=model, default="150:40", help="interim latency mean[:jitter] ms")
+    ap.add_argument("--stt-final", type=model, default="250:80", help="final latency after endpoint, ms")
+    ap.add_argument("--stt-endpoint", type=float, default=300, help="silence before the final, ms")
+    ap.add_argument("--tts-ttfb", type=model, default="180:50", help="time to first audio mean[:jitter] ms")
+    ap.add_argument("--tts-rtf", type=float, default=0.25, help="synthesis time / audio time")
+    ap.add_argument("--health", action="store_true", help="watch each call with health.py (1 s windows)")
+    ap.add_argument("--out-wav", default="", help="write the first call's agent audio here")
+    ap.add_argument("--json", default="", help="write the results here")
+    ap.add_argument("--log-level", default="WARNING", help="pipecat and agent log level")
+    a = ap.parse_args()
+    a.concurrency = [int(x) for x in a.concurrency.split(",") if x]
+    # pipecat logs every frame event at DEBUG and the tracer logs every turn: at 100 calls
+    # that is a benchmark of the log sink
+    logger.remove()
+    logger.add(sys.stderr, level=a.log_level)
+    logging.getLogger("agent").setLevel(a.log_level)
+    try:
+        asyncio.run(main(a))
+    except KeyboardInterrupt:
+        sys.exit(130)
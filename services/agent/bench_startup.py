@@ -0,0 +1,132 @@
+# services/agent/bench_startup.py
+"""
+Cold-start benchmark of the agent process.
+
+Each run is a fresh interpreter that goes down the single-mode path: import
+agent (pipecat, LiveKit, Deepgram, ElevenLabs, Silero in the background), then
+run_room()'s pipeline on bench_fakes. The FileTransport's `--join-ms` stands
+in for the LiveKit join, and the run ends at the first caller audio frame.
+The startup profile (startup.py) of every run is collected and reported per
+phase:
+
+    interpreter   exec → agent.py
+    imports       agent.py's imports
+    vad_load      Silero ONNX load (background thread)
+    vad_wait      how long the first frame waited for it (0: hidden behind the join)
+    room_join     room start → on_connected
+    first_frame   room start → first caller frame through the pipeline
+    total         exec → first frame
+
+With --budget-ms it exits non-zero when the median total exceeds the budget,
+so CI can guard the startup path.
+
+    python bench_startup.py --runs 5
+    python bench_startup.py --runs 5 --join-ms 0 --budget-ms 4000
+"""
+import os
+import sys
+import json
+import math
+import argparse
+import subprocess
+
+PREFIX = "STARTUP "
+
+
+def child(args):
+    import agent    # first: this is what the profile times
+    import asyncio
+    from pipecat.pipeline.task import PipelineTask, PipelineParams
+    from pipecat.pipeline.runner import PipelineRunner
+    from pipecat.transports.base_transport import TransportParams
+
+    import startup
+    from vad import room_vad
+    from bench_fakes import FakeSTT, FakeTTS, FileTransport, synth_call
+
+    async def _run():
+        startup.PROFILE.mode = "bench"
+        startup.PROFILE.mark("room_start")
+        pcm = synth_call(agent.STT_SAMPLE_RATE, turns=1)
+        transport = FileTransport(pcm, TransportParams(audio_in_enabled=True, audio_out_enabled=True,
+                                                       vad_analyzer=room_vad()), join_s=args.join_ms / 1000)
+
+        @transport.event_handler("on_connected")
+        async def _on_connected(*_):
+            startup.PROFILE.mark("room_joined")
+
+        pipeline = agent.build_pipeline(transport, FakeSTT(sample_rate=agent.STT_SAMPLE_RATE),
+                                        FakeTTS(sample_rate=agent.TTS_SAMPLE_RATE))
+        task = PipelineTask(pipeline, params=PipelineParams(
+            audio_in_sample_rate=agent.STT_SAMPLE_RATE,
+            audio_out_sample_rate=agent.TTS_SAMPLE_RATE,
+        ), check_dangling_tasks=False)
+        startup.watch(task)
+        run = asyncio.create_task(PipelineRunner(handle_sigint=False).run(task))
+        for _ in range(int(args.timeout * 100)):
+            if startup.PROFILE.reported:
+                break
+            await asyncio.sleep(0.01)
+        try:
+            await asyncio.wait_for(task.cancel(), 5)
+        except asyncio.TimeoutError:
+            run.cancel()
+        await asyncio.gather(run, return_exceptions=True)
+
+    asyncio.run(_run())
+    print(PREFIX + json.dumps(startup.PROFILE.to_dict()), flush=True)
+
+
+def pct(values: list[float], q: float) -> float:
+    s = sorted(values)
+    return s[min(len(s) - 1, max(0, math.ceil(q * len(s)) - 1))]
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--runs", type=int, default=5)
+    ap.add_argument("--join-ms", type=float, default=400, help="simulated LiveKit join")
+    ap.add_argument("--timeout", type=float, default=30, help="per run, seconds")
+    ap.add_argument("--budget-ms", type=float, default=0, help="fail if the median total exceeds this")
+    ap.add_argument("--json", default="", help="write every run's profile here")
+    ap.add_argument("--child", action="store_true", help=argparse.SUPPRESS)
+    args = ap.parse_args()
+    if args.child:
+        child(args)
+        return
+
+    env = dict(os.environ)
+    for k in ("DEEPGRAM_API_KEY", "ELEVEN_API_KEY", "ELEVEN_VOICE_ID"):
+        env.setdefault(k, "bench")
+    cmd = [sys.executable, os.path.abspath(__file__), "--child", "--join-ms", str(args.join_ms),
+           "--timeout", str(args.timeout)]
+    runs = []
+    for i in range(args.runs):
+        p = subprocess.run(cmd, env=env, capture_output=True, text=True, timeout=args.timeout + 60)
+        line = next((l for l in p.stdout.splitlines() if l.startswith(PREFIX)), None)
+        if p.returncode or line is None:
+            sys.stderr.write(p.stderr[-3000:])
+            sys.exit(f"run {i} failed (exit {p.returncode})")
+        runs.append(json.loads(line[len(PREFIX):]))
+        print(f"  run {i}: total {runs[-1]['phases_ms'].get('total')} ms")
+
+    phases = [p for p in ("interpreter", "imports", "vad_load", "vad_wait", "room_join", "first_frame", "total")
+              if all(p in r["phases_ms"] for r in runs)]
+    print(f"\n{args.runs} cold starts, join {args.join_ms:.0f} ms simulated")
+    print(f"   {'phase':<12} {'p50':>8} {'max':>8}")
+    for p in phases:
+        v = [r["phases_ms"][p] for r in runs]
+        print(f"   {p:<12} {pct(v, .5):>8.1f} {max(v):>8.1f}")
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(runs, f, indent=2)
+        print(f"\nwrote {args.json}")
+    if args.budget_ms and "total" in phases:
+        p50 = pct([r["phases_ms"]["total"] for r in runs], .5)
+        if p50 > args.budget_ms:
+            sys.exit(f"startup p50 {p50:.0f} ms is over the {args.budget_ms:.0f} ms budget")
+        print(f"startup p50 {p50:.0f} ms within the {args.budget_ms:.0f} ms budget")
+
+
+if __name__ == "__main__":
+    main()
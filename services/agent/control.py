@@ -0,0 +1,172 @@
+# services/agent/control.py
+"""
+Small HTTP control channel for agents that are started without a room.
+
+The controller starts agents ahead of time (warm pool) and hands them a room
+later:
+
+    GET  /healthz  -> {"ready": bool, "rooms": int, "capacity": int}
+    GET  /load     -> rooms (count and names), capacity, free slots, RSS and CPU time, for bin-packing
+    GET  /metrics  -> per-stage latency histograms (tracing.snapshot)
+    GET  /health   ?n=N -> the last N runtime health windows (health.py, HEALTH_ENABLED)
+    GET  /profile  ?seconds=S[&format=collapsed] -> sampling profile of the event loop
+    POST /assign   {"room": str, "url": str, "token": str}
+                   -> 200 accepted | 409 at capacity | 401 bad secret
+
+A pool agent has capacity 1; a worker (AGENT_MODE=worker) serves up to
+AGENT_MAX_ROOMS rooms at once and rejects assignments beyond that.
+"""
+import os
+import time
+import asyncio
+import logging
+import resource
+from dataclasses import dataclass
+from typing import Awaitable, Callable, Optional
+
+from aiohttp import web
+
+log = logging.getLogger("agent.control")
+
+_STARTED = time.monotonic()
+_PAGE = os.sysconf("SC_PAGE_SIZE") if hasattr(os, "sysconf") else 4096
+
+
+def _rss_mb() -> float:
+    """Current resident set size (Linux /proc), falling back to peak RSS."""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * _PAGE / 1e6
+    except (OSError, IndexError, ValueError):
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+@dataclass
+class Assignment:
+    room: str
+    url: str
+    token: str
+
+
+class ControlServer:
+    def __init__(self, host: str = "0.0.0.0", port: int = 8090, secret: str = "", capacity: int = 1,
+                 metrics: Optional[Callable[[], dict]] = None,
+                 health: Optional[Callable[[int], list]] = None,
+                 profile: Optional[Callable[[float], Awaitable[dict]]] = None):
+        self.host = host
+        self.port = port
+        self.secret = secret
+        self.capacity = capacity
+        self.metrics = metrics
+        self.health = health
+        self.profile = profile
+        self.ready = False          # flipped once models are loaded
+        self.rooms: set[str] = set()
+        self._assignments: asyncio.Queue[Assignment] = asyncio.Queue()
+        self._runner: web.AppRunner | None = None
+
+    # -------------------------
+    # lifecycle
+    # -------------------------
+    async def start(self):
+        app = web.Application()
+        app.router.add_get("/healthz", self._healthz)
+        app.router.add_get("/load", self._load)
+        app.router.add_post("/assign", self._assign)
+        app.router.add_get("/metrics", self._metrics)
+        app.router.add_get("/health", self._health)
+        app.router.add_get("/profile", self._profile)
+        self._runner = web.AppRunner(app, access_log=None)
+        await self._runner.setup()
+        await web.TCPSite(self._runner, self.host, self.port).start()
+        log.info("Control channel listening on %s:%d", self.host, self.port)
+
+    async def stop(self):
+        if self._runner:
+            await self._runner.cleanup()
+            self._runner = None
+
+    async def next_assignment(self) -> Assignment:
+        return await self._assignments.get()
+
+    def release(self, room: str):
+        self.rooms.discard(room)
+
+    # -------------------------
+    # handlers
+    # -------------------------
+    def _authorized(self, request: web.Request) -> bool:
+        return not self.secret or request.headers.get("X-Agent-Secret") == self.secret
+
+    def _has_capacity(self) -> bool:
+        return self.ready and len(self.rooms) < self.capacity
+
+    async def _healthz(self, request: web.Request):
+        if not self._authorized(request):
+            return web.json_response({"error": "unauthorized"}, status=401)
+        return web.json_response({
+            "ready": self._has_capacity(),
+            "rooms": len(self.rooms),
+            "capacity": self.capacity,
+        })
+
+    async def _load(self, request: web.Request):
+        if not self._authorized(request):
+            return web.json_response({"error": "unauthorized"}, status=401)
+        rss_mb = _rss_mb()
+        cpu = resource.getrusage(resource.RUSAGE_SELF)
+        return web.json_response({
+            "rooms": len(self.rooms),
+            "room_names": sorted(self.rooms),
+            "capacity": self.capacity,
+            "free": max(0, self.capacity - len(self.rooms)) if self.ready else 0,
+            "rss_mb": round(rss_mb, 1),
+            "rss_mb_per_room": round(rss_mb / len(self.rooms), 1) if self.rooms else None,
+            "cpu_s": round(cpu.ru_utime + cpu.ru_stime, 2),
+            "uptime_s": round(time.monotonic() - _STARTED, 1),
+        })
+
+    async def _metrics(self, request: web.Request):
+        if not self._authorized(request):
+            return web.json_response({"error": "unauthorized"}, status=401)
+        return web.json_response(self.metrics() if self.metrics else {})
+
+    async def _health(self, request: web.Request):
+        if not self._authorized(request):
+            return web.json_response({"error": "unauthorized"}, status=401)
+        try:
+            n = int(request.query.get("n", "0"))
+        except ValueError:
+            return web.json_response({"error": "n must be an integer"}, status=400)
+        return web.json_response(self.health(n) if self.health else [])
+
+    async def _profile(self, request: web.Request):
+        if not self._authorized(request):
+            return web.json_response({"error": "unauthorized"}, status=401)
+        if not self.profile:
+            return web.json_response({"error": "profiling not available"}, status=404)
+        try:
+            seconds = float(request.query.get("seconds", "5"))
+        except ValueError:
+            return web.json_response({"error": "seconds must be a number"}, status=400)
+        p = await self.profile(seconds)
+        if request.query.get("format") == "collapsed":
+            return web.Response(text=p["collapsed"] + "\n")
+        return web.json_response(p)
+
+    async def _assign(self, request: web.Request):
+        if not self._authorized(request):
+            return web.json_response({"error": "unauthorized"}, status=401)
+        try:
+            body = await request.json()
+            a = Assignment(room=body["room"], url=body.get("url") or "", token=body["token"])
+        except (ValueError, KeyError, TypeError):
+            return web.json_response({"error": "expected {room, url, token}"}, status=400)
+        if a.room in self.rooms:
+            return web.json_response({"status": "already-assigned", "room": a.room})
+        if not self._has_capacity():
+            return web.json_response({"error": "at capacity"}, status=409)
+        self.rooms.add(a.room)
+        self._assignments.put_nowait(a)
+        log.info("Accepted room=%s", a.room)
+        return web.json_response({"status": "accepted", "room": a.room})
@@ -0,0 +1,374 @@
+# services/agent/health.py
+"""
+Runtime health of the agent process: is it keeping up with real time?
+
+Everything a call does (VAD inference, frame processing, the LiveKit and
+vendor websockets) shares one asyncio loop. On a 256-unit Fargate task a
+slow reply can be vendor latency or local CPU starvation; the per-stage
+traces (tracing.py) can't tell which. With HEALTH_ENABLED=1 a monitor
+samples, per HEALTH_INTERVAL_S window:
+
+    loop_lag_ms      how late a HEALTH_LAG_PERIOD_MS sleep wakes up (p50/p99/max)
+    cpu              process CPU time / wall time; cgroup throttled time when
+                     the task is held to its CPU quota (cgroup cpu.stat)
+    rss_mb           resident set size
+    processors       per Pipeline stage (position.Class, merged over the rooms):
+                     frames, frame_ms (wall time in process_frame, awaits
+                     included) and the deepest input queue seen
+    audio            caller frames arriving more than HEALTH_LATE_MS after their
+                     slot (in_late), the deepest input audio backlog in ms
+                     (in_backlog_ms: VAD not keeping up), caller frames the input
+                     discarded (in_dropped), agent audio written after its slot
+                     ran out (out_late, out_gap_ms: the caller heard a gap) and
+                     agent audio discarded unplayed by an interruption (out_dropped_ms)
+
+Each window is kept in a ring of HEALTH_RING samples, logged as one
+"[health] {json}" line (CloudWatch Logs Insights: parse @message "[health] *")
+and served in /metrics and GET /health on the control port. A loop lag above
+HEALTH_LAG_WARN_MS is also logged as a warning when it happens.
+
+profile() is a sampling profiler for the event-loop thread: a background
+thread reads its stack HEALTH_PROFILE_HZ times a second and returns the
+hottest functions and collapsed stacks (flamegraph.pl input). It runs on
+demand only, whether or not HEALTH_ENABLED is set: GET /profile?seconds=N on
+the control port, or SIGUSR1 (single mode, via ECS exec), which logs the top
+of it. Starvation shows up as lag with the loop's own frames on top; a slow
+vendor as lag-free windows with time spent waiting in select().
+"""
+import os
+import sys
+import json
+import time
+import signal
+import asyncio
+import logging
+import resource
+import threading
+from collections import Counter, deque
+from typing import Optional
+
+from pipecat.frames.frames import StartInterruptionFrame
+
+from tracing import LatencyHistogram
+
+log = logging.getLogger("agent.health")
+
+HEALTH_ENABLED       = os.getenv("HEALTH_ENABLED", "0") == "1"
+HEALTH_INTERVAL_S    = float(os.getenv("HEALTH_INTERVAL_S", "10"))     # one sample + log line per window
+HEALTH_RING          = int(os.getenv("HEALTH_RING", "360"))            # windows kept (1 h at 10 s)
+HEALTH_LAG_PERIOD_MS = float(os.getenv("HEALTH_LAG_PERIOD_MS", "50"))
+HEALTH_LAG_WARN_MS   = float(os.getenv("HEALTH_LAG_WARN_MS", "100"))
+HEALTH_LATE_MS       = float(os.getenv("HEALTH_LATE_MS", "40"))        # audio this far behind its slot is late
+HEALTH_PROFILE_HZ    = int(os.getenv("HEALTH_PROFILE_HZ", "200"))
+HEALTH_PROFILE_S     = float(os.getenv("HEALTH_PROFILE_S", "5"))       # SIGUSR1 / default /profile length
+HEALTH_PROFILE_MAX_S = 60.0
+
+_PAGE = os.sysconf("SC_PAGE_SIZE") if hasattr(os, "sysconf") else 4096
+_CPU_STAT = next((p for p in ("/sys/fs/cgroup/cpu.stat", "/sys/fs/cgroup/cpu/cpu.stat") if os.path.exists(p)), None)
+_GAP_S = 0.5   # audio frames further apart than this start a new stream (muted mic, end of a reply)
+
+
+def _rss_mb() -> float:
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * _PAGE / 1e6
+    except (OSError, IndexError, ValueError):
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def _cpu_s() -> float:
+    r = resource.getrusage(resource.RUSAGE_SELF)
+    return r.ru_utime + r.ru_stime
+
+
+def _throttled_ms() -> Optional[float]:
+    """Cumulative time the cgroup was throttled by its CPU quota (v2 throttled_usec, v1 throttled_time ns)."""
+    if not _CPU_STAT:
+        return None
+    try:
+        with open(_CPU_STAT) as f:
+            stat = dict(line.split() for line in f if line.strip())
+    except (OSError, ValueError):
+        return None
+    if "throttled_usec" in stat:
+        return int(stat["throttled_usec"]) / 1000
+    if "throttled_time" in stat:
+        return int(stat["throttled_time"]) / 1e6
+    return None
+
+
+def _ms(frame) -> float:
+    return len(frame.audio) / 2 / max(1, frame.num_channels) / frame.sample_rate * 1000
+
+
+class _Clock:
+    """Real-time slots of an audio stream: how far behind its slot each frame is."""
+    def __init__(self):
+        self._due: Optional[float] = None
+
+    def late_ms(self, duration_ms: float) -> float:
+        now = time.perf_counter()
+        if self._due is None or now - self._due > _GAP_S:
+            self._due = now + duration_ms / 1000
+            return 0.0
+        late = (now - self._due) * 1000
+        self._due = max(now, self._due) + duration_ms / 1000
+        return late
+
+
+class _Window:
+    """One HEALTH_INTERVAL_S window, process-wide."""
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.lag = LatencyHistogram()
+        self.frame_ms: dict[str, LatencyHistogram] = {}
+        self.queue_max: dict[str, int] = {}
+        self.audio = {"in_late": 0, "in_backlog_ms": 0.0, "in_dropped": 0,
+                      "out_late": 0, "out_gap_ms": 0.0, "out_dropped_ms": 0.0}
+
+
+# -------------------------
+# Per call
+# -------------------------
+class CallHealth:
+    """Hooks one call's pipeline and transport; created by HealthMonitor.watch()."""
+    def __init__(self, monitor: "HealthMonitor", room: str, pipeline, transport):
+        self.monitor = monitor
+        self.room = room
+        self.counts = {"in_late": 0, "in_dropped": 0, "out_late": 0, "out_gap_ms": 0.0, "out_dropped_ms": 0.0}
+        self.stages: list[tuple[str, object]] = []
+        for i, p in enumerate(pipeline._processors[1:-1]):   # between the Pipeline's own source and sink
+            key = f"{i}.{type(p).__name__}"
+            self.stages.append((key, p))
+            p.process_frame = self._timed(key, p.process_frame)
+        self._inp, self._out = transport.input(), transport.output()
+        self._hook_audio()
+
+    def _timed(self, key: str, process_frame):
+        monitor = self.monitor
+
+        async def _process_frame(frame, direction):
+            t = time.perf_counter()
+            try:
+                await process_frame(frame, direction)
+            finally:
+                monitor.frame(key, (time.perf_counter() - t) * 1000)
+        return _process_frame
+
+    def _hook_audio(self):
+        inp, out, counts, monitor = self._inp, self._out, self.counts, self.monitor
+        push_audio_frame, write_audio_frame, process_frame = inp.push_audio_frame, out.write_audio_frame, out.process_frame
+        in_clock, out_clock = _Clock(), _Clock()
+
+        async def _push_audio_frame(frame):
+            if not inp._params.audio_in_enabled or getattr(inp, "_paused", False):
+                counts["in_dropped"] += 1
+                monitor.window.audio["in_dropped"] += 1
+            elif in_clock.late_ms(_ms(frame)) > HEALTH_LATE_MS:
+                counts["in_late"] += 1
+                monitor.window.audio["in_late"] += 1
+            await push_audio_frame(frame)
+
+        async def _write_audio_frame(frame):
+            late = out_clock.late_ms(_ms(frame))
+            if late > HEALTH_LATE_MS:
+                counts["out_late"] += 1
+                counts["out_gap_ms"] += late
+                monitor.window.audio["out_late"] += 1
+                monitor.window.audio["out_gap_ms"] += late
+            return await write_audio_frame(frame)
+
+        async def _process_frame(frame, direction):
+            if isinstance(frame, StartInterruptionFrame):
+                dropped = self._queued_out_ms()
+                counts["out_dropped_ms"] += dropped
+                monitor.window.audio["out_dropped_ms"] += dropped
+            await process_frame(frame, direction)
+
+        inp.push_audio_frame = _push_audio_frame
+        out.write_audio_frame = _write_audio_frame
+        out.process_frame = _process_frame
+
+    def _queued_out_ms(self) -> float:
+        """Agent audio waiting in the output's media senders."""
+        ms = 0.0
+        for sender in getattr(self._out, "_media_senders", {}).values():
+            q = getattr(sender, "_audio_queue", None)
+            for frame in list(getattr(q, "_queue", ())):
+                if hasattr(frame, "audio") and getattr(frame, "sample_rate", 0):
+                    ms += _ms(frame)
+        return ms
+
+    def sample(self, window: _Window):
+        """Queue depths right now, folded into the window's maxima."""
+        for key, p in self.stages:
+            depth = sum(q.qsize() for q in (getattr(p, "_FrameProcessor__input_queue", None),
+                                            getattr(p, "_FrameProcessor__process_queue", None)) if q is not None)
+            if depth > window.queue_max.get(key, 0):
+                window.queue_max[key] = depth
+        q = getattr(self._inp, "_audio_in_queue", None)
+        if q is not None and q.qsize():
+            rate = self._inp.sample_rate or 16000
+            backlog = sum(len(f.audio) for f in list(q._queue)) / 2 / rate * 1000
+            window.audio["in_backlog_ms"] = max(window.audio["in_backlog_ms"], round(backlog, 1))
+
+    def close(self):
+        c = self.counts
+        if c["in_late"] or c["out_late"] or c["in_dropped"]:
+            log.info("[health] room=%s caller audio %d late / %d dropped, agent audio %d late (%.0f ms of gaps)",
+                     self.room, c["in_late"], c["in_dropped"], c["out_late"], c["out_gap_ms"])
+
+
+# -------------------------
+# Process
+# -------------------------
+class HealthMonitor:
+    def __init__(self, interval_s: float = HEALTH_INTERVAL_S, ring: int = HEALTH_RING,
+                 lag_period_ms: float = HEALTH_LAG_PERIOD_MS):
+        self.interval_s = interval_s
+        self.lag_period_ms = lag_period_ms
+        self.ring: deque[dict] = deque(maxlen=ring)
+        self.window = _Window()
+        self.calls: set[CallHealth] = set()
+        self._task: Optional[asyncio.Task] = None
+        self._cpu = self._throttled = None
+
+    def start(self):
+        if self._task is None:
+            self.window = _Window()
+            self._cpu, self._throttled = _cpu_s(), _throttled_ms()
+            self._task = asyncio.get_running_loop().create_task(self._run(), name="health")
+
+    async def stop(self):
+        """Stops sampling; the partial window is emitted."""
+        if self._task:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+            if self.window.lag.count:
+                self._emit(time.perf_counter())
+
+    def watch(self, room: str, pipeline, transport) -> CallHealth:
+        call = CallHealth(self, room, pipeline, transport)
+        self.calls.add(call)
+        return call
+
+    def unwatch(self, call: Optional[CallHealth]):
+        if call is not None:
+            self.calls.discard(call)
+            call.close()
+
+    def frame(self, key: str, ms: float):
+        h = self.window.frame_ms.get(key)
+        if h is None:
+            h = self.window.frame_ms[key] = LatencyHistogram()
+        h.record(ms)
+
+    async def _run(self):
+        period = self.lag_period_ms / 1000
+        while True:
+            t = time.perf_counter()
+            await asyncio.sleep(period)
+            now = time.perf_counter()
+            lag = max(0.0, (now - t - period) * 1000)
+            self.window.lag.record(lag)
+            if lag > HEALTH_LAG_WARN_MS:
+                log.warning("[health] event loop %.0f ms late (%d rooms)", lag, len(self.calls))
+            for call in list(self.calls):
+                call.sample(self.window)
+            if now - self.window.started >= self.interval_s:
+                self._emit(now)
+
+    def _emit(self, now: float):
+        w, self.window = self.window, _Window()
+        wall = now - w.started
+        cpu, throttled = _cpu_s(), _throttled_ms()
+        sample = {
+            "ts": round(time.time(), 1),
+            "window_s": round(wall, 1),
+            "rooms": len(self.calls),
+            "loop_lag_ms": {k: v for k, v in w.lag.to_dict().items() if k in ("n", "p50", "p99", "max")},
+            "cpu": round((cpu - self._cpu) / wall, 3),
+            "throttled_ms": None if throttled is None or self._throttled is None
+                            else round(throttled - self._throttled, 1),
+            "rss_mb": round(_rss_mb(), 1),
+            "processors": {k: self._processor(h, w.queue_max.get(k, 0))
+                           for k, h in sorted(w.frame_ms.items(), key=lambda kv: int(kv[0].split(".")[0]))},
+            "audio": {k: round(v, 1) if isinstance(v, float) else v for k, v in w.audio.items()},
+        }
+        self._cpu, self._throttled = cpu, throttled
+        self.ring.append(sample)
+        log.info("[health] %s", json.dumps(sample, separators=(",", ":")))
+
+    @staticmethod
+    def _processor(h: LatencyHistogram, queue_max: int) -> dict:
+        d = h.to_dict()
+        return {"frames": d["n"], "p50": d["p50"], "p99": d["p99"], "max": d["max"], "queue_max": queue_max}
+
+    def samples(self, n: int = 0) -> list[dict]:
+        return list(self.ring)[-n:] if n else list(self.ring)
+
+
+MONITOR = HealthMonitor()
+
+
+def start():
+    """Starts the monitor (HEALTH_ENABLED) and the SIGUSR1 profiler; call from the running loop."""
+    loop = asyncio.get_running_loop()
+    if HEALTH_ENABLED:
+        MONITOR.start()
+        log.info("Health monitor on: %.0f s windows, %d kept", MONITOR.interval_s, MONITOR.ring.maxlen)
+    try:
+        loop.add_signal_handler(signal.SIGUSR1, lambda: loop.create_task(_log_profile()))
+    except (NotImplementedError, RuntimeError, ValueError):   # not the main thread / not Unix
+        pass
+
+
+def watch(room: str, pipeline, transport) -> Optional[CallHealth]:
+    return MONITOR.watch(room, pipeline, transport) if HEALTH_ENABLED else None
+
+
+def stats() -> dict:
+    return {"enabled": HEALTH_ENABLED, "last": MONITOR.ring[-1] if MONITOR.ring else None}
+
+
+# -------------------------
+# Sampling profiler
+# -------------------------
+def _stack(frame) -> list[str]:
+    out = []
+    while frame is not None:
+        co = frame.f_code
+        out.append(f"{os.path.basename(co.co_filename)}:{co.co_name}")
+        frame = frame.f_back
+    return out[::-1]
+
+
+def _sample_thread(thread_id: int, seconds: float, hz: int) -> dict:
+    stacks: Counter = Counter()
+    own: Counter = Counter()
+    period, n = 1 / hz, 0
+    end = time.perf_counter() + seconds
+    while time.perf_counter() < end:
+        frame = sys._current_frames().get(thread_id)
+        if frame is not None:
+            s = _stack(frame)
+            stacks[";".join(s)] += 1
+            own[s[-1]] += 1
+            n += 1
+        time.sleep(period)
+    return {"seconds": seconds, "hz": hz, "samples": n,
+            "top": [{"function": f, "pct": round(100 * c / n, 1)} for f, c in own.most_common(20)] if n else [],
+            "collapsed": "\n".join(f"{s} {c}" for s, c in stacks.most_common())}
+
+
+async def profile(seconds: float = HEALTH_PROFILE_S, hz: int = HEALTH_PROFILE_HZ) -> dict:
+    """Samples the event-loop thread's stack for `seconds` (from a worker thread, so the loop keeps running)."""
+    seconds = min(max(0.1, seconds), HEALTH_PROFILE_MAX_S)
+    return await asyncio.to_thread(_sample_thread, threading.get_ident(), seconds, hz)
+
+
+async def _log_profile():
+    p = await profile()
+    log.info("[health] profile %.0f s, %d samples, self time: %s", p["seconds"], p["samples"],
+             ", ".join(f"{t['function']} {t['pct']}%" for t in p["top"][:15]))
@@ -0,0 +1,128 @@
+# services/agent/prewarm.py
+"""
+Deepgram / ElevenLabs services that open their streaming sockets early.
+
+pipecat connects each service when the StartFrame reaches it, and the
+StartFrame only leaves transport.input() once the LiveKit join is done. So the
+LiveKit join, the Deepgram handshake and the ElevenLabs handshake run one
+after another. prewarm() starts the vendor handshakes as soon as the room is
+assigned, in parallel with the join. When the StartFrame arrives, the service
+adopts the socket that is already open.
+
+Sample rates must be fixed in the constructor (STT_SAMPLE_RATE / TTS_SAMPLE_RATE
+in agent.py), because the socket URL/options are built before the StartFrame
+carries the pipeline's rates.
+
+Keepalives: the Deepgram SDK sends KeepAlive itself (pipecat enables it). The
+ElevenLabs socket gets the same {"text": ""} ping pipecat uses, until pipecat's
+own keepalive task takes over in _connect().
+"""
+import os
+import json
+import time
+import asyncio
+import logging
+from typing import Optional
+
+from pipecat.services.deepgram.stt import DeepgramSTTService
+from pipecat.services.elevenlabs.tts import ElevenLabsTTSService, output_format_from_sample_rate
+
+log = logging.getLogger("agent.prewarm")
+
+PREWARM_ENABLED     = os.getenv("PREWARM_ENABLED", "1") == "1"
+PREWARM_KEEPALIVE_S = float(os.getenv("PREWARM_KEEPALIVE_S", "10"))   # ElevenLabs drops idle sockets after ~20 s
+
+
+class PrewarmMixin:
+    """
+    Adds prewarm() to a pipecat streaming service. Subclasses implement
+    _prewarm_connect() (open + authenticate, no pipeline tasks) and call
+    _adopt_prewarm() at the top of _connect().
+    """
+    _prewarm_task: Optional[asyncio.Task] = None
+    _prewarm_adopted = False
+    handshake_ms: Optional[float] = None
+
+    def prewarm(self) -> asyncio.Task:
+        if self._prewarm_task is None:
+            self._prewarm_task = asyncio.create_task(self._timed_prewarm(), name=f"prewarm-{self}")
+        return self._prewarm_task
+
+    async def _timed_prewarm(self) -> bool:
+        t0 = time.perf_counter()
+        try:
+            ok = await self._prewarm_connect()
+        except Exception as e:
+            log.warning("[prewarm] %s handshake failed: %s", self, e)
+            return False
+        self.handshake_ms = (time.perf_counter() - t0) * 1000
+        log.info("[prewarm] %s handshake %.1f ms%s", self, self.handshake_ms, "" if ok else " (not connected)")
+        return ok
+
+    async def _prewarm_connect(self) -> bool:
+        raise NotImplementedError
+
+    async def _adopt_prewarm(self) -> bool:
+        """Waits for a handshake still in flight; True if its socket can be used as is."""
+        if self._prewarm_task is None or self._prewarm_adopted:
+            return False
+        self._prewarm_adopted = True
+        ok = await self._prewarm_task
+        log.info("[prewarm] %s %s the early socket", self, "adopted" if ok else "could not use")
+        return ok
+
+    async def discard_prewarm(self):
+        """Closes an early socket the pipeline never picked up (e.g. the join failed)."""
+        if self._prewarm_task is None or self._prewarm_adopted:
+            return
+        self._prewarm_adopted = True
+        self._prewarm_task.cancel()
+        await asyncio.gather(self._prewarm_task, return_exceptions=True)
+        await self._disconnect()
+
+
+class PrewarmDeepgramSTT(PrewarmMixin, DeepgramSTTService):
+    async def _prewarm_connect(self) -> bool:
+        self._settings["sample_rate"] = self._init_sample_rate
+        await super()._connect()
+        return True
+
+    async def _connect(self):
+        if await self._adopt_prewarm():
+            return
+        await super()._connect()
+
+
+class PrewarmElevenLabsTTS(PrewarmMixin, ElevenLabsTTSService):
+    _prewarm_ping: Optional[asyncio.Task] = None
+
+    async def _prewarm_connect(self) -> bool:
+        self._output_format = output_format_from_sample_rate(self._init_sample_rate)
+        await self._connect_websocket()
+        if self._websocket is None:
+            return False
+        self._prewarm_ping = asyncio.create_task(self._ping())
+        return True
+
+    async def _ping(self):
+        try:
+            while True:
+                await asyncio.sleep(PREWARM_KEEPALIVE_S)
+                if self._websocket is None:
+                    return
+                await self._websocket.send(json.dumps({"text": ""}))
+        except Exception as e:
+            log.warning("[prewarm] %s keepalive failed: %s", self, e)
+
+    async def _connect(self):
+        await self._adopt_prewarm()
+        if self._prewarm_ping:
+            self._prewarm_ping.cancel()
+            self._prewarm_ping = None
+        await super()._connect()  # reuses an open socket, then starts receive/keepalive tasks
+
+    async def discard_prewarm(self):
+        if self._prewarm_ping:
+            self._prewarm_ping.cancel()
+            self._prewarm_ping = None
+        await super().discard_prewarm()
@@ -0,0 +1,136 @@
+# services/agent/resample.py
+"""
+Streaming resampler for 16-bit mono PCM that reuses its buffers.
+
+pipecat converts with a soxr ResampleStream per transport (VHQ). Each call
+allocates a float array for the input, soxr's output and an int16 copy.
+StreamResampler handles the integer ratios that telephony rates produce
+(48000→8000, 48000→16000, 16000→8000, 8000→24000, ...) with a Kaiser-windowed
+sinc FIR. It keeps everything in preallocated numpy buffers:
+
+    decimate by D     one dot product over a strided (n_out, taps) view of
+                      the history + input buffer
+    interpolate by U  one (n_in, taps/U) @ (taps/U, U) product; the rows of the
+                      result, flattened, are the U polyphase outputs per input
+
+The only allocation per chunk is the bytes object handed back (pipecat frames
+carry bytes). Buffers grow if a chunk is larger than any before it. Other
+ratios (22050↔8000, ...) fall back to pipecat's soxr stream resampler.
+"""
+import math
+from typing import Optional
+
+import numpy as np
+from numpy.lib.stride_tricks import as_strided
+
+from pipecat.audio.resamplers.base_audio_resampler import BaseAudioResampler
+from pipecat.audio.utils import create_stream_resampler
+
+TAPS_PER_PHASE = 32     # FIR length / ratio: 192 taps for 48000→8000
+KAISER_BETA    = 8.0    # ~80 dB stopband
+CUTOFF         = 0.92   # passband edge, as a fraction of the lower rate's Nyquist
+
+
+def lowpass(ratio: int, taps_per_phase: int = TAPS_PER_PHASE) -> np.ndarray:
+    """Kaiser-windowed sinc for a rate change by `ratio`, unity DC gain."""
+    n = ratio * taps_per_phase
+    fc = CUTOFF * 0.5 / ratio
+    k = np.arange(n) - (n - 1) / 2
+    h = 2 * fc * np.sinc(2 * fc * k) * np.kaiser(n, KAISER_BETA)
+    return (h / h.sum()).astype(np.float32)
+
+
+class StreamResampler(BaseAudioResampler):
+    def __init__(self, taps_per_phase: int = TAPS_PER_PHASE, **kwargs):
+        self.taps_per_phase = taps_per_phase
+        self._rates: Optional[tuple[int, int]] = None
+        self._fallback: Optional[BaseAudioResampler] = None
+        self._up = self._down = 1
+        self._have = 0              # valid samples in _buf (history + unconsumed input)
+        self._buf = np.zeros(0, dtype=np.float32)
+        self._y = np.zeros(0, dtype=np.float32)
+        self._out = np.zeros(0, dtype=np.int16)
+        self._view: Optional[np.ndarray] = None
+
+    # -------------------------
+    # setup
+    # -------------------------
+    def _configure(self, in_rate: int, out_rate: int):
+        self._rates = (in_rate, out_rate)
+        g = math.gcd(in_rate, out_rate)
+        self._up, self._down = out_rate // g, in_rate // g
+        self._fallback = None
+        if self._up > 1 and self._down > 1:
+            self._fallback = create_stream_resampler()
+            return
+        ratio = max(self._up, self._down)
+        h = lowpass(ratio, self.taps_per_phase)[::-1]
+        if self._down > 1:
+            self._taps = len(h)
+            self._h = np.ascontiguousarray(h)
+        else:
+            # column p holds phase p's taps, oldest input first: y[nU+p] = row(n) @ h[:, p]
+            self._taps = self.taps_per_phase
+            self._h = np.ascontiguousarray(h.reshape(self._taps, ratio)[:, ::-1] * ratio)
+        self._buf, self._have = np.zeros(0, dtype=np.float32), 0
+        self._grow(self._taps - 1 + 960)
+        self._have = self._taps - 1  # start from silence
+
+    def _grow(self, n: int):
+        """Sizes the buffers for `n` buffered samples (history + one chunk)."""
+        if n <= len(self._buf):
+            return
+        buf = np.zeros(n, dtype=np.float32)
+        buf[:self._have] = self._buf[:self._have]
+        self._buf = buf
+        step, width = (self._down, self._taps) if self._down > 1 else (1, self._taps)
+        rows = (n - width) // step + 1
+        s = buf.strides[0]
+        self._view = as_strided(buf, shape=(rows, width), strides=(step * s, s), writeable=False)
+        outs = rows * self._up
+        self._y = np.zeros((rows, self._up) if self._up > 1 else rows, dtype=np.float32)
+        self._out = np.zeros(outs, dtype=np.int16)
+
+    # -------------------------
+    # BaseAudioResampler
+    # -------------------------
+    async def resample(self, audio: bytes, in_rate: int, out_rate: int) -> bytes:
+        if in_rate == out_rate:
+            return audio
+        if self._rates != (in_rate, out_rate):
+            self._configure(in_rate, out_rate)
+        if self._fallback is not None:
+            return await self._fallback.resample(audio, in_rate, out_rate)
+        return self.process(np.frombuffer(audio, dtype=np.int16))
+
+    def process(self, x: np.ndarray) -> bytes:
+        n_in = len(x)
+        self._grow(self._have + n_in)
+        buf, have = self._buf, self._have
+        buf[have:have + n_in] = x
+        total = have + n_in
+        step = self._down if self._down > 1 else 1
+        rows = (total - self._taps) // step + 1 if total >= self._taps else 0
+        if rows <= 0:
+            self._have = total
+            return b""
+        if self._up > 1:
+            y = self._y[:rows]
+            np.matmul(self._view[:rows], self._h, out=y)
+            flat = self._y.reshape(-1)[:rows * self._up]
+        else:
+            flat = self._y[:rows]
+            np.dot(self._view[:rows], self._h, out=flat)
+        np.minimum(flat, 32767, out=flat)
+        np.maximum(flat, -32768, out=flat)
+        out = self._out[:len(flat)]
+        out[:] = flat
+        # keep what the next window needs at the front of the buffer
+        used = rows * step
+        keep = total - used
+        if keep > used:
+            buf[:keep] = buf[used:total].copy()
+        else:
+            buf[:keep] = buf[used:total]
+        self._have = keep
+        return out.tobytes()
@@ -0,0 +1,168 @@
+# services/agent/speculative.py
+"""
+Speculative replies from stable interim transcripts (SPECULATIVE_ENABLED=1).
+
+Without speculation the reply waits for Deepgram's final TranscriptionFrame,
+so the STT finalization delay sits on the critical path. SpeculativeReplier
+(in place of EchoLite) watches the interim transcripts. Once the same text has
+been stable for SPEC_STABLE_MS, it generates the reply and sends it to TTS
+straight away, wrapped in SpeculationStartFrame. SpeculationGate sits right
+after the TTS service and holds that audio back. Then:
+
+  final matches the speculated text  → SpeculationCommitFrame: the gate
+                                       releases the buffered audio at once;
+  final differs / user keeps talking → StartInterruptionFrame: TTS drops the
+                                       context, the gate discards its buffer,
+                                       and the reply is generated normally.
+
+Counters (stats(), served in /metrics): hits, misses, wasted TTS characters and
+the average head start TTS got on a hit (final arrival − speculation start).
+Tune SPEC_STABLE_MS against them: a shorter window wins more latency and
+costs more discarded synthesis.
+"""
+import os
+import re
+import time
+import asyncio
+import logging
+from dataclasses import dataclass
+from typing import Callable, Optional
+
+from pipecat.frames.frames import (
+    Frame, ControlFrame, SystemFrame, TextFrame, TranscriptionFrame, InterimTranscriptionFrame,
+    StartInterruptionFrame, UserStartedSpeakingFrame, EndFrame, CancelFrame,
+)
+from pipecat.processors.frame_processor import FrameProcessor, FrameDirection
+
+log = logging.getLogger("agent.speculative")
+
+SPECULATIVE_ENABLED = os.getenv("SPECULATIVE_ENABLED", "0") == "1"
+SPEC_STABLE_MS      = float(os.getenv("SPEC_STABLE_MS", "300"))   # interim must stay unchanged this long
+
+_stats = {"speculated": 0, "hits": 0, "misses": 0, "wasted_tts_chars": 0, "head_start_ms_total": 0.0}
+
+
+def stats() -> dict:
+    s = dict(_stats)
+    s["hit_rate"] = round(s["hits"] / s["speculated"], 3) if s["speculated"] else None
+    s["head_start_ms_avg"] = round(s["head_start_ms_total"] / s["hits"], 1) if s["hits"] else None
+    return s
+
+
+@dataclass
+class SpeculationStartFrame(ControlFrame):
+    spec_id: int = 0
+
+
+@dataclass
+class SpeculationCommitFrame(ControlFrame):
+    spec_id: int = 0
+
+
+_WORDS = re.compile(r"[\w']+")
+
+
+def normalize(text: str) -> str:
+    """Case- and punctuation-insensitive form used to compare interim and final text."""
+    return " ".join(_WORDS.findall(text.lower()))
+
+
+class SpeculativeReplier(FrameProcessor):
+    def __init__(self, reply: Callable[[str], str], stable_ms: float = SPEC_STABLE_MS, **kwargs):
+        super().__init__(**kwargs)
+        self.reply = reply
+        self.stable_s = stable_ms / 1000
+        self._ids = 0
+        self._candidate = ""        # normalized interim text being watched
+        self._timer: Optional[asyncio.Task] = None
+        self._spec: Optional[dict] = None   # {id, key, chars, at}
+
+    async def process_frame(self, frame: Frame, direction: FrameDirection):
+        await super().process_frame(frame, direction)
+        if isinstance(frame, InterimTranscriptionFrame) and frame.text:
+            await self._on_interim(frame.text)
+        elif isinstance(frame, TranscriptionFrame) and frame.text:
+            await self._on_final(frame.text)
+        elif isinstance(frame, UserStartedSpeakingFrame) and self._spec:
+            # The input transport's own interruption already clears TTS and the gate
+            self._discard("user resumed speaking")
+        elif isinstance(frame, (EndFrame, CancelFrame)):
+            await self._stop_timer()
+        await self.push_frame(frame, direction)
+
+    async def _on_interim(self, text: str):
+        key = normalize(text)
+        if not key or key == self._candidate:
+            return
+        self._candidate = key
+        if self._spec and self._spec["key"] != key:
+            await self._abort("transcript changed")
+        await self._stop_timer()
+        self._timer = self.create_task(self._speculate_when_stable(key, text))
+
+    async def _speculate_when_stable(self, key: str, text: str):
+        await asyncio.sleep(self.stable_s)
+        if self._candidate != key or self._spec:
+            return
+        self._timer = None
+        self._ids += 1
+        reply = self.reply(text)
+        self._spec = {"id": self._ids, "key": key, "chars": len(reply), "at": time.perf_counter()}
+        _stats["speculated"] += 1
+        await self.push_frame(SpeculationStartFrame(spec_id=self._ids))
+        await self.push_frame(TextFrame(reply))
+
+    async def _on_final(self, text: str):
+        await self._stop_timer()
+        self._candidate = ""
+        spec, key = self._spec, normalize(text)
+        if spec and spec["key"] == key:
+            self._spec = None
+            _stats["hits"] += 1
+            _stats["head_start_ms_total"] += (time.perf_counter() - spec["at"]) * 1000
+            await self.push_frame(SpeculationCommitFrame(spec_id=spec["id"]))
+            return
+        if spec:
+            await self._abort("final differs")
+        await self.push_frame(TextFrame(self.reply(text)))
+
+    def _discard(self, why: str):
+        spec, self._spec = self._spec, None
+        _stats["misses"] += 1
+        _stats["wasted_tts_chars"] += spec["chars"]
+        log.debug("Speculation %d discarded: %s", spec["id"], why)
+
+    async def _abort(self, why: str):
+        self._discard(why)
+        # Cancels synthesis in flight; the gate drops what it held back
+        await self.push_frame(StartInterruptionFrame())
+
+    async def _stop_timer(self):
+        if self._timer:
+            await self.cancel_task(self._timer)
+            self._timer = None
+
+
+class SpeculationGate(FrameProcessor):
+    """Placed after TTS: holds speculative output until it is committed or interrupted."""
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        self._held: Optional[list[Frame]] = None
+
+    async def process_frame(self, frame: Frame, direction: FrameDirection):
+        await super().process_frame(frame, direction)
+        if direction != FrameDirection.DOWNSTREAM:
+            await self.push_frame(frame, direction)
+        elif isinstance(frame, SpeculationStartFrame):
+            self._held = []
+        elif isinstance(frame, SpeculationCommitFrame):
+            held, self._held = self._held or [], None
+            for f in held:
+                await self.push_frame(f)
+        elif isinstance(frame, StartInterruptionFrame) and self._held is not None:
+            self._held = None
+            await self.push_frame(frame, direction)
+        elif self._held is not None and not isinstance(frame, (SystemFrame, EndFrame)):
+            self._held.append(frame)
+        else:
+            await self.push_frame(frame, direction)
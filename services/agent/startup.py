@@ -0,0 +1,110 @@
+# services/agent/startup.py
+"""
+Startup timing of one agent process.
+
+agent.py imports this module first. Milestones are stamped in ms since the
+process was exec'd (from /proc, so interpreter start-up is included; since
+this import where /proc is unavailable):
+
+    agent_start       agent.py begins executing
+    imports_done      pipecat, LiveKit, Deepgram, ElevenLabs imported
+    vad_load_start    Silero load started (background thread, see vad.preload)
+    vad_loaded        Silero ONNX session ready
+    ready             pool/worker: reporting ready on the control port
+    room_start        run_room() for the first room
+    room_joined       LiveKit on_connected
+    pipeline_started  StartFrame through the whole pipeline
+    first_frame       first caller audio frame through the whole pipeline
+
+PHASES below turns those into durations. vad_wait is the time a room actually
+blocked on the model (0 when the load was hidden behind the join). The
+breakdown is logged once as a "[startup]" line when the first frame arrives
+(or the process gets ready, in pool/worker mode), appended to STARTUP_JSONL if
+set, and served under "startup" in /metrics.
+"""
+import os
+import json
+import time
+import logging
+
+log = logging.getLogger("agent.startup")
+
+STARTUP_JSONL = os.getenv("STARTUP_JSONL", "")
+
+PHASES = {
+    "interpreter":  ("exec", "agent_start"),
+    "imports":      ("agent_start", "imports_done"),
+    "vad_load":     ("vad_load_start", "vad_loaded"),
+    "ready":        ("exec", "ready"),
+    "room_join":    ("room_start", "room_joined"),
+    "pipeline":     ("room_start", "pipeline_started"),
+    "first_frame":  ("room_start", "first_frame"),
+    "total":        ("exec", "first_frame"),
+}
+
+
+def _process_age_ms() -> float:
+    """How long ago this process was exec'd (Linux), 0 if unknown."""
+    try:
+        with open("/proc/self/stat") as f:
+            start_ticks = int(f.read().rsplit(")", 1)[1].split()[19])  # field 22, starttime
+        with open("/proc/uptime") as f:
+            uptime = float(f.read().split()[0])
+        return max(0.0, (uptime - start_ticks / os.sysconf("SC_CLK_TCK")) * 1000)
+    except (OSError, ValueError, IndexError):
+        return 0.0
+
+
+class StartupProfile:
+    def __init__(self):
+        self._t0 = time.perf_counter() - _process_age_ms() / 1000
+        self.marks: dict[str, float] = {"exec": 0.0}
+        self.spans: dict[str, float] = {}
+        self.mode = ""
+        self.reported = False
+
+    def mark(self, milestone: str):
+        """First stamp wins: later rooms don't move the process's startup milestones."""
+        if milestone not in self.marks:
+            self.marks[milestone] = round((time.perf_counter() - self._t0) * 1000, 1)
+
+    def span(self, name: str, ms: float):
+        self.spans.setdefault(name, round(ms, 1))
+
+    def to_dict(self) -> dict:
+        phases = {p: round(self.marks[b] - self.marks[a], 1)
+                  for p, (a, b) in PHASES.items() if a in self.marks and b in self.marks}
+        return {"mode": self.mode, "phases_ms": {**phases, **self.spans}, "milestones_ms": dict(self.marks)}
+
+    def report(self):
+        if self.reported:
+            return
+        self.reported = True
+        d = self.to_dict()
+        log.info("[startup] mode=%s %s", self.mode, " ".join(f"{k}={v}" for k, v in d["phases_ms"].items()))
+        if STARTUP_JSONL:
+            try:
+                with open(STARTUP_JSONL, "a") as f:
+                    f.write(json.dumps(d) + "\n")
+            except OSError as e:
+                log.warning("Could not write startup profile: %s", e)
+
+
+PROFILE = StartupProfile()
+PROFILE.mark("agent_start")
+
+
+def watch(task):
+    """Stamps pipeline_started and first_frame from a PipelineTask's events; reports on the first frame."""
+    from pipecat.frames.frames import InputAudioRawFrame
+    task.set_reached_downstream_filter((InputAudioRawFrame,))
+
+    @task.event_handler("on_pipeline_started")
+    async def _on_started(*_):
+        PROFILE.mark("pipeline_started")
+
+    @task.event_handler("on_frame_reached_downstream")
+    async def _on_frame(*_):
+        task.set_reached_downstream_filter(())  # once is enough
+        PROFILE.mark("first_frame")
+        PROFILE.report()
@@ -0,0 +1,275 @@
+# services/agent/tracing.py
+"""
+Per-turn, per-stage latency tracing for the agent pipeline.
+
+A CallTrace holds the timeline of one call. Its probe() processors can be
+dropped between any two stages of the Pipeline list. Each probe stamps the
+milestones it sees, and the first probe to see a milestone in a turn wins
+(each only after the milestone it follows, see _AFTER):
+
+    speech_start   VAD/UserStartedSpeakingFrame       (opens a turn)
+    vad_end        VAD/UserStoppedSpeakingFrame
+    interim        first InterimTranscriptionFrame
+    final          first TranscriptionFrame
+    reply          first reply TextFrame (EchoLite)
+    tts_first      first TTSAudioRawFrame
+    out_first      BotStartedSpeakingFrame from transport.output()  (closes the turn)
+
+From those, the stages below go into HDR-style histograms, both per call and
+process-wide (worker mode serves many calls):
+
+    stt_interim     speech_start → interim
+    stt_final       vad_end → final      (0 when the final came before VAD end)
+    reply           final → reply
+    tts_ttfb        reply → tts_first
+    output          tts_first → out_first
+    e2e             vad_end → out_first  (what the caller hears as the gap)
+
+Exports: a per-call JSON line in TRACE_JSONL (if set) and snapshot(), served as
+GET /metrics on the control port. Recording is an isinstance check per frame
+plus O(1) bucket increments per turn.
+"""
+import os
+import json
+import math
+import time
+import logging
+import threading
+from typing import Optional
+
+from pipecat.frames.frames import (
+    Frame, EndFrame, CancelFrame, TextFrame, TranscriptionFrame, InterimTranscriptionFrame, TTSTextFrame,
+    TTSAudioRawFrame, UserStartedSpeakingFrame, UserStoppedSpeakingFrame, VADUserStartedSpeakingFrame,
+    VADUserStoppedSpeakingFrame, BotStartedSpeakingFrame,
+)
+from pipecat.processors.frame_processor import FrameProcessor, FrameDirection
+
+log = logging.getLogger("agent.trace")
+
+TRACE_ENABLED = os.getenv("TRACE_ENABLED", "1") == "1"
+TRACE_JSONL   = os.getenv("TRACE_JSONL", "")        # per-call summaries; empty = don't write
+
+STAGES = {
+    "stt_interim": ("speech_start", "interim"),
+    "stt_final":   ("vad_end", "final"),
+    "reply":       ("final", "reply"),
+    "tts_ttfb":    ("reply", "tts_first"),
+    "output":      ("tts_first", "out_first"),
+    "e2e":         ("vad_end", "out_first"),
+}
+# What a milestone needs earlier in the same turn (default: speech_start). Stamps without it
+# come from a reply that was already played or cut off by this turn's speech (barge-in):
+# trailing TTS audio or a late final after out_first closed the turn.
+_AFTER = {"tts_first": "reply", "out_first": "tts_first"}
+
+
+class LatencyHistogram:
+    """
+    Log-linear histogram in microseconds, HDR-style: values below 2*SUB land in
+    exact buckets, above that every power of two is split into SUB linear
+    buckets (~3% relative error at SUB=32). Sparse, O(1) record.
+    """
+    SUB_BITS = 5
+    SUB = 1 << SUB_BITS
+
+    def __init__(self):
+        self.counts: dict[int, int] = {}
+        self.count = 0
+        self.total_us = 0
+        self.max_us = 0
+
+    @classmethod
+    def _index(cls, v: int) -> int:
+        if v < 2 * cls.SUB:
+            return v
+        shift = v.bit_length() - cls.SUB_BITS - 1
+        return (shift + 1) * cls.SUB + (v >> shift) - cls.SUB
+
+    @classmethod
+    def _value(cls, idx: int) -> int:
+        """Midpoint of bucket `idx`."""
+        if idx < 2 * cls.SUB:
+            return idx
+        shift = idx // cls.SUB - 1
+        sub = idx % cls.SUB + cls.SUB
+        return (sub << shift) + (1 << shift) // 2
+
+    def record(self, ms: float):
+        v = max(0, int(ms * 1000))
+        i = self._index(v)
+        self.counts[i] = self.counts.get(i, 0) + 1
+        self.count += 1
+        self.total_us += v
+        if v > self.max_us:
+            self.max_us = v
+
+    def merge(self, other: "LatencyHistogram"):
+        for i, c in other.counts.items():
+            self.counts[i] = self.counts.get(i, 0) + c
+        self.count += other.count
+        self.total_us += other.total_us
+        self.max_us = max(self.max_us, other.max_us)
+
+    def quantile(self, q: float) -> Optional[float]:
+        """Value (ms) at quantile q in [0, 1]."""
+        if not self.count:
+            return None
+        rank = max(1, math.ceil(q * self.count))
+        seen = 0
+        for i in sorted(self.counts):
+            seen += self.counts[i]
+            if seen >= rank:
+                return min(self._value(i), self.max_us) / 1000
+        return self.max_us / 1000
+
+    def to_dict(self) -> dict:
+        def r(v):
+            return None if v is None else round(v, 1)
+        return {
+            "n": self.count,
+            "p50": r(self.quantile(.5)), "p90": r(self.quantile(.9)),
+            "p95": r(self.quantile(.95)), "p99": r(self.quantile(.99)),
+            "max": r(self.max_us / 1000) if self.count else None,
+            "mean": r(self.total_us / self.count / 1000) if self.count else None,
+        }
+
+
+# Process-wide histograms (all calls served by this process)
+_lock = threading.Lock()
+HISTOGRAMS: dict[str, LatencyHistogram] = {s: LatencyHistogram() for s in STAGES}
+_totals = {"calls": 0, "turns": 0, "incomplete_turns": 0}
+
+
+def snapshot() -> dict:
+    with _lock:
+        return {**_totals, "stages_ms": {s: h.to_dict() for s, h in HISTOGRAMS.items()}}
+
+
+class CallTrace:
+    def __init__(self, room: str, jsonl_path: str = TRACE_JSONL):
+        self.room = room
+        self.jsonl_path = jsonl_path
+        self.started_at = time.time()
+        self.stages = {s: LatencyHistogram() for s in STAGES}
+        self.turns: list[dict] = []
+        self.incomplete = 0
+        self.closed = False
+        self._turn: dict[str, float] = {}
+
+    def probe(self) -> "TraceProbe":
+        return TraceProbe(self)
+
+    # -------------------------
+    # timeline
+    # -------------------------
+    def mark(self, milestone: str, t: Optional[float] = None):
+        if self.closed:
+            return
+        t = time.perf_counter() if t is None else t
+        if milestone == "speech_start":
+            if "speech_start" in self._turn:
+                if "reply" not in self._turn:
+                    # the caller paused and went on: the turn ends at the next stop, not this one
+                    self._turn.pop("vad_end", None)
+                    self._turn.pop("final", None)
+                return  # VAD and user frames both announce the same start
+            if self._turn:
+                self._end_turn(complete=False)
+        elif _AFTER.get(milestone, "speech_start") not in self._turn:
+            return
+        if milestone not in self._turn:
+            self._turn[milestone] = t
+        if milestone == "out_first":
+            self._end_turn(complete="vad_end" in self._turn)
+
+    def _end_turn(self, complete: bool):
+        turn, self._turn = self._turn, {}
+        if not complete:
+            if "vad_end" in turn:
+                self.incomplete += 1  # user spoke again (or hung up) before the reply played
+            return
+        row = {}
+        for stage, (a, b) in STAGES.items():
+            if a in turn and b in turn:
+                ms = max(0.0, (turn[b] - turn[a]) * 1000)
+                row[stage] = round(ms, 1)
+                self.stages[stage].record(ms)
+        self.turns.append(row)
+        log.info("[latency] room=%s turn=%d user→tts-first ~%.1f ms (%s)", self.room, len(self.turns),
+                 row.get("e2e", 0.0), " ".join(f"{k}={v}" for k, v in row.items() if k != "e2e"))
+
+    # -------------------------
+    # export
+    # -------------------------
+    def summary(self) -> dict:
+        e2e = [t["e2e"] for t in self.turns if "e2e" in t]
+        later = sorted(e2e[1:])
+        return {
+            "room": self.room,
+            "started_at": round(self.started_at, 3),
+            "duration_s": round(time.time() - self.started_at, 1),
+            "turns": len(self.turns),
+            "incomplete_turns": self.incomplete,
+            "first_turn_e2e_ms": e2e[0] if e2e else None,
+            "later_turns_e2e_p50_ms": later[len(later) // 2] if later else None,
+            "stages_ms": {s: h.to_dict() for s, h in self.stages.items()},
+            "turn_detail": self.turns,
+        }
+
+    def close(self):
+        if self.closed:
+            return
+        self.closed = True
+        s = self.summary()
+        with _lock:
+            for stage, h in self.stages.items():
+                HISTOGRAMS[stage].merge(h)
+            _totals["calls"] += 1
+            _totals["turns"] += len(self.turns)
+            _totals["incomplete_turns"] += self.incomplete
+        if self.turns:
+            log.info("[latency] room=%s first turn %s ms, later turns p50 %s ms (n=%d)", self.room,
+                     s["first_turn_e2e_ms"], s["later_turns_e2e_p50_ms"], max(0, len(self.turns) - 1))
+        if self.jsonl_path:
+            try:
+                with open(self.jsonl_path, "a") as f:
+                    f.write(json.dumps(s) + "\n")
+            except OSError as e:
+                log.warning("Could not write trace for room=%s: %s", self.room, e)
+
+
+class TraceProbe(FrameProcessor):
+    """Pass-through processor that stamps pipeline milestones on its CallTrace."""
+    def __init__(self, trace: CallTrace, **kwargs):
+        super().__init__(**kwargs)
+        self.trace = trace
+
+    async def process_frame(self, frame: Frame, direction: FrameDirection):
+        await super().process_frame(frame, direction)
+        if direction == FrameDirection.DOWNSTREAM:
+            m = _milestone(frame)
+            if m:
+                self.trace.mark(m)
+            elif isinstance(frame, (EndFrame, CancelFrame)):
+                self.trace.close()
+        await self.push_frame(frame, direction)
+
+
+def _milestone(frame: Frame) -> Optional[str]:
+    if isinstance(frame, TextFrame):
+        if isinstance(frame, InterimTranscriptionFrame):
+            return "interim"
+        if isinstance(frame, TranscriptionFrame):
+            return "final"
+        if isinstance(frame, TTSTextFrame):
+            return None
+        return "reply"
+    if isinstance(frame, TTSAudioRawFrame):
+        return "tts_first"
+    if isinstance(frame, (VADUserStoppedSpeakingFrame, UserStoppedSpeakingFrame)):
+        return "vad_end"
+    if isinstance(frame, (VADUserStartedSpeakingFrame, UserStartedSpeakingFrame)):
+        return "speech_start"
+    if isinstance(frame, BotStartedSpeakingFrame):
+        return "out_first"
+    return None
@@ -0,0 +1,316 @@
+# services/agent/tts_cache.py
+"""
+PCM cache for the fixed parts of replies, in front of ElevenLabs.
+
+Every EchoLite reply is "You said: {text}. Got it!", so the same two phrases
+used to be synthesized (and billed) on every turn. CachedElevenLabsTTS splits
+each sentence it is asked to speak into segments. Segments matching
+TTS_CACHE_PHRASES are cacheable; the rest is dynamic. Every segment gets its
+own pipecat audio context. pipecat plays contexts strictly in order, so:
+
+  - a cached segment is queued as a ready-made context and plays as soon as
+    it reaches the front, while the dynamic text after it is still being
+    synthesized;
+  - a cacheable segment that misses is synthesized normally and its PCM is
+    captured into the cache once all of its characters have come back
+    (counted from ElevenLabs' alignment data).
+
+PCMCache is keyed by (voice, model, sample rate, text). The in-memory tier is
+an LRU bounded by TTS_CACHE_MEM_BYTES. With TTS_CACHE_DIR set, entries are also
+written there and read back through mmap. That tier is shared by every call
+and process on the host and lives in the page cache, not the heap.
+
+A synthesized segment is complete once all of its characters have been
+aligned, but its context is only removed after the vendor's isFinal for it or
+TTS_CACHE_DRAIN_MS without further audio, so trailing chunks still play.
+
+stats() (served in /metrics): hits, misses, hit ratio, bytes and characters
+not sent to the vendor.
+
+Built against pipecat-ai==0.0.80 (pinned in requirements.txt). There are no
+public hooks for per-segment contexts, so this overrides ElevenLabsTTSService
+internals: run_tts, _get_websocket, append_to_audio_context,
+_audio_context_task_handler and _handle_interruption, and it reads _websocket,
+_context_id, _contexts and _contexts_queue. Re-check them when upgrading.
+"""
+import os
+import re
+import json
+import mmap
+import time
+import uuid
+import asyncio
+import hashlib
+import logging
+from collections import OrderedDict
+from typing import AsyncGenerator, Optional
+
+from pipecat.frames.frames import Frame, TTSAudioRawFrame, TTSStartedFrame, TTSStoppedFrame, StartInterruptionFrame
+from pipecat.processors.frame_processor import FrameDirection
+from websockets.protocol import State
+
+from prewarm import PrewarmElevenLabsTTS
+
+log = logging.getLogger("agent.tts_cache")
+
+TTS_CACHE_ENABLED   = os.getenv("TTS_CACHE_ENABLED", "1") == "1"
+TTS_CACHE_PHRASES   = [p for p in os.getenv("TTS_CACHE_PHRASES", "You said:|Got it!").split("|") if p]
+TTS_CACHE_MEM_BYTES = int(os.getenv("TTS_CACHE_MEM_BYTES", str(32 * 1024 * 1024)))
+TTS_CACHE_DIR       = os.getenv("TTS_CACHE_DIR", "")       # empty = memory only
+TTS_CACHE_CHUNK_MS  = int(os.getenv("TTS_CACHE_CHUNK_MS", "40"))
+TTS_CACHE_DRAIN_MS  = float(os.getenv("TTS_CACHE_DRAIN_MS", "150"))  # quiet time before a finished segment's context closes
+
+
+def cache_key(voice_id: str, model: str, sample_rate: int, text: str) -> str:
+    return hashlib.sha1(f"{voice_id}\0{model}\0{sample_rate}\0{text}".encode()).hexdigest()
+
+
+def split_segments(text: str, phrases: list[str]) -> list[tuple[str, bool]]:
+    """Splits `text` into (segment, cacheable) pairs around the fixed phrases."""
+    if not phrases:
+        return [(text, False)]
+    pattern = re.compile("(" + "|".join(re.escape(p) for p in phrases) + ")")
+    out = []
+    for i, part in enumerate(pattern.split(text)):
+        if part.strip():
+            out.append((part.strip() if i % 2 else part, bool(i % 2)))
+    return out
+
+
+class PCMCache:
+    def __init__(self, max_bytes: int = TTS_CACHE_MEM_BYTES, directory: str = TTS_CACHE_DIR):
+        self.max_bytes = max_bytes
+        self.directory = directory
+        self._mem: OrderedDict[str, bytes] = OrderedDict()
+        self._maps: dict[str, mmap.mmap] = {}
+        self.bytes = 0
+        self.stats = {"hits": 0, "misses": 0, "disk_hits": 0, "stored": 0, "evicted": 0,
+                      "bytes_saved": 0, "chars_saved": 0}
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.directory, f"{key}.pcm")
+
+    def get(self, key: str):
+        """PCM for `key` (bytes or mmap), or None."""
+        pcm = self._mem.get(key)
+        if pcm is not None:
+            self._mem.move_to_end(key)
+            return pcm
+        m = self._maps.get(key)
+        if m is not None:
+            return m
+        if self.directory:
+            try:
+                with open(self._path(key), "rb") as f:
+                    m = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            except (OSError, ValueError):
+                return None
+            self._maps[key] = m
+            self.stats["disk_hits"] += 1
+            return m
+        return None
+
+    def put(self, key: str, pcm: bytes):
+        if not pcm or len(pcm) > self.max_bytes:
+            return
+        if key in self._mem:
+            self.bytes -= len(self._mem.pop(key))
+        self._mem[key] = pcm
+        self.bytes += len(pcm)
+        self.stats["stored"] += 1
+        while self.bytes > self.max_bytes:
+            _, old = self._mem.popitem(last=False)
+            self.bytes -= len(old)
+            self.stats["evicted"] += 1
+        if self.directory and not os.path.exists(self._path(key)):
+            tmp = f"{self._path(key)}.{os.getpid()}.tmp"
+            try:
+                with open(tmp, "wb") as f:
+                    f.write(pcm)
+                os.replace(tmp, self._path(key))  # atomic: readers never see a partial file
+            except OSError as e:
+                log.warning("Could not write TTS cache entry %s: %s", key, e)
+
+    def snapshot(self) -> dict:
+        lookups = self.stats["hits"] + self.stats["misses"]
+        return {**self.stats,
+                "hit_ratio": round(self.stats["hits"] / lookups, 3) if lookups else None,
+                "mem_bytes": self.bytes, "mem_entries": len(self._mem), "disk_mapped": len(self._maps)}
+
+
+# One cache per process: worker mode shares it across rooms
+CACHE = PCMCache()
+
+
+def stats() -> dict:
+    return CACHE.snapshot()
+
+
+def _chars(text: str) -> int:
+    return sum(1 for c in text if not c.isspace())
+
+
+class CachedElevenLabsTTS(PrewarmElevenLabsTTS):
+    """ElevenLabs websocket TTS that serves TTS_CACHE_PHRASES from PCMCache."""
+
+    def __init__(self, *, cache: PCMCache = CACHE, phrases: list[str] = TTS_CACHE_PHRASES, **kwargs):
+        super().__init__(**kwargs)
+        self._cache = cache
+        self._phrases = phrases
+        # vendor contexts in flight: ctx -> {"expect", "got", "key", "pcm", "done", "last", "drain"}
+        self._segments: dict[str, dict] = {}
+        self._tails: set[str] = set()   # contexts that end a sentence (silence follows)
+
+    def _key(self, text: str) -> str:
+        return cache_key(self._voice_id, self.model_name, self.sample_rate, text)
+
+    # -------------------------
+    # synthesis
+    # -------------------------
+    async def run_tts(self, text: str) -> AsyncGenerator[Frame, None]:
+        log.debug("%s: generating TTS [%s]", self, text)
+        if not self._started:
+            await self.start_ttfb_metrics()
+            yield TTSStartedFrame()
+            self._started = True
+            self._cumulative_time = 0   # word timestamps run across the reply's segments
+        segments = split_segments(text, self._phrases)
+        for i, (seg, cacheable) in enumerate(segments):
+            key = self._key(seg) if cacheable else None
+            pcm = self._cache.get(key) if key else None
+            if key:
+                self._cache.stats["hits" if pcm is not None else "misses"] += 1
+            try:
+                if pcm is not None:
+                    ctx = await self._play_cached(seg, pcm)
+                else:
+                    ctx = await self._synthesize(seg, key)
+            except Exception as e:
+                log.error("%s error sending segment: %s", self, e)
+                yield TTSStoppedFrame()
+                self._started = False
+                return
+            if i == len(segments) - 1:
+                self._tails.add(ctx)
+        yield None
+
+    async def _play_cached(self, text: str, pcm) -> str:
+        await self.stop_ttfb_metrics()
+        self._cache.stats["bytes_saved"] += len(pcm)
+        self._cache.stats["chars_saved"] += _chars(text)
+        ctx = str(uuid.uuid4())
+        await self.create_audio_context(ctx)
+        step = max(2, self.sample_rate * 2 * TTS_CACHE_CHUNK_MS // 1000)
+        for i in range(0, len(pcm), step):
+            await self.append_to_audio_context(ctx, TTSAudioRawFrame(bytes(pcm[i:i + step]), self.sample_rate, 1))
+        await self.remove_audio_context(ctx)
+        return ctx
+
+    async def _synthesize(self, text: str, key: Optional[str]) -> str:
+        if not self._websocket or self._websocket.state is State.CLOSED:   # as run_tts
+            await self._connect()
+        ctx = str(uuid.uuid4())
+        await self.create_audio_context(ctx)
+        self._context_id = ctx
+        self._segments[ctx] = {"expect": _chars(text), "got": 0, "key": key,
+                               "pcm": bytearray() if key else None, "done": False, "last": 0.0, "drain": None}
+        msg = {"text": " ", "context_id": ctx}
+        if self._voice_settings:
+            msg["voice_settings"] = self._voice_settings
+        await self._websocket.send(json.dumps(msg))
+        await self._send_text(text)
+        await self._websocket.send(json.dumps({"context_id": ctx, "flush": True}))
+        await self.start_tts_usage_metrics(text)
+        return ctx
+
+    # -------------------------
+    # segment completion
+    # -------------------------
+    def _get_websocket(self):
+        return self._tap(super()._get_websocket())
+
+    async def _tap(self, ws):
+        """Sees each vendor message before pipecat handles it, to count aligned characters."""
+        async for message in ws:
+            try:
+                msg = json.loads(message)
+                ctx = msg.get("contextId")
+                seg = self._segments.get(ctx)
+                if seg is not None and seg["done"] and msg.get("isFinal"):
+                    await self._finish_segment(ctx)   # everything before it has been handled
+                elif seg is not None and msg.get("alignment"):
+                    seg["got"] += sum(_chars(c) for c in msg["alignment"].get("chars", []))
+                    seg["done"] = seg["got"] >= seg["expect"]
+            except (ValueError, AttributeError, TypeError):
+                pass
+            yield message
+
+    async def append_to_audio_context(self, context_id: str, frame: TTSAudioRawFrame):
+        await super().append_to_audio_context(context_id, frame)
+        seg = self._segments.get(context_id)
+        if seg is None:
+            return
+        if seg["pcm"] is not None:
+            seg["pcm"] += frame.audio
+        seg["last"] = time.monotonic()
+        if seg["done"] and seg["drain"] is None:
+            # all characters are back: close the context once trailing chunks stop, so the next
+            # context plays without waiting for pipecat's 3 s context timeout
+            seg["drain"] = self.create_task(self._drain(context_id), f"{self}::drain")
+
+    async def _drain(self, context_id: str):
+        while (seg := self._segments.get(context_id)) is not None:
+            wait = seg["last"] + TTS_CACHE_DRAIN_MS / 1000 - time.monotonic()
+            if wait <= 0:
+                seg["drain"] = None   # finishing from here: don't cancel ourselves
+                await self._finish_segment(context_id)
+                return
+            await asyncio.sleep(wait)
+
+    async def _finish_segment(self, context_id: str):
+        seg = self._segments.pop(context_id, None)
+        if seg is None:
+            return
+        if seg["drain"] is not None:
+            await self.cancel_task(seg["drain"])
+        if self._context_id == context_id:
+            self._context_id = None  # so late messages don't reopen the context
+        if seg["key"]:
+            self._cache.put(seg["key"], bytes(seg["pcm"]))
+        await self.remove_audio_context(context_id)
+
+    async def _audio_context_task_handler(self):
+        """pipecat's ordered player, with the inter-sentence silence only after a sentence's last segment."""
+        running = True
+        while running:
+            context_id = await self._contexts_queue.get()
+            if context_id:
+                await self._handle_audio_context(context_id)
+                del self._contexts[context_id]
+                seg = self._segments.pop(context_id, None)
+                if seg is not None and seg["drain"] is not None:
+                    await self.cancel_task(seg["drain"])
+                if context_id in self._tails:
+                    self._tails.discard(context_id)
+                    silence = b"\x00" * self.sample_rate
+                    await self.push_frame(TTSAudioRawFrame(audio=silence, sample_rate=self.sample_rate, num_channels=1))
+            else:
+                running = False
+            self._contexts_queue.task_done()
+
+    async def _handle_interruption(self, frame: StartInterruptionFrame, direction: FrameDirection):
+        # The base class only closes the current context; close every segment still generating
+        for ctx in list(self._segments):
+            if ctx != self._context_id and self._websocket:
+                try:
+                    await self._websocket.send(json.dumps({"context_id": ctx, "close_context": True}))
+                except Exception as e:
+                    log.debug("%s error closing context %s: %s", self, ctx, e)
+        await super()._handle_interruption(frame, direction)
+        for seg in self._segments.values():
+            if seg["drain"] is not None:
+                await self.cancel_task(seg["drain"])
+        self._segments.clear()
+        self._tails.clear()
@@ -0,0 +1,279 @@
+# services/agent/turn_detect.py
+"""
+Adaptive end-of-turn detection (TURN_DETECT_ENABLED=1).
+
+Without it a turn ends when Silero has heard VAD stop_secs (0.8 s) of silence:
+UserStoppedSpeakingFrame makes Deepgram finalize, and the final transcript goes
+straight to the replier. That fixed silence is the largest single wait in a
+phone turn. With turn detection the VAD reports a stop after TURN_VAD_STOP_S,
+and TurnDetector (between STT and the replier) holds the turn's finals until
+it decides the caller is done. How much more silence it waits for depends on
+what was said:
+
+    utterance end   Deepgram UtteranceEnd event                 → at once
+    continuation    ends in "and", "um", ",", "..."            × TURN_HOLD_FACTOR
+    question        ends in "?" or opens like a question        × TURN_QUESTION_FACTOR
+    punctuation     ends in "." or "!"                          × TURN_PUNCT_FACTOR
+    stable          no new interim/final for TURN_STABLE_MS     × TURN_STABLE_FACTOR
+
+Silence is counted from the VAD stop and capped at TURN_SILENCE_MAX_MS. While
+Deepgram still has words it has not finalized, only the cap applies.
+
+The budget adapts per call. It starts at TURN_SILENCE_MS and shrinks by
+TURN_DECAY after every turn. It grows by TURN_BACKOFF after a false endpoint,
+which is the caller speaking again within TURN_FALSE_WINDOW_MS of a decision
+(they were cut off). It never drops below 1.25x the caller's usual mid-turn
+pause.
+
+Stats (stats(), served in /metrics):
+- decisions by cue
+- false endpoints and their rate
+- histograms of the silence waited after the VAD stop (decide_ms)
+- histograms of how long the finals were held (held_ms)
+
+Tune the factors by trading decide_ms against false_endpoint_rate.
+"""
+import os
+import re
+import time
+import asyncio
+import logging
+from typing import Optional
+
+from deepgram import LiveOptions
+from pipecat.frames.frames import (
+    Frame, TranscriptionFrame, InterimTranscriptionFrame, UserStartedSpeakingFrame, UserStoppedSpeakingFrame,
+    VADUserStartedSpeakingFrame, VADUserStoppedSpeakingFrame, EndFrame, CancelFrame,
+)
+from pipecat.processors.frame_processor import FrameProcessor, FrameDirection
+
+from tracing import LatencyHistogram
+
+log = logging.getLogger("agent.turn")
+
+TURN_DETECT_ENABLED  = os.getenv("TURN_DETECT_ENABLED", "0") == "1"
+TURN_VAD_STOP_S      = float(os.getenv("TURN_VAD_STOP_S", "0.2"))        # Silero stop_secs when enabled
+TURN_SILENCE_MS      = float(os.getenv("TURN_SILENCE_MS", "500"))        # initial per-call budget
+TURN_SILENCE_MIN_MS  = float(os.getenv("TURN_SILENCE_MIN_MS", "150"))
+TURN_SILENCE_MAX_MS  = float(os.getenv("TURN_SILENCE_MAX_MS", "1500"))   # hard cap after the VAD stop
+TURN_STABLE_MS       = float(os.getenv("TURN_STABLE_MS", "300"))
+TURN_PUNCT_FACTOR    = float(os.getenv("TURN_PUNCT_FACTOR", "0.6"))
+TURN_QUESTION_FACTOR = float(os.getenv("TURN_QUESTION_FACTOR", "0.4"))
+TURN_HOLD_FACTOR     = float(os.getenv("TURN_HOLD_FACTOR", "2.0"))
+TURN_STABLE_FACTOR   = float(os.getenv("TURN_STABLE_FACTOR", "0.7"))
+TURN_DECAY           = float(os.getenv("TURN_DECAY", "0.95"))
+TURN_BACKOFF         = float(os.getenv("TURN_BACKOFF", "1.5"))
+TURN_FALSE_WINDOW_MS = float(os.getenv("TURN_FALSE_WINDOW_MS", "1000"))
+TURN_UTTERANCE_END_MS = int(os.getenv("TURN_UTTERANCE_END_MS", "1000"))  # Deepgram minimum is 1000
+
+PAUSE_MARGIN = 1.25
+
+_WORDS = re.compile(r"[\w']+")
+_SENTENCE = re.compile(r"[.!?]\s+")
+QUESTION_OPENERS = frozenset(
+    "what when where who whom whose why how which is are am was were do does did can could will would "
+    "should shall may might have has had isn't aren't don't doesn't didn't can't won't".split())
+CONTINUATIONS = frozenset(
+    "and but or so because um uh er like the a an to of for with if that my your our i then than "
+    "which who where when".split())
+
+_stats = {"decisions": 0, "false_endpoints": 0, "cues": {}}
+DECIDE_MS = LatencyHistogram()   # VAD stop → decision
+HELD_MS = LatencyHistogram()     # first final of the turn → decision
+
+
+def stats() -> dict:
+    s = {**_stats, "cues": dict(_stats["cues"])}
+    s["false_endpoint_rate"] = round(s["false_endpoints"] / s["decisions"], 3) if s["decisions"] else None
+    s["decide_ms"] = DECIDE_MS.to_dict()
+    s["held_ms"] = HELD_MS.to_dict()
+    return s
+
+
+def text_cue(text: str) -> tuple[str, float]:
+    """What the transcript so far says about the caller being done: (cue, budget factor)."""
+    t = text.strip()
+    words = _WORDS.findall(t.lower())
+    if not words:
+        return "none", 1.0
+    if t.endswith((",", "-", "...", "…")) or words[-1] in CONTINUATIONS:
+        return "continuation", TURN_HOLD_FACTOR
+    opener = _WORDS.findall(_SENTENCE.split(t)[-1].lower())
+    if t.endswith("?") or (opener and opener[0] in QUESTION_OPENERS):
+        return "question", TURN_QUESTION_FACTOR
+    if t.endswith((".", "!")):
+        return "punctuation", TURN_PUNCT_FACTOR
+    return "none", 1.0
+
+
+def deepgram_options(model: str) -> LiveOptions:
+    """Deepgram settings that give TurnDetector UtteranceEnd events (see attach())."""
+    return LiveOptions(model=model, interim_results=True, punctuate=True, vad_events=True,
+                       utterance_end_ms=str(TURN_UTTERANCE_END_MS))
+
+
+class TurnDetector(FrameProcessor):
+    """Placed after STT: holds final transcripts until the caller's turn is judged over."""
+    def __init__(self, room: str = "", silence_ms: float = TURN_SILENCE_MS, **kwargs):
+        super().__init__(**kwargs)
+        self.room = room
+        self.budget_ms = silence_ms
+        self.decisions = 0
+        self.false_endpoints = 0
+        self.decide_ms = LatencyHistogram()
+        self._finals: list[TranscriptionFrame] = []
+        self._speaking = False
+        self._stopped_at: Optional[float] = None   # silence start of the open turn
+        self._first_final_at = 0.0
+        self._final_at = 0.0
+        self._interim_at = 0.0
+        self._interim = ""
+        self._changed_at = 0.0                     # last new interim/final text
+        self._utterance_end = False
+        self._decided_at: Optional[float] = None
+        self._pause_ms: Optional[float] = None     # EWMA of the caller's mid-turn pauses
+        self._timer: Optional[asyncio.TimerHandle] = None
+        self._closed = False
+
+    def attach(self, stt):
+        """Feeds Deepgram UtteranceEnd events in; stt needs deepgram_options() (vad_events)."""
+        if getattr(stt, "vad_enabled", False):
+            @stt.event_handler("on_utterance_end")
+            async def _on_utterance_end(*_):
+                await self.utterance_end()
+
+    async def process_frame(self, frame: Frame, direction: FrameDirection):
+        await super().process_frame(frame, direction)
+        if direction != FrameDirection.DOWNSTREAM:
+            await self.push_frame(frame, direction)
+            return
+        now = time.perf_counter()
+        if isinstance(frame, TranscriptionFrame) and frame.text:
+            if not self._finals:
+                self._first_final_at = now
+            self._finals.append(frame)
+            self._final_at = self._changed_at = now
+            if not self._speaking and self._stopped_at is None:
+                self._stopped_at = now  # no VAD stop for these words (VAD off, or a late final)
+            await self._rearm()
+            return  # held until the turn ends
+        if isinstance(frame, InterimTranscriptionFrame) and frame.text:
+            if frame.text != self._interim:
+                self._interim = frame.text
+                self._interim_at = self._changed_at = now
+                await self._rearm()
+        elif isinstance(frame, (UserStartedSpeakingFrame, VADUserStartedSpeakingFrame)):
+            await self._on_speech_start(now)
+        elif isinstance(frame, (UserStoppedSpeakingFrame, VADUserStoppedSpeakingFrame)):
+            if self._speaking:
+                self._speaking = False
+                self._stopped_at = now
+                await self._rearm()
+        elif isinstance(frame, (EndFrame, CancelFrame)):
+            self._stop_timer()
+            self._log_call()
+        await self.push_frame(frame, direction)
+
+    async def utterance_end(self):
+        """Deepgram heard no words for utterance_end_ms: the turn is over, whatever the VAD says."""
+        if not self._finals:
+            return
+        self._utterance_end = True
+        if self._speaking:
+            self._speaking = False  # noise keeping the VAD open
+        if self._stopped_at is None:
+            self._stopped_at = time.perf_counter()
+        await self._rearm()
+
+    async def _on_speech_start(self, now: float):
+        if self._speaking:
+            return  # VAD and user frames both announce the same start
+        self._speaking = True
+        self._stop_timer()
+        if self._decided_at is not None:
+            if (now - self._decided_at) * 1000 <= TURN_FALSE_WINDOW_MS:
+                self.false_endpoints += 1
+                _stats["false_endpoints"] += 1
+                self.budget_ms = min(TURN_SILENCE_MAX_MS, self.budget_ms * TURN_BACKOFF)
+                log.debug("False endpoint %.0f ms after the decision; budget now %.0f ms",
+                          (now - self._decided_at) * 1000, self.budget_ms)
+            self._decided_at = None
+        if self._stopped_at is not None:
+            # the caller paused and went on: a pause to wait out next time
+            p = (now - self._stopped_at) * 1000
+            self._pause_ms = p if self._pause_ms is None else 0.8 * self._pause_ms + 0.2 * p
+            self._stopped_at = None
+        self._utterance_end = False
+
+    # -------------------------
+    # decision
+    # -------------------------
+    def _plan(self) -> tuple[float, str]:
+        """(deadline, cue): when the open turn ends if nothing else happens."""
+        ceiling = self._stopped_at + TURN_SILENCE_MAX_MS / 1000
+        if self._utterance_end:
+            return self._stopped_at, "utterance_end"
+        if self._interim_at > self._final_at:
+            return ceiling, "ceiling"  # Deepgram still owes a final for the last words
+        cue, factor = text_cue(" ".join(f.text for f in self._finals))
+        wait = max(self.budget_ms, PAUSE_MARGIN * (self._pause_ms or 0.0)) * factor / 1000
+        deadline = self._stopped_at + wait
+        stable = max(self._changed_at + TURN_STABLE_MS / 1000, self._stopped_at + wait * TURN_STABLE_FACTOR)
+        if stable < deadline:
+            deadline, cue = stable, cue + "+stable"
+        if ceiling < deadline:
+            return ceiling, "ceiling"
+        return deadline, cue
+
+    async def _rearm(self):
+        self._stop_timer()
+        if self._speaking or self._stopped_at is None or not self._finals:
+            return
+        deadline, cue = self._plan()
+        delay = deadline - time.perf_counter()
+        if delay <= 0:
+            await self._decide(cue)
+        else:
+            # A plain loop timer, not a task: re-armed on most frames, and cancelling a task
+            # from process_frame could swallow the processor's own CancelFrame teardown
+            self._timer = asyncio.get_running_loop().call_later(delay, self._on_timer)
+
+    def _on_timer(self):
+        self._timer = None
+        self.create_task(self._rearm())
+
+    async def _decide(self, cue: str):
+        now = time.perf_counter()
+        finals, self._finals = self._finals, []
+        waited = (now - self._stopped_at) * 1000
+        self.decisions += 1
+        self.decide_ms.record(waited)
+        _stats["decisions"] += 1
+        _stats["cues"][cue] = _stats["cues"].get(cue, 0) + 1
+        DECIDE_MS.record(waited)
+        HELD_MS.record((now - self._first_final_at) * 1000)
+        self.budget_ms = max(TURN_SILENCE_MIN_MS, self.budget_ms * TURN_DECAY)
+        self._stopped_at = None
+        self._utterance_end = False
+        self._interim_at = self._final_at = 0.0
+        self._decided_at = now
+        last = finals[-1]
+        if len(finals) > 1:
+            last = TranscriptionFrame(" ".join(f.text for f in finals), last.user_id, last.timestamp,
+                                      last.language, result=last.result)
+        log.debug("End of turn after %.0f ms of silence (%s): %s", waited, cue, last.text)
+        await self.push_frame(last)
+
+    def _stop_timer(self):
+        if self._timer:
+            self._timer.cancel()
+            self._timer = None
+
+    def _log_call(self):
+        if self._closed:
+            return
+        self._closed = True
+        if self.decisions:
+            log.info("[turn] room=%s %d turns, %d false endpoints, silence waited p50 %s ms, budget now %.0f ms",
+                     self.room, self.decisions, self.false_endpoints, self.decide_ms.to_dict()["p50"],
+                     self.budget_ms)
@@ -0,0 +1,112 @@
+# services/agent/vad.py
+"""
+Per-room Silero VAD analyzers that share one loaded model.
+
+pipecat's SileroVADAnalyzer wraps an ONNX InferenceSession (the weights, by far
+the largest part) plus a few small recurrent-state arrays that must not be
+shared between audio streams. clone_vad() copies the analyzer and its model
+wrapper shallowly, so the session is reused while each room gets fresh state.
+
+The model is loaded once per process, by preload(), in a background thread.
+room_vad() never waits for it. Before the load finishes it returns a
+DeferredVAD. The transport can build and join the room with that, and it only
+adopts the model on the first audio it analyzes. That runs on the transport's
+VAD thread, not the event loop.
+"""
+import copy
+import time
+import logging
+import threading
+from concurrent.futures import Future
+from typing import Optional
+
+from pipecat.audio.vad.vad_analyzer import VADAnalyzer, VADParams
+
+import startup
+
+log = logging.getLogger("agent.vad")
+
+_loading: Optional[Future] = None
+_params: Optional[VADParams] = None
+_lock = threading.Lock()
+
+
+def clone_vad(template):
+    """Returns a fresh analyzer for one room that shares `template`'s ONNX session."""
+    if template is None:
+        return None
+    vad = copy.copy(template)
+    model = getattr(template, "_model", None)
+    if model is not None:
+        vad._model = copy.copy(model)
+        vad._model.reset_states()
+    return vad
+
+
+def preload(params: Optional[VADParams] = None) -> Future:
+    """Starts loading the shared Silero model (once per process); the future yields it, or None."""
+    global _loading, _params
+    with _lock:
+        if _loading is None:
+            _loading, _params = Future(), params
+            threading.Thread(target=_load, args=(_loading, params), name="vad-load", daemon=True).start()
+    return _loading
+
+
+def _load(fut: Future, params: Optional[VADParams]):
+    startup.PROFILE.mark("vad_load_start")
+    try:
+        from pipecat.audio.vad.silero import SileroVADAnalyzer  # onnxruntime, no torch
+        fut.set_result(SileroVADAnalyzer(params=params))
+    except Exception as e:
+        log.warning("Silero VAD unavailable, rooms run without VAD: %s", e)
+        fut.set_result(None)
+    startup.PROFILE.mark("vad_loaded")
+
+
+def shared_vad() -> Optional[VADAnalyzer]:
+    """The loaded template (blocks until the load is done)."""
+    return preload().result()
+
+
+def room_vad() -> Optional[VADAnalyzer]:
+    """A fresh analyzer for one room: a clone once the model is loaded, a DeferredVAD until then."""
+    fut = preload()
+    if fut.done():
+        return clone_vad(fut.result())
+    return DeferredVAD(fut, _params)
+
+
+class DeferredVAD(VADAnalyzer):
+    """
+    Stands in for a room's SileroVADAnalyzer while the model loads: same frame
+    sizing and sample-rate rules; the first analysis waits for the model and
+    then delegates to a clone of it.
+    """
+    def __init__(self, loading: Future, params: Optional[VADParams] = None):
+        super().__init__(params=params)
+        self._loading = loading
+        self._vad: Optional[VADAnalyzer] = None
+        self._unavailable = False
+
+    def set_sample_rate(self, sample_rate: int):
+        if sample_rate not in (8000, 16000):
+            raise ValueError(f"Silero VAD sample rate needs to be 16000 or 8000 (sample rate: {sample_rate})")
+        super().set_sample_rate(sample_rate)
+
+    def num_frames_required(self) -> int:
+        return 512 if self.sample_rate == 16000 else 256
+
+    def voice_confidence(self, buffer) -> float:
+        if self._vad is None:
+            if self._unavailable:
+                return 0.0
+            t = time.perf_counter()
+            template = self._loading.result()
+            startup.PROFILE.span("vad_wait", (time.perf_counter() - t) * 1000)
+            self._vad = clone_vad(template)
+            if self._vad is None:
+                self._unavailable = True
+                return 0.0
+            self._vad.set_sample_rate(self.sample_rate)
+        return self._vad.voice_confidence(buffer)
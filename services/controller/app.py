@@ -1,29 +1,184 @@
 # services/controller/controller.py
-import os, json, logging
-from fastapi import FastAPI, Request
+import os, json, time, logging
+from contextlib import asynccontextmanager
+from fastapi import FastAPI, Request, HTTPException
 from dotenv import load_dotenv
 from utils.token import mint_livekit_token
-from launch_agent import launch_agent, stop_agent
+from launch_agent import stop_agent, list_agent_tasks, describe_task_batch
+from launch_queue import LaunchQueue
+from pool import AgentPool, POOL_ENABLED
+from registry import SQLiteRegistry, INSTANCE_ID
+from setup_latency import SetupLatency
+from task_tracker import TaskTracker
 
 load_dotenv()
-app = FastAPI()
 log = logging.getLogger("controller")
 logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(name)s: %(message)s")
 
-# Track running ECS tasks per room (room_name -> taskArn)
-AGENTS: dict[str, str] = {}
+# Room → agent task records, shared by every controller process on this host
+REGISTRY = SQLiteRegistry()
 
 TOKEN_TTL = int(os.getenv("CONTROLLER_TOKEN_TTL_SECONDS", "900"))
 LIVEKIT_URL = os.getenv("LIVEKIT_URL")
+CLAIM_STALE_S = float(os.getenv("REGISTRY_CLAIM_STALE_S", "120"))  # pending claim with no task → take over
+
+# room_started → agent publishing, per phase (this process's rooms)
+SETUP = SetupLatency()
+
+# Warm pool of pre-started agents (POOL_ENABLED=1); None means cold launch per call
+POOL: AgentPool | None = None
+
+def _mint(room: str) -> str:
+    # Minting a short-lived token the agent will use to join the room
+    return mint_livekit_token(room=room, identity=f"agent-{room}", ttl_seconds=TOKEN_TTL)
+
+def _on_launch_state(st: dict):
+    REGISTRY.update(st["room"], state=st["state"], error=st["error"])
+
+async def _on_launched(room: str, task_arn: str):
+    SETUP.launched(room, LAUNCHES.status.get(room))
+    if not REGISTRY.update(room, state="launched", task_arn=task_arn, shared=False, error=None):
+        # room_finished reached another controller process while we were launching
+        log.info("Room %s ended during launch; stopping task=%s", room, task_arn)
+        await LAUNCHES.run_blocking(stop_agent, task_arn)
+        return
+    TRACKER.track(task_arn, room)
+
+async def _on_task_transition(task_arn: str, room: str | None, old: str | None, new: str, info: dict):
+    """Keeps room state in line with ECS; replaces agents that die or never come up."""
+    for r in REGISTRY.by_task(task_arn):
+        if new == "RUNNING":
+            REGISTRY.update(r, state="running")
+            SETUP.running(r, info)
+        elif new == "STUCK":
+            log.warning("Agent task=%s for room=%s stuck in %s; stopping to replace it", task_arn, r, old)
+            await LAUNCHES.run_blocking(stop_agent, task_arn, "stuck_before_running")
+            break  # the STOPPED transition that follows does the replacement
+        elif new == "STOPPED":
+            if info.get("exitCode") == 0:
+                # The agent finished the call and exited; room_finished is on its way
+                REGISTRY.update(r, state="exited")
+                continue
+            # compare-and-set on the task so only one controller process replaces it
+            if not REGISTRY.update(r, expect_task_arn=task_arn, task_arn=None, shared=False, state="pending",
+                                   owner=INSTANCE_ID):
+                continue
+            log.warning("Agent task=%s for live room=%s stopped (%s); relaunching",
+                        task_arn, r, info.get("stoppedReason"))
+            LAUNCHES.forget(r)
+            LAUNCHES.submit(r, _mint(r))["replaces"] = task_arn
+
+# RunTask/StopTask run on this queue's thread pool, never on the event loop
+LAUNCHES = LaunchQueue(LIVEKIT_URL, on_launched=_on_launched, on_state=_on_launch_state)
+# One batched describe_tasks poller for every task we launched or pooled
+TRACKER = TaskTracker(on_transition=_on_task_transition, run_blocking=LAUNCHES.run_blocking)
+
+async def reconcile():
+    """
+    Brings the registry in line with ECS after a (re)start:
+      - records whose task no longer runs are dropped;
+      - running single-room agents missing from the registry are adopted;
+      - pending claims left behind by a dead controller are relaunched here;
+      - every known task is handed to the tracker.
+    Idle pool agents are left alone; they exit after AGENT_IDLE_TIMEOUT_S.
+    """
+    arns = await LAUNCHES.run_blocking(list_agent_tasks)
+    running = {t["taskArn"]: t for t in await LAUNCHES.run_blocking(describe_task_batch, arns)
+               if t["lastStatus"] not in ("STOPPED", "DELETED")}
+    known = set()
+    for rec in REGISTRY.rooms():
+        arn = rec["task_arn"]
+        if arn:
+            if arn in running:
+                known.add(arn)
+                TRACKER.track(arn, rec["room"])
+            elif REGISTRY.update(rec["room"], expect_task_arn=arn, state="pending", task_arn=None, shared=False,
+                                 owner=INSTANCE_ID):
+                log.warning("Reconcile: task=%s for room=%s is gone; relaunching", arn, rec["room"])
+                LAUNCHES.submit(rec["room"], _mint(rec["room"]))
+        elif rec["owner"] != INSTANCE_ID and rec["state"] in ("pending", "launching") \
+                and rec["updated_at"] < time.time() - CLAIM_STALE_S:
+            if REGISTRY.update(rec["room"], expect_task_arn=None, expect_owner=rec["owner"], owner=INSTANCE_ID):
+                log.warning("Reconcile: taking over stale claim for room=%s from %s", rec["room"], rec["owner"])
+                LAUNCHES.submit(rec["room"], _mint(rec["room"]))
+    adopted = 0
+    for arn, t in running.items():
+        if arn in known or not t.get("room"):
+            continue
+        claimed, _ = REGISTRY.claim(t["room"])
+        if claimed:
+            REGISTRY.update(t["room"], task_arn=arn, state="running" if t["lastStatus"] == "RUNNING" else "launched")
+            TRACKER.track(arn, t["room"])
+            adopted += 1
+    log.info("Reconciled registry against %d running tasks (adopted %d)", len(running), adopted)
+
+@asynccontextmanager
+async def lifespan(_app: FastAPI):
+    global POOL
+    LAUNCHES.start()
+    TRACKER.start()
+    try:
+        await reconcile()
+    except Exception:
+        log.exception("Startup reconcile failed; continuing with registry as-is")
+    if POOL_ENABLED:
+        POOL = AgentPool(LIVEKIT_URL, tracker=TRACKER, bucket=LAUNCHES.bucket)
+        POOL.start()
+        log.info("Warm agent pool enabled (min_idle=%d max_idle=%d)", POOL.min_idle, POOL.max_idle)
+    yield
+    if POOL:
+        await POOL.close()
+    await TRACKER.close()
+    await LAUNCHES.close()
+    REGISTRY.close()
+
+app = FastAPI(lifespan=lifespan)
 
 @app.get("/healthz")
 def health():
     return {"ok": True}
 
+@app.get("/pool")
+def pool_status():
+    return POOL.snapshot() if POOL else {"enabled": False}
+
+@app.get("/rooms")
+def rooms():
+    return {"rooms": REGISTRY.rooms(), "queueDepth": LAUNCHES.depth(), "instance": INSTANCE_ID}
+
+@app.get("/tasks")
+def tasks():
+    return TRACKER.snapshot()
+
+@app.get("/metrics")
+def metrics():
+    return {
+        "launches": LAUNCHES.metrics(),
+        "tasks": TRACKER.snapshot(),
+        "pool": POOL.snapshot() if POOL else None,
+        "setup": SETUP.snapshot(),
+    }
+
+@app.get("/rooms/{room}")
+def room_status(room: str):
+    rec = REGISTRY.get(room)
+    if rec is None:
+        raise HTTPException(status_code=404, detail="unknown room")
+    st = LAUNCHES.status.get(room)
+    if st:
+        rec["launch"] = st  # only on the process that ran the launch
+    if rec["task_arn"]:
+        rec["task"] = TRACKER.status(rec["task_arn"])
+    return rec
+
 @app.post("/livekit/webhook")
 async def livekit_webhook(request: Request):
     """
     Handles LiveKit project-level webhooks (JSON).
+    Launches are queued and acknowledged immediately; poll GET /rooms/{room} for progress.
+    Redelivered events (same LiveKit event id) are acknowledged without side effects.
+    participant_joined / track_published for the agent's identity feed the
+    call-setup latency timeline (GET /metrics → "setup").
     """
     body = await request.body()
     try:
@@ -37,34 +192,76 @@ async def livekit_webhook(request: Request):
     if not room:
         room = data.get("roomName") or data.get("room_name")
 
+    event_id = data.get("id")
+    if not (event_id and event in ("room_started", "room_created", "room_ended", "room_finished")):
+        return await _handle_webhook(event, room, data)
+    if REGISTRY.seen_event(event_id):
+        log.info("Duplicate webhook %s (%s) for room=%s", event_id, event, room)
+        return {"status": "duplicate", "event": event, "room": room}
+    try:
+        return await _handle_webhook(event, room, data)
+    except Exception:
+        # the id guards against concurrent redeliveries; a failed attempt must leave LiveKit's retry in
+        REGISTRY.forget_event(event_id)
+        raise
+
+async def _start_agent(room: str) -> dict:
+    SETUP.start(room)
+    token = _mint(room)
+
+    if POOL:
+        task_arn = await POOL.acquire(room, token)
+        if task_arn:
+            REGISTRY.update(room, state="assigned", task_arn=task_arn, shared=POOL.is_shared(room))
+            SETUP.assigned(room)
+            return {"status": "assigned", "room": room, "taskArn": task_arn}
+
+    st = LAUNCHES.submit(room, token)
+    log.info("Queued agent launch for room=%s (queue depth=%d)", room, LAUNCHES.depth())
+    return {"status": st["state"], "room": room}
+
+async def _handle_webhook(event: str, room: str | None, data: dict) -> dict:
     if event in ("room_started", "room_created") and room:
-        if room in AGENTS:
-            log.info("Agent already running for room=%s (task=%s)", room, AGENTS[room])
-            return {"status": "already-running", "room": room, "taskArn": AGENTS[room]}
-
-        # Minting a short-lived token the agent will use to join the room
-        token = mint_livekit_token(
-            room=room,
-            identity=f"agent-{room}",
-            ttl_seconds=TOKEN_TTL,
-        )
-
-        task_arn = launch_agent(
-            room_name=room,
-            livekit_url=LIVEKIT_URL,
-            livekit_token=token,
-        )
-        AGENTS[room] = task_arn
-        log.info("Launched agent task=%s for room=%s", task_arn, room)
-        return {"status": "launched", "room": room, "taskArn": task_arn}
+        claimed, rec = REGISTRY.claim(room)
+        if not claimed:
+            log.info("Agent already %s for room=%s (task=%s, owner=%s)",
+                     rec["state"], room, rec["task_arn"], rec["owner"])
+            return {"status": "already-running" if rec["task_arn"] else rec["state"],
+                    "room": room, "taskArn": rec["task_arn"]}
+
+        try:
+            return await _start_agent(room)
+        except Exception as e:
+            # a failed record is claimed again by the webhook's retry
+            REGISTRY.update(room, expect_task_arn=None, expect_owner=INSTANCE_ID, state="failed", error=str(e))
+            raise
 
     if event in ("room_ended", "room_finished") and room:
-        task_arn = AGENTS.pop(room, None)
+        rec = REGISTRY.release(room)
+        SETUP.end(room)
+        st = LAUNCHES.cancel(room)
+        LAUNCHES.forget(room)
+        task_arn = rec["task_arn"] if rec else None
+        if rec and rec["shared"]:
+            # Shared worker: the room's pipeline ends on its own, the task keeps serving others
+            if POOL:
+                POOL.release(room)
+            log.info("Released room=%s on worker task=%s", room, task_arn)
+            return {"status": "released", "room": room, "taskArn": task_arn}
         if task_arn:
-            stop_agent(task_arn)
+            TRACKER.untrack(task_arn)
+            await LAUNCHES.run_blocking(stop_agent, task_arn)
             log.info("Stopped agent task=%s for ended room=%s", task_arn, room)
             return {"status": "stopped", "room": room, "taskArn": task_arn}
+        if rec or (st and st["state"] == "cancelled"):
+            # A launch still in flight elsewhere sees the missing record and stops its task
+            log.info("Room %s ended before its agent launched; launch cancelled", room)
+            return {"status": "cancelled", "room": room}
         log.info("Room ended with no tracked agent: %s", room)
         return {"status": "ended-no-agent", "room": room}
 
+    if event in ("participant_joined", "track_published") and room:
+        if SETUP.agent_event(room, event, data):
+            return {"status": "recorded", "event": event, "room": room}
+
     return {"status": "ignored", "event": event, "room": room}
@@ -0,0 +1,74 @@
+#!/usr/bin/env python3
+# services/controller/bench/bench_pool.py
+"""
+Simulates bursty call arrivals against the warm pool using the local ECS
+stand-in and reports how long each call waits for an agent, pool vs cold.
+
+    cd services/controller && python bench/bench_pool.py --bursts 5 --burst-size 20
+"""
+import os
+import sys
+import time
+import asyncio
+import argparse
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+os.environ.setdefault("ECS_STUB", "1")
+os.environ.setdefault("SUBNETS_CSV", "subnet-stub")
+os.environ.setdefault("SECGRPS_CSV", "sg-stub")
+
+import launch_agent  # noqa: E402
+from pool import AgentPool  # noqa: E402
+
+
+def pct(values, q):
+    s = sorted(values)
+    return s[int(q * (len(s) - 1))] if s else float("nan")
+
+async def cold_wait(arn: str) -> None:
+    while launch_agent.describe_task(arn).get("lastStatus") != "RUNNING":
+        await asyncio.sleep(0.1)
+
+async def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--bursts", type=int, default=5)
+    ap.add_argument("--burst-size", type=int, default=20)
+    ap.add_argument("--gap-s", type=float, default=1.5)
+    ap.add_argument("--prewarm-s", type=float, default=8.0)
+    args = ap.parse_args()
+
+    stub = launch_agent.ecs
+    stub.provision_s, stub.pending_s, stub.api_latency_s = 1.0, 1.0, 0.0
+
+    pool = AgentPool("wss://stub", min_idle=args.burst_size, max_idle=args.burst_size * 2,
+                     max_size=args.burst_size * 4, refill_interval_s=0.5,
+                     probe=lambda ip: {"capacity": 1, "free": 1}, assign=lambda *a: True)
+    pool.start()
+    await asyncio.sleep(args.prewarm_s)
+
+    pooled, cold = [], []
+
+    async def call(i: int):
+        t0 = time.perf_counter()
+        arn = await pool.acquire(f"room-{i}", "tok")
+        if arn is None:
+            arn = await asyncio.to_thread(launch_agent.launch_agent, f"room-{i}", "wss://stub", "tok")
+            await cold_wait(arn)
+            cold.append(time.perf_counter() - t0)
+        else:
+            pooled.append(time.perf_counter() - t0)
+
+    calls = []
+    for b in range(args.bursts):
+        calls += [asyncio.create_task(call(b * args.burst_size + i)) for i in range(args.burst_size)]
+        await asyncio.sleep(args.gap_s)
+    await asyncio.gather(*calls)
+    await pool.close()
+
+    for name, xs in (("pooled", pooled), ("cold", cold)):
+        print(f"{name:>6}: n={len(xs):4d} p50={pct(xs, .5) * 1000:8.1f} ms p95={pct(xs, .95) * 1000:8.1f} ms")
+    print("pool:", pool.snapshot())
+    print("ecs calls:", stub.calls)
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,68 @@
+#!/usr/bin/env python3
+# services/controller/bench/bench_scheduler.py
+"""
+Replays the make_100.py call pattern (bursts of 20 every 1.5 s) through the
+launch scheduler against a stub ECS that throttles RunTask and sometimes has
+no Spot capacity. Reports launches, retries, Spot→on-demand fallbacks and
+time-in-queue.
+
+    cd services/controller && python bench/bench_scheduler.py --total 100 --stub-rate 10 --spot-fail 0.2
+"""
+import os
+import sys
+import time
+import asyncio
+import argparse
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+os.environ.setdefault("ECS_STUB", "1")
+os.environ.setdefault("ECS_STUB_API_LATENCY_S", "0.1")
+os.environ.setdefault("SUBNETS_CSV", "subnet-stub")
+os.environ.setdefault("SECGRPS_CSV", "sg-stub")
+
+import logging  # noqa: E402
+import launch_agent  # noqa: E402
+from launch_queue import LaunchQueue, TokenBucket  # noqa: E402
+
+
+async def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--total", type=int, default=100)
+    ap.add_argument("--burst", type=int, default=20)
+    ap.add_argument("--gap-s", type=float, default=1.5)
+    ap.add_argument("--stub-rate", type=float, default=10, help="RunTask/s the stub accepts before throttling")
+    ap.add_argument("--spot-fail", type=float, default=0.2, help="probability a Spot launch has no capacity")
+    ap.add_argument("--bucket-rate", type=float, default=None, help="scheduler token rate (default: stub rate)")
+    args = ap.parse_args()
+    logging.getLogger().setLevel(logging.ERROR)
+
+    stub = launch_agent.ecs
+    stub.runtask_rate, stub._rt_tokens, stub.spot_fail_p = args.stub_rate, args.stub_rate, args.spot_fail
+    rate = args.bucket_rate or args.stub_rate
+    q = LaunchQueue("wss://stub", bucket=TokenBucket(rate, int(rate)))
+    q.start()
+
+    t0 = time.perf_counter()
+    for i in range(args.total):
+        q.submit(f"room-{i}", "tok")
+        if (i + 1) % args.burst == 0:
+            await asyncio.sleep(args.gap_s)
+    while q.depth() or any(s["state"] in ("pending", "launching") for s in q.status.values()):
+        await asyncio.sleep(0.05)
+    elapsed = time.perf_counter() - t0
+    await q.close()
+
+    states: dict[str, int] = {}
+    for s in q.status.values():
+        states[s["state"]] = states.get(s["state"], 0) + 1
+    done = [s["launchedAt"] - s["queuedAt"] for s in q.status.values() if s["launchedAt"]]
+    done.sort()
+    print(f"calls={args.total} elapsed={elapsed:.1f}s states={states}")
+    if done:
+        print(f"queued→launched ms: p50={done[len(done) // 2] * 1000:.0f} "
+              f"p95={done[int(.95 * (len(done) - 1))] * 1000:.0f} max={done[-1] * 1000:.0f}")
+    print("scheduler:", q.metrics())
+    print("stub ecs:", stub.calls)
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,111 @@
+#!/usr/bin/env python3
+# services/controller/bench/bench_setup.py
+"""
+Call-setup latency end to end through the controller app (in-process, ASGI)
+on the stub ECS. Rooms arrive at --rate/s. For each one a simulated agent
+"joins" --agent-start-s after its task is RUNNING (the agent's own start-up +
+LiveKit join) and publishes its audio track --publish-ms later, by posting the
+participant_joined / track_published webhooks LiveKit would send. Prints the
+per-phase histograms from GET /metrics → "setup".
+
+    cd services/controller && python bench/bench_setup.py --rooms 100 --rate 20
+    python bench/bench_setup.py --rooms 200 --rate 50 --runtask-rate 10   # RunTask throttled
+    python bench/bench_setup.py --rooms 50 --rate 2 --pool 10             # warm pool path
+"""
+import os
+import sys
+import json
+import random
+import asyncio
+import argparse
+import tempfile
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+
+def parse_args():
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--rooms", type=int, default=100)
+    ap.add_argument("--rate", type=float, default=20, help="room_started webhooks per second")
+    ap.add_argument("--provision-s", type=float, default=1.0, help="stub PROVISIONING time")
+    ap.add_argument("--pending-s", type=float, default=1.0, help="stub PENDING time")
+    ap.add_argument("--runtask-rate", type=float, default=0, help="stub RunTask throttle (0 = none)")
+    ap.add_argument("--agent-start-s", type=float, default=2.5, help="RUNNING → participant_joined")
+    ap.add_argument("--publish-ms", type=float, default=150, help="participant_joined → track_published")
+    ap.add_argument("--pool", type=int, default=0, help="warm pool agents (control port faked)")
+    ap.add_argument("--jsonl", default="", help="per-room results log (SETUP_JSONL)")
+    return ap.parse_args()
+
+
+ARGS = parse_args()
+os.environ.setdefault("ECS_STUB", "1")
+os.environ.setdefault("ECS_STUB_API_LATENCY_S", "0.2")
+os.environ["ECS_STUB_PROVISION_S"] = str(ARGS.provision_s)
+os.environ["ECS_STUB_PENDING_S"] = str(ARGS.pending_s)
+os.environ["ECS_STUB_RUNTASK_RATE"] = str(ARGS.runtask_rate)
+os.environ.setdefault("TRACKER_FAST_S", "0.25")
+os.environ.setdefault("SUBNETS_CSV", "subnet-stub")
+os.environ.setdefault("SECGRPS_CSV", "sg-stub")
+os.environ.setdefault("LIVEKIT_API_KEY", "bench")
+os.environ.setdefault("LIVEKIT_API_SECRET", "bench-secret-bench-secret-bench-secret")
+os.environ.setdefault("LIVEKIT_URL", "wss://stub")
+os.environ.setdefault("REGISTRY_PATH", os.path.join(tempfile.mkdtemp(), "registry.db"))
+os.environ["SETUP_JSONL"] = ARGS.jsonl
+
+import logging  # noqa: E402
+import app as controller  # noqa: E402
+from bench_webhooks import asgi_call  # noqa: E402
+from pool import AgentPool  # noqa: E402
+
+
+async def hook(body: dict) -> dict:
+    status, out = await asgi_call("POST", "/livekit/webhook", json.dumps(body).encode())
+    assert status == 200, status
+    return json.loads(out)
+
+async def one_call(room: str):
+    await hook({"event": "room_started", "room": {"name": room}})
+    while (controller.REGISTRY.get(room) or {}).get("state") not in ("running", "assigned"):
+        await asyncio.sleep(0.05)
+    await asyncio.sleep(ARGS.agent_start_s * random.uniform(0.8, 1.2))
+    agent = {"identity": f"agent-{room}", "sid": f"PA_{room}"}
+    await hook({"event": "participant_joined", "room": {"name": room}, "participant": agent})
+    await asyncio.sleep(ARGS.publish_ms / 1000)
+    # AUDIO is TrackType 0, which LiveKit's JSON leaves out
+    await hook({"event": "track_published", "room": {"name": room}, "participant": agent,
+                "track": {"sid": f"TR_{room}", "source": "MICROPHONE"}})
+
+async def main():
+    logging.getLogger().setLevel(logging.WARNING)
+    async with controller.lifespan(controller.app):
+        if ARGS.pool:
+            controller.POOL = AgentPool(controller.LIVEKIT_URL, min_idle=ARGS.pool, max_idle=ARGS.pool,
+                                        max_size=ARGS.pool * 2, refill_interval_s=0.5,
+                                        probe=lambda ip: {"capacity": 1, "free": 1}, assign=lambda *a: True,
+                                        tracker=controller.TRACKER, bucket=controller.LAUNCHES.bucket)
+            controller.POOL.start()
+            while controller.POOL.idle_slots() < ARGS.pool:
+                await asyncio.sleep(0.1)
+        calls = []
+        for i in range(ARGS.rooms):
+            calls.append(asyncio.create_task(one_call(f"setup-{i}")))
+            await asyncio.sleep(random.expovariate(ARGS.rate))
+        await asyncio.wait_for(asyncio.gather(*calls), timeout=300)
+        _, out = await asgi_call("GET", "/metrics")
+        setup = json.loads(out)["setup"]
+        if controller.POOL:
+            await controller.POOL.close()
+
+    print(f"{ARGS.rooms} calls at {ARGS.rate:g}/s: completed {setup['completed']}, "
+          f"incomplete {setup['incomplete']}, relaunches {setup['relaunches']}")
+    for path, phases in setup["phases_ms"].items():
+        if not phases["total"]["n"]:
+            continue
+        print(f"\n  {path:<14} {'n':>5} {'p50':>9} {'p95':>9} {'p99':>9} {'max':>9}  (ms)")
+        for phase, h in phases.items():
+            print(f"  {phase:<14} {h['n']:>5} {h['p50']:>9} {h['p95']:>9} {h['p99']:>9} {h['max']:>9}")
+    if ARGS.jsonl:
+        print(f"\nwrote {ARGS.jsonl}")
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,97 @@
+#!/usr/bin/env python3
+# services/controller/bench/bench_tracker.py
+"""
+Counts describe_tasks calls needed to see N freshly launched tasks reach
+RUNNING: one 2 s polling loop per task (the old _wait_until_running) versus the
+batched TaskTracker. Then kills one task (Spot reclaim) and reports how long
+the tracker takes to publish STOPPED.
+
+    cd services/controller && python bench/bench_tracker.py --tasks 100
+"""
+import os
+import sys
+import time
+import asyncio
+import argparse
+import threading
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+os.environ.setdefault("ECS_STUB", "1")
+os.environ.setdefault("ECS_STUB_API_LATENCY_S", "0.02")
+os.environ.setdefault("SUBNETS_CSV", "subnet-stub")
+os.environ.setdefault("SECGRPS_CSV", "sg-stub")
+
+import logging  # noqa: E402
+import launch_agent  # noqa: E402
+from task_tracker import TaskTracker  # noqa: E402
+
+
+def launch_many(n: int) -> list[str]:
+    return [launch_agent.launch_agent(f"room-{i}", "wss://stub", "tok") for i in range(n)]
+
+def legacy_wait(arn: str, timeout_s: float):
+    """The per-task loop this tracker replaced: describe one ARN every 2 s."""
+    deadline = time.time() + timeout_s
+    while time.time() < deadline:
+        d = launch_agent.ecs.describe_tasks(cluster=launch_agent.CLUSTER, tasks=[arn])
+        if (d.get("tasks") or [{}])[0].get("lastStatus") == "RUNNING":
+            return
+        time.sleep(2)
+
+def run_legacy(n: int) -> tuple[int, float]:
+    stub = launch_agent.ecs
+    arns = launch_many(n)
+    before = stub.calls.get("describe_tasks", 0)
+    t0 = time.perf_counter()
+    threads = [threading.Thread(target=legacy_wait, args=(a, 60)) for a in arns]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    return stub.calls.get("describe_tasks", 0) - before, time.perf_counter() - t0
+
+async def run_tracker(n: int) -> tuple[int, float, float]:
+    stub = launch_agent.ecs
+    stopped = asyncio.Event()
+    killed: dict[str, float] = {}
+
+    async def on_transition(arn, room, old, new, info):
+        if new == "STOPPED" and arn in killed:
+            killed[arn] = time.perf_counter() - killed[arn]
+            stopped.set()
+
+    tracker = TaskTracker(on_transition=on_transition)
+    tracker.start()
+    arns = await asyncio.to_thread(launch_many, n)
+    before = stub.calls.get("describe_tasks", 0)
+    t0 = time.perf_counter()
+    await asyncio.gather(*(tracker.wait_running(a, 60) for a in arns))
+    calls, elapsed = stub.calls.get("describe_tasks", 0) - before, time.perf_counter() - t0
+
+    await asyncio.sleep(5)  # steady state: interval backs off
+    victim = arns[0]
+    killed[victim] = time.perf_counter()
+    stub.kill(victim)
+    await asyncio.wait_for(stopped.wait(), timeout=60)
+    detect = killed[victim]
+    await tracker.close()
+    return calls, elapsed, detect
+
+async def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--tasks", type=int, default=100)
+    args = ap.parse_args()
+    logging.getLogger().setLevel(logging.WARNING)
+    stub = launch_agent.ecs
+    stub.provision_s, stub.pending_s = 4.0, 4.0
+
+    legacy_calls, legacy_s = await asyncio.to_thread(run_legacy, args.tasks)
+    calls, elapsed, detect = await run_tracker(args.tasks)
+    print(f"tasks={args.tasks}")
+    print(f"  per-task pollers : {legacy_calls:5d} describe_tasks calls, all RUNNING after {legacy_s:.1f}s")
+    print(f"  batched tracker  : {calls:5d} describe_tasks calls, all RUNNING after {elapsed:.1f}s")
+    print(f"  saved            : {legacy_calls - calls} calls ({(1 - calls / max(1, legacy_calls)) * 100:.0f}%)")
+    print(f"  Spot reclaim noticed by tracker after {detect:.1f}s")
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,105 @@
+#!/usr/bin/env python3
+# services/controller/bench/bench_webhooks.py
+"""
+Fires hundreds of concurrent room_started webhooks at the controller app
+(in-process, straight through ASGI) backed by the stub ECS, while a prober
+hits /healthz. Reports webhook and /healthz latency percentiles; with launches
+off the event loop both should stay flat as the burst grows.
+
+    cd services/controller && python bench/bench_webhooks.py --rooms 100 200 400
+"""
+import os
+import sys
+import json
+import time
+import asyncio
+import argparse
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+os.environ.setdefault("ECS_STUB", "1")
+os.environ.setdefault("ECS_STUB_API_LATENCY_S", "0.2")   # roughly a real RunTask round trip
+os.environ.setdefault("SUBNETS_CSV", "subnet-stub")
+os.environ.setdefault("SECGRPS_CSV", "sg-stub")
+os.environ.setdefault("LIVEKIT_API_KEY", "bench")
+os.environ.setdefault("LIVEKIT_API_SECRET", "bench-secret-bench-secret-bench-secret")
+os.environ.setdefault("LIVEKIT_URL", "wss://stub")
+
+import logging  # noqa: E402
+import app as controller  # noqa: E402
+import launch_agent  # noqa: E402
+
+
+def pct(values, q):
+    s = sorted(values)
+    return s[int(q * (len(s) - 1))] if s else float("nan")
+
+async def asgi_call(method: str, path: str, body: bytes = b"") -> tuple[int, bytes]:
+    scope = {
+        "type": "http", "asgi": {"version": "3.0"}, "http_version": "1.1",
+        "method": method, "scheme": "http", "path": path, "raw_path": path.encode(),
+        "query_string": b"", "root_path": "", "server": ("bench", 80), "client": ("bench", 1),
+        "headers": [(b"content-type", b"application/json"), (b"content-length", str(len(body)).encode())],
+    }
+    sent = False
+    status, chunks = 0, []
+
+    async def receive():
+        nonlocal sent
+        if not sent:
+            sent = True
+            return {"type": "http.request", "body": body, "more_body": False}
+        await asyncio.sleep(3600)
+
+    async def send(msg):
+        nonlocal status
+        if msg["type"] == "http.response.start":
+            status = msg["status"]
+        elif msg["type"] == "http.response.body":
+            chunks.append(msg.get("body", b""))
+
+    await controller.app(scope, receive, send)
+    return status, b"".join(chunks)
+
+async def run_burst(n: int, tag: str) -> dict:
+    hook_lat, health_lat = [], []
+    done = asyncio.Event()
+
+    async def hook(i: int):
+        body = json.dumps({"event": "room_started", "room": {"name": f"{tag}-{i}"}}).encode()
+        t0 = time.perf_counter()
+        status, _ = await asgi_call("POST", "/livekit/webhook", body)
+        hook_lat.append((time.perf_counter() - t0) * 1000)
+        assert status == 200, status
+
+    async def prober():
+        while not done.is_set():
+            t0 = time.perf_counter()
+            await asgi_call("GET", "/healthz")
+            health_lat.append((time.perf_counter() - t0) * 1000)
+            await asyncio.sleep(0.005)
+
+    p = asyncio.create_task(prober())
+    await asyncio.gather(*(hook(i) for i in range(n)))
+    done.set()
+    await p
+    return {"n": n, "hook_p50": pct(hook_lat, .5), "hook_p99": pct(hook_lat, .99), "hook_max": max(hook_lat),
+            "health_p99": pct(health_lat, .99), "health_max": max(health_lat) if health_lat else float("nan")}
+
+async def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--rooms", type=int, nargs="+", default=[50, 100, 200, 400])
+    args = ap.parse_args()
+    logging.getLogger().setLevel(logging.WARNING)
+
+    async with controller.lifespan(controller.app):
+        print(f"{'burst':>6} {'hook p50':>10} {'hook p99':>10} {'hook max':>10} {'healthz p99':>12} {'healthz max':>12}  (ms)")
+        for n in args.rooms:
+            r = await run_burst(n, f"b{n}")
+            print(f"{r['n']:>6} {r['hook_p50']:>10.2f} {r['hook_p99']:>10.2f} {r['hook_max']:>10.2f} "
+                  f"{r['health_p99']:>12.2f} {r['health_max']:>12.2f}")
+        while controller.LAUNCHES.depth():
+            await asyncio.sleep(0.1)
+        print("ecs calls:", launch_agent.ecs.calls)
+
+if __name__ == "__main__":
+    asyncio.run(main())
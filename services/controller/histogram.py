@@ -0,0 +1,79 @@
+# services/controller/histogram.py
+"""
+Latency histogram shared by the controller's metrics (call-setup phases,
+launch time-in-queue). Same bucketing as the agent's tracing.LatencyHistogram
+and the meter's sketch.LatencyHistogram, so their percentiles compare.
+"""
+import math
+from typing import Optional
+
+
+class LatencyHistogram:
+    """
+    Log-linear histogram in microseconds, HDR-style: values below 2*SUB land in
+    exact buckets, above that every power of two is split into SUB linear
+    buckets (~3% relative error at SUB=32). Sparse, O(1) record.
+    """
+    SUB_BITS = 5
+    SUB = 1 << SUB_BITS
+
+    def __init__(self):
+        self.counts: dict[int, int] = {}
+        self.count = 0
+        self.total_us = 0
+        self.max_us = 0
+
+    @classmethod
+    def _index(cls, v: int) -> int:
+        if v < 2 * cls.SUB:
+            return v
+        shift = v.bit_length() - cls.SUB_BITS - 1
+        return (shift + 1) * cls.SUB + (v >> shift) - cls.SUB
+
+    @classmethod
+    def _value(cls, idx: int) -> int:
+        """Midpoint of bucket `idx`."""
+        if idx < 2 * cls.SUB:
+            return idx
+        shift = idx // cls.SUB - 1
+        sub = idx % cls.SUB + cls.SUB
+        return (sub << shift) + (1 << shift) // 2
+
+    def record(self, ms: float):
+        v = max(0, int(ms * 1000))
+        i = self._index(v)
+        self.counts[i] = self.counts.get(i, 0) + 1
+        self.count += 1
+        self.total_us += v
+        if v > self.max_us:
+            self.max_us = v
+
+    def merge(self, other: "LatencyHistogram"):
+        for i, c in other.counts.items():
+            self.counts[i] = self.counts.get(i, 0) + c
+        self.count += other.count
+        self.total_us += other.total_us
+        self.max_us = max(self.max_us, other.max_us)
+
+    def quantile(self, q: float) -> Optional[float]:
+        """Value (ms) at quantile q in [0, 1]."""
+        if not self.count:
+            return None
+        rank = max(1, math.ceil(q * self.count))
+        seen = 0
+        for i in sorted(self.counts):
+            seen += self.counts[i]
+            if seen >= rank:
+                return min(self._value(i), self.max_us) / 1000
+        return self.max_us / 1000
+
+    def to_dict(self) -> dict:
+        def r(v):
+            return None if v is None else round(v, 1)
+        return {
+            "n": self.count,
+            "p50": r(self.quantile(.5)), "p90": r(self.quantile(.9)),
+            "p95": r(self.quantile(.95)), "p99": r(self.quantile(.99)),
+            "max": r(self.max_us / 1000) if self.count else None,
+            "mean": r(self.total_us / self.count / 1000) if self.count else None,
+        }
@@ -1,6 +1,5 @@
 # services/controller/launch_agent.py
 import os
-import time
 import logging
 import boto3
 from botocore.exceptions import ClientError
@@ -12,20 +11,50 @@ logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(name
 REGION    = os.getenv("AWS_REGION", "us-east-1")
 CLUSTER   = os.getenv("ECS_CLUSTER", "lk-agents")
 TASK_DEF  = os.getenv("AGENT_TASK_DEF", "lk-agent:1")
+TASK_FAMILY = os.getenv("AGENT_TASK_FAMILY", TASK_DEF.rsplit("/", 1)[-1].split(":")[0])
 CONTAINER = os.getenv("AGENT_CONTAINER", "agent")
 
 SUBNETS   = [s.strip() for s in os.getenv("SUBNETS_CSV", "").split(",") if s.strip()]
 SECGRPS   = [g.strip() for g in os.getenv("SECGRPS_CSV", "").split(",") if g.strip()]
 
 CAPACITY_PROVIDER = os.getenv("CAPACITY_PROVIDER", "FARGATE_SPOT")
+FALLBACK_CAPACITY_PROVIDER = os.getenv("FALLBACK_CAPACITY_PROVIDER", "FARGATE")  # "" disables fallback
 PUBLIC_IP         = os.getenv("PUBLIC_IP", "ENABLED") 
-WAIT_FOR_RUNNING  = int(os.getenv("WAIT_FOR_RUNNING_S", "0"))
+AGENT_CONTROL_PORT   = int(os.getenv("AGENT_CONTROL_PORT", "8090"))
+AGENT_CONTROL_SECRET = os.getenv("AGENT_CONTROL_SECRET", "")
+POOL_AGENT_MODE      = os.getenv("POOL_AGENT_MODE", "pool")   # pool (1 room/task) | worker (many rooms/task)
+WORKER_MAX_ROOMS     = int(os.getenv("WORKER_MAX_ROOMS", "8"))
 
 PLAIN_DEEPGRAM = os.getenv("DEEPGRAM_API_KEY")
 PLAIN_ELEVEN   = os.getenv("ELEVEN_API_KEY")
 ELEVEN_VOICE_ID = os.getenv("ELEVEN_VOICE_ID")
 
-ecs = boto3.client("ecs", region_name=REGION)
+if os.getenv("ECS_STUB", "").lower() in ("1", "true", "yes"):
+    from stub_ecs import StubECS
+    ecs = StubECS()
+    log.warning("ECS_STUB enabled: using local ECS stand-in, no real tasks will start")
+else:
+    ecs = boto3.client("ecs", region_name=REGION)
+
+DESCRIBE_BATCH = 100  # describe_tasks accepts at most 100 ARNs per call
+
+# ClientError codes worth retrying with backoff
+RETRYABLE_CODES = {"ThrottlingException", "TooManyRequestsException", "RequestLimitExceeded",
+                   "ServerException", "ServiceUnavailableException"}
+
+class LaunchError(RuntimeError):
+    """
+    RunTask did not start a task. `retryable` is set for throttling and transient
+    server errors, `capacity` when the capacity provider had nothing to give.
+    """
+    def __init__(self, msg: str, *, retryable: bool = False, capacity: bool = False):
+        super().__init__(msg)
+        self.retryable = retryable or capacity
+        self.capacity = capacity
+
+def _is_capacity_failure(reason: str) -> bool:
+    r = (reason or "").lower()
+    return "capacity" in r or r.startswith("resource:")
 
 def _validate_networking():
     if not SUBNETS:
@@ -33,12 +62,28 @@ def _validate_networking():
     if not SECGRPS:
         raise RuntimeError("SECGRPS_CSV is empty; provide at least one security group id")
 
-def _build_overrides(room_name: str, livekit_url: str, livekit_token: str):
-    env = [
-        {"name": "ROOM_NAME",     "value": room_name},
-        {"name": "LIVEKIT_URL",   "value": livekit_url},
-        {"name": "LIVEKIT_TOKEN", "value": livekit_token},
-    ]
+def _build_overrides(room_name: str | None, livekit_url: str, livekit_token: str | None):
+    """
+    Env overrides for the agent container. With room_name=None the agent boots in
+    POOL_AGENT_MODE (pool or worker): it pre-loads models and waits for rooms on
+    its control port.
+    """
+    if room_name:
+        env = [
+            {"name": "ROOM_NAME",     "value": room_name},
+            {"name": "LIVEKIT_URL",   "value": livekit_url},
+            {"name": "LIVEKIT_TOKEN", "value": livekit_token},
+        ]
+    else:
+        env = [
+            {"name": "AGENT_MODE",         "value": POOL_AGENT_MODE},
+            {"name": "AGENT_CONTROL_PORT", "value": str(AGENT_CONTROL_PORT)},
+            {"name": "AGENT_MAX_ROOMS",    "value": str(WORKER_MAX_ROOMS if POOL_AGENT_MODE == "worker" else 1)},
+        ]
+        if livekit_url:
+            env.append({"name": "LIVEKIT_URL", "value": livekit_url})
+        if AGENT_CONTROL_SECRET:
+            env.append({"name": "AGENT_CONTROL_SECRET", "value": AGENT_CONTROL_SECRET})
     if PLAIN_DEEPGRAM:
         env.append({"name": "DEEPGRAM_API_KEY", "value": PLAIN_DEEPGRAM})
     if PLAIN_ELEVEN:
@@ -53,19 +98,13 @@ def _build_overrides(room_name: str, livekit_url: str, livekit_token: str):
         }]
     }
 
-def launch_agent(room_name: str, livekit_url: str, livekit_token: str) -> str:
-    """
-    Starts one agent task on ECS. Returns taskArn.
-    Passes ROOM_NAME, LIVEKIT_URL, LIVEKIT_TOKEN (+ optional STT/TTS envs) through container overrides.
-    """
+def _run_task(overrides: dict, capacity_provider: str | None = None) -> str:
     _validate_networking()
-    overrides = _build_overrides(room_name, livekit_url, livekit_token)
-
     try:
         resp = ecs.run_task(
             cluster=CLUSTER,
             taskDefinition=TASK_DEF,
-            capacityProviderStrategy=[{"capacityProvider": CAPACITY_PROVIDER, "weight": 1}],
+            capacityProviderStrategy=[{"capacityProvider": capacity_provider or CAPACITY_PROVIDER, "weight": 1}],
             count=1,
             networkConfiguration={
                 "awsvpcConfiguration": {
@@ -78,46 +117,101 @@ def launch_agent(room_name: str, livekit_url: str, livekit_token: str) -> str:
             enableExecuteCommand=False,
         )
     except ClientError as e:
-        raise RuntimeError(f"ECS run_task error: {e}")
+        code = e.response.get("Error", {}).get("Code", "")
+        raise LaunchError(f"ECS run_task error: {e}", retryable=code in RETRYABLE_CODES) from e
 
     failures = resp.get("failures") or []
     if failures:
-        raise RuntimeError(f"ECS RunTask failed: {failures}")
+        capacity = any(_is_capacity_failure(f.get("reason", "")) for f in failures)
+        raise LaunchError(f"ECS RunTask failed: {failures}", capacity=capacity)
 
     tasks = resp.get("tasks") or []
     if not tasks or "taskArn" not in tasks[0]:
-        raise RuntimeError(f"ECS RunTask returned no tasks: {resp}")
+        raise LaunchError(f"ECS RunTask returned no tasks: {resp}")
 
     task_arn = tasks[0]["taskArn"]
     log.info("RunTask ok: %s", task_arn)
+    return task_arn
 
-    if WAIT_FOR_RUNNING > 0:
-        _wait_until_running(task_arn, WAIT_FOR_RUNNING)
+def launch_agent(room_name: str, livekit_url: str, livekit_token: str,
+                 capacity_provider: str | None = None) -> str:
+    """
+    Starts one agent task on ECS. Returns taskArn; raises LaunchError.
+    Passes ROOM_NAME, LIVEKIT_URL, LIVEKIT_TOKEN (+ optional STT/TTS envs) through container overrides.
+    Progress to RUNNING is followed by the shared TaskTracker, not here.
+    """
+    return _run_task(_build_overrides(room_name, livekit_url, livekit_token), capacity_provider)
 
-    return task_arn
+def launch_pool_agent(livekit_url: str, capacity_provider: str | None = None) -> str:
+    """
+    Starts one room-less agent task for the warm pool. Returns taskArn.
+    The room is handed over later through the agent's control port (see pool.py).
+    """
+    return _run_task(_build_overrides(None, livekit_url, None), capacity_provider)
+
+def describe_task(task_arn: str) -> dict:
+    """
+    Returns {"taskArn", "lastStatus", "privateIp", "stoppedReason"} for one task ({} if unknown).
+    """
+    found = describe_task_batch([task_arn])
+    return found[0] if found else {}
+
+def describe_task_batch(task_arns: list[str]) -> list[dict]:
+    """
+    Summaries for many tasks in as few describe_tasks calls as possible.
+    ARNs ECS no longer knows about come back as STOPPED with the failure reason.
+    """
+    out = []
+    for i in range(0, len(task_arns), DESCRIBE_BATCH):
+        d = ecs.describe_tasks(cluster=CLUSTER, tasks=task_arns[i:i + DESCRIBE_BATCH])
+        out.extend(_task_summary(t) for t in d.get("tasks") or [])
+        out.extend({"taskArn": f["arn"], "lastStatus": "STOPPED", "privateIp": None,
+                    "stoppedReason": f.get("reason"), "exitCode": None, "room": None, "mode": None}
+                   for f in d.get("failures") or [] if f.get("arn"))
+    return out
+
+def list_agent_tasks() -> list[str]:
+    """ARNs of every agent task ECS still wants RUNNING (all pages)."""
+    arns, token = [], None
+    while True:
+        kw = {"cluster": CLUSTER, "family": TASK_FAMILY, "desiredStatus": "RUNNING"}
+        if token:
+            kw["nextToken"] = token
+        resp = ecs.list_tasks(**kw)
+        arns.extend(resp.get("taskArns") or [])
+        token = resp.get("nextToken")
+        if not token:
+            return arns
+
+def _epoch(ts) -> float | None:
+    """boto3 returns ECS timestamps as datetimes."""
+    return ts.timestamp() if hasattr(ts, "timestamp") else ts
+
+def _task_summary(task: dict) -> dict:
+    ip = None
+    for att in task.get("attachments") or []:
+        for det in att.get("details") or []:
+            if det.get("name") == "privateIPv4Address":
+                ip = det.get("value")
+    containers = task.get("containers") or [{}]
+    env = {}
+    for co in (task.get("overrides") or {}).get("containerOverrides") or []:
+        env.update({e["name"]: e.get("value") for e in co.get("environment") or []})
+    return {
+        "taskArn": task.get("taskArn"),
+        "lastStatus": task.get("lastStatus"),
+        "privateIp": ip,
+        "stoppedReason": task.get("stoppedReason"),
+        "exitCode": containers[0].get("exitCode"),
+        "room": env.get("ROOM_NAME"),      # None for pool/worker agents
+        "mode": env.get("AGENT_MODE", "single"),
+        "createdAt": _epoch(task.get("createdAt")),
+        "startedAt": _epoch(task.get("startedAt")),   # None until RUNNING
+    }
 
-def _wait_until_running(task_arn: str, timeout_s: int):
-    """Best-effort poller for task lastStatus → RUNNING (optional)."""
-    deadline = time.time() + timeout_s
-    last = None
-    while time.time() < deadline:
-        try:
-            d = ecs.describe_tasks(cluster=CLUSTER, tasks=[task_arn])
-            tasks = d.get("tasks") or []
-            if tasks:
-                last = tasks[0].get("lastStatus")
-                if last == "RUNNING":
-                    log.info("Task %s is RUNNING", task_arn)
-                    return
-                log.info("Task %s status: %s", task_arn, last)
-        except ClientError as e:
-            log.warning("describe_tasks error for %s: %s", task_arn, e)
-        time.sleep(2)
-    log.warning("Timed out waiting for RUNNING; lastStatus=%s", last)
-
-def stop_agent(task_arn: str):
+def stop_agent(task_arn: str, reason: str = "room_ended"):
     try:
-        ecs.stop_task(cluster=CLUSTER, task=task_arn, reason="room_ended")
+        ecs.stop_task(cluster=CLUSTER, task=task_arn, reason=reason)
         log.info("StopTask sent for %s", task_arn)
     except Exception as e:
         log.warning("StopTask error for %s: %s", task_arn, e)
@@ -0,0 +1,265 @@
+# services/controller/launch_queue.py
+"""
+Asynchronous, rate-limit-aware agent launches.
+
+boto3 is synchronous, so RunTask runs on a bounded thread pool fed by a
+priority queue. The webhook only enqueues and returns "pending"; per-room
+progress is kept in `status` for GET /rooms.
+
+Scheduling:
+  - oldest caller first: the queue is ordered by the time the room was first
+    queued, and retries keep that time, so a retried launch goes ahead of
+    newer calls;
+  - a token bucket (RUNTASK_RATE/s, burst RUNTASK_BURST) keeps RunTask under
+    the ECS launch-rate limits instead of running into throttling;
+  - throttling, transient and capacity errors are retried with full-jitter
+    exponential backoff, and a capacity failure on CAPACITY_PROVIDER (Spot)
+    switches that room to FALLBACK_CAPACITY_PROVIDER (on-demand) right away.
+
+Room states: pending → launching → launched → running | stopped
+                                 ↘ failed | cancelled
+(launched → running/stopped is reported by the TaskTracker.)
+"""
+import os
+import time
+import heapq
+import random
+import asyncio
+import logging
+import itertools
+from concurrent.futures import ThreadPoolExecutor
+from typing import Awaitable, Callable, Optional
+
+from launch_agent import (
+    launch_agent, stop_agent, LaunchError,
+    CAPACITY_PROVIDER, FALLBACK_CAPACITY_PROVIDER,
+)
+from histogram import LatencyHistogram
+
+log = logging.getLogger("launch-queue")
+
+LAUNCH_CONCURRENCY  = int(os.getenv("LAUNCH_CONCURRENCY", "16"))     # threads doing RunTask at once
+# ECS RunTask / Fargate task-launch rate limits (token bucket); see the ECS service quotas
+RUNTASK_RATE        = float(os.getenv("RUNTASK_RATE", "20"))
+RUNTASK_BURST       = int(os.getenv("RUNTASK_BURST", "100"))
+LAUNCH_MAX_ATTEMPTS = int(os.getenv("LAUNCH_MAX_ATTEMPTS", "6"))
+LAUNCH_BACKOFF_BASE = float(os.getenv("LAUNCH_BACKOFF_BASE_S", "0.5"))
+LAUNCH_BACKOFF_CAP  = float(os.getenv("LAUNCH_BACKOFF_CAP_S", "10"))
+
+
+class TokenBucket:
+    def __init__(self, rate: float, burst: int, clock: Callable[[], float] = time.monotonic):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = float(burst)
+        self._clock = clock
+        self._last = clock()
+        self._lock = asyncio.Lock()
+
+    def _refill(self):
+        now = self._clock()
+        self.tokens = min(self.burst, self.tokens + (now - self._last) * self.rate)
+        self._last = now
+
+    async def take(self):
+        """Waits until one token is available and consumes it (FIFO among waiters)."""
+        async with self._lock:
+            self._refill()
+            while self.tokens < 1:
+                await asyncio.sleep((1 - self.tokens) / self.rate)
+                self._refill()
+            self.tokens -= 1
+
+
+def backoff_delay(attempt: int, base: float = LAUNCH_BACKOFF_BASE, cap: float = LAUNCH_BACKOFF_CAP) -> float:
+    """Full-jitter exponential backoff: uniform in [0, min(cap, base * 2**attempt)]."""
+    return random.uniform(0, min(cap, base * (2 ** attempt)))
+
+
+class LaunchQueue:
+    def __init__(self,
+                 livekit_url: str,
+                 *,
+                 workers: int = LAUNCH_CONCURRENCY,
+                 bucket: Optional[TokenBucket] = None,
+                 max_attempts: int = LAUNCH_MAX_ATTEMPTS,
+                 launch: Callable[..., str] = launch_agent,
+                 stop: Callable[..., None] = stop_agent,
+                 on_launched: Optional[Callable[[str, str], Awaitable[None]]] = None,
+                 on_state: Optional[Callable[[dict], None]] = None):
+        self.livekit_url = livekit_url
+        self.workers = workers
+        self.bucket = bucket or TokenBucket(RUNTASK_RATE, RUNTASK_BURST)
+        self.max_attempts = max_attempts
+        self._launch, self._stop = launch, stop
+        self._on_launched = on_launched
+        self._on_state = on_state or (lambda st: None)
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="ecs")
+        self._heap: list[tuple[float, int, dict, str]] = []
+        self._seq = itertools.count()
+        self._ready = asyncio.Event()
+        self._delayed = 0
+        self._tasks: list[asyncio.Task] = []
+        self.status: dict[str, dict] = {}
+        self._waits = LatencyHistogram()   # time-in-queue (ms)
+        self.stats = {"submitted": 0, "launched": 0, "failed": 0, "retries": 0,
+                      "transient_errors": 0, "capacity_fallbacks": 0}
+
+    # -------------------------
+    # lifecycle
+    # -------------------------
+    def start(self):
+        if not self._tasks:
+            self._tasks = [asyncio.create_task(self._worker(), name=f"launch-{i}") for i in range(self.workers)]
+
+    async def close(self):
+        for t in self._tasks:
+            t.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        self.executor.shutdown(wait=False, cancel_futures=True)
+
+    async def run_blocking(self, fn: Callable, *args):
+        """Runs a blocking boto3 call on the launch thread pool."""
+        return await asyncio.get_running_loop().run_in_executor(self.executor, fn, *args)
+
+    # -------------------------
+    # API
+    # -------------------------
+    def submit(self, room: str, livekit_token: str) -> dict:
+        """Queues a launch for `room` and returns its status record (state=pending)."""
+        st = self.status.get(room)
+        if st and st["state"] in ("pending", "launching"):
+            return st
+        st = {"room": room, "state": "pending", "taskArn": None, "error": None,
+              "queuedAt": time.time(), "startedAt": None, "launchedAt": None,
+              "attempts": 0, "capacityProvider": CAPACITY_PROVIDER}
+        self.status[room] = st
+        self.stats["submitted"] += 1
+        self._push(st, livekit_token)
+        return st
+
+    def cancel(self, room: str) -> Optional[dict]:
+        """
+        Marks a queued or in-flight launch as cancelled (room ended first). A task
+        that still comes up is stopped as soon as RunTask returns.
+        """
+        st = self.status.get(room)
+        if st and st["state"] in ("pending", "launching"):
+            st["state"] = "cancelled"
+        return st
+
+    def forget(self, room: str):
+        self.status.pop(room, None)
+
+    def depth(self) -> int:
+        """Launches waiting to run, including those sleeping before a retry."""
+        return len(self._heap) + self._delayed
+
+    def metrics(self) -> dict:
+        oldest = self._heap[0][0] if self._heap else None
+        return {
+            "queue_depth": len(self._heap),
+            "retry_waiting": self._delayed,
+            "oldest_wait_ms": round((time.time() - oldest) * 1000, 1) if oldest else 0.0,
+            "time_in_queue_ms": self._waits.to_dict(),
+            "bucket_tokens": round(self.bucket.tokens, 1),
+            **self.stats,
+        }
+
+    # -------------------------
+    # scheduling
+    # -------------------------
+    def _push(self, st: dict, token: str):
+        heapq.heappush(self._heap, (st["queuedAt"], next(self._seq), st, token))
+        self._ready.set()
+
+    def _retry_later(self, st: dict, token: str, delay: float):
+        self._delayed += 1
+        st["state"] = "pending"
+        self._on_state(st)
+
+        def _due():
+            self._delayed -= 1
+            if st["state"] == "pending":
+                self._push(st, token)
+        asyncio.get_running_loop().call_later(delay, _due)
+
+    async def _next(self) -> tuple[dict, str]:
+        while not self._heap:
+            self._ready.clear()
+            await self._ready.wait()
+        _, _, st, token = heapq.heappop(self._heap)
+        return st, token
+
+    async def _worker(self):
+        while True:
+            st, token = await self._next()
+            try:
+                await self._run_one(st, token)
+            except Exception:
+                log.exception("launch worker error for room=%s", st["room"])
+
+    async def _run_one(self, st: dict, token: str):
+        room = st["room"]
+        if st["state"] != "pending":
+            return  # cancelled while queued
+        await self.bucket.take()
+        if st["state"] != "pending":
+            return
+        st["state"] = "launching"
+        st["attempts"] += 1
+        self._on_state(st)
+        if st["startedAt"] is None:
+            st["startedAt"] = time.time()
+            self._waits.record((st["startedAt"] - st["queuedAt"]) * 1000)
+        try:
+            task_arn = await self.run_blocking(self._launch, room, self.livekit_url, token, st["capacityProvider"])
+        except LaunchError as e:
+            self._on_error(st, token, e)
+            return
+        except Exception as e:
+            st["state"], st["error"] = "failed", str(e)
+            self.stats["failed"] += 1
+            self._on_state(st)
+            log.error("Launch failed for room=%s: %s", room, e)
+            return
+        st["taskArn"] = task_arn
+        st["launchedAt"] = time.time()
+        if st["state"] == "cancelled":
+            log.info("Room %s ended during launch; stopping task=%s", room, task_arn)
+            await self.run_blocking(self._stop, task_arn)
+            return
+        st["state"] = "launched"
+        self.stats["launched"] += 1
+        log.info("Launched agent task=%s for room=%s on %s in %.0f ms (queued %.0f ms, attempts=%d)",
+                 task_arn, room, st["capacityProvider"], (st["launchedAt"] - st["startedAt"]) * 1000,
+                 (st["startedAt"] - st["queuedAt"]) * 1000, st["attempts"])
+        if self._on_launched:
+            await self._on_launched(room, task_arn)
+
+    def _on_error(self, st: dict, token: str, e: LaunchError):
+        room = st["room"]
+        st["error"] = str(e)
+        if st["state"] == "cancelled":
+            return
+        if not e.retryable or st["attempts"] >= self.max_attempts:
+            st["state"] = "failed"
+            self.stats["failed"] += 1
+            self._on_state(st)
+            log.error("Launch failed for room=%s after %d attempts: %s", room, st["attempts"], e)
+            return
+        self.stats["retries"] += 1
+        if e.capacity and FALLBACK_CAPACITY_PROVIDER and st["capacityProvider"] != FALLBACK_CAPACITY_PROVIDER:
+            log.warning("No %s capacity for room=%s; falling back to %s",
+                        st["capacityProvider"], room, FALLBACK_CAPACITY_PROVIDER)
+            st["capacityProvider"] = FALLBACK_CAPACITY_PROVIDER
+            self.stats["capacity_fallbacks"] += 1
+            delay = 0.0
+        else:
+            if not e.capacity:
+                self.stats["transient_errors"] += 1
+            delay = backoff_delay(st["attempts"])
+        log.warning("Retrying launch for room=%s in %.2fs (attempt %d/%d): %s",
+                    room, delay, st["attempts"], self.max_attempts, e)
+        self._retry_later(st, token, delay)
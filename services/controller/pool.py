@@ -0,0 +1,384 @@
+# services/controller/pool.py
+"""
+Warm agent pool.
+
+Keeps a few room-less agent tasks started and initialized (models loaded,
+control port answering) so a new call is handed to an agent that is already
+running instead of waiting for Fargate to provision one. Rooms are assigned
+over the agent's control port (POST /assign) rather than baked into the task's
+env overrides.
+
+Sizing: the idle target follows the recent call arrival rate times the time it
+takes to warm a new agent (how many calls arrive while one refill is in
+flight), scaled by POOL_HEADROOM and clamped to [POOL_MIN_IDLE, POOL_MAX_IDLE].
+Targets are counted in free room slots: a pool agent has one, a worker
+(POOL_AGENT_MODE=worker) has WORKER_MAX_ROOMS. Rooms are packed onto the
+fullest worker that still has a free slot so lightly used workers can drain.
+"""
+import os
+import math
+import time
+import asyncio
+import logging
+from collections import deque
+from dataclasses import dataclass, field
+from typing import Callable, Optional
+
+import requests
+
+from launch_agent import (
+    launch_pool_agent, describe_task, stop_agent,
+    AGENT_CONTROL_PORT, AGENT_CONTROL_SECRET, POOL_AGENT_MODE, WORKER_MAX_ROOMS,
+)
+
+log = logging.getLogger("pool")
+
+POOL_ENABLED          = os.getenv("POOL_ENABLED", "0").lower() in ("1", "true", "yes")
+POOL_MIN_IDLE         = int(os.getenv("POOL_MIN_IDLE", "1"))
+POOL_MAX_IDLE         = int(os.getenv("POOL_MAX_IDLE", "10"))
+POOL_MAX_SIZE         = int(os.getenv("POOL_MAX_SIZE", "20"))        # idle + warming
+POOL_HEADROOM         = float(os.getenv("POOL_HEADROOM", "1.5"))
+POOL_RATE_WINDOW_S    = float(os.getenv("POOL_RATE_WINDOW_S", "300"))
+POOL_REFILL_INTERVAL  = float(os.getenv("POOL_REFILL_INTERVAL_S", "5"))
+POOL_WARM_TIMEOUT_S   = float(os.getenv("POOL_WARM_TIMEOUT_S", "180"))
+POOL_IDLE_TTL_S       = float(os.getenv("POOL_IDLE_TTL_S", "900"))
+POOL_DEFAULT_WARMUP_S = float(os.getenv("POOL_DEFAULT_WARMUP_S", "60"))
+
+
+@dataclass
+class PoolAgent:
+    task_arn: str
+    ip: str
+    launched_at: float
+    ready_at: float = 0.0
+    capacity: int = 1
+    rooms: set[str] = field(default_factory=set)
+    full: bool = False     # refused an assignment; no new rooms until its /load shows a free slot
+
+    @property
+    def free(self) -> int:
+        return 0 if self.full else max(0, self.capacity - len(self.rooms))
+
+
+def _headers() -> dict:
+    return {"X-Agent-Secret": AGENT_CONTROL_SECRET} if AGENT_CONTROL_SECRET else {}
+
+def http_probe(ip: str) -> Optional[dict]:
+    """The agent's /load report once its control port answers, else None."""
+    try:
+        r = requests.get(f"http://{ip}:{AGENT_CONTROL_PORT}/load", headers=_headers(), timeout=2)
+        return r.json() if r.ok else None
+    except (requests.RequestException, ValueError):
+        return None
+
+def http_assign(ip: str, room: str, livekit_url: str, livekit_token: str) -> bool:
+    try:
+        r = requests.post(
+            f"http://{ip}:{AGENT_CONTROL_PORT}/assign",
+            json={"room": room, "url": livekit_url, "token": livekit_token},
+            headers=_headers(),
+            timeout=5,
+        )
+        return r.ok
+    except requests.RequestException as e:
+        log.warning("assign to %s failed: %s", ip, e)
+        return False
+
+
+class AgentPool:
+    def __init__(self,
+                 livekit_url: str,
+                 *,
+                 min_idle: int = POOL_MIN_IDLE,
+                 max_idle: int = POOL_MAX_IDLE,
+                 max_size: int = POOL_MAX_SIZE,
+                 headroom: float = POOL_HEADROOM,
+                 rate_window_s: float = POOL_RATE_WINDOW_S,
+                 refill_interval_s: float = POOL_REFILL_INTERVAL,
+                 warm_timeout_s: float = POOL_WARM_TIMEOUT_S,
+                 idle_ttl_s: float = POOL_IDLE_TTL_S,
+                 launch: Callable[[str], str] = launch_pool_agent,
+                 describe: Callable[[str], dict] = describe_task,
+                 stop: Callable[[str], None] = stop_agent,
+                 probe: Callable[[str], Optional[dict]] = http_probe,
+                 assign: Callable[[str, str, str, str], bool] = http_assign,
+                 tracker=None,
+                 bucket=None,
+                 clock: Callable[[], float] = time.monotonic):
+        self.livekit_url = livekit_url
+        self.min_idle = min_idle
+        self.max_idle = max_idle
+        self.max_size = max_size
+        self.headroom = headroom
+        self.rate_window_s = rate_window_s
+        self.refill_interval_s = refill_interval_s
+        self.warm_timeout_s = warm_timeout_s
+        self.idle_ttl_s = idle_ttl_s
+        self.slots_per_agent = WORKER_MAX_ROOMS if POOL_AGENT_MODE == "worker" else 1
+        self._launch, self._describe, self._stop = launch, describe, stop
+        self._probe, self._assign = probe, assign
+        self._tracker = tracker  # TaskTracker; when set, replaces per-task describe polling
+        self._bucket = bucket    # shared RunTask TokenBucket, so refills don't eat the callers' launch budget
+        self._clock = clock
+
+        self.agents: list[PoolAgent] = []          # ready agents with (possibly) free slots
+        self.warming: set[str] = set()
+        self._room_agent: dict[str, PoolAgent] = {}  # rooms placed on shared workers
+        self._assigned_at: dict[str, float] = {}
+        self._arrivals: deque[float] = deque()
+        self._warmup_s = POOL_DEFAULT_WARMUP_S  # EWMA of launch → ready
+        self._wake = asyncio.Event()
+        self._runner: Optional[asyncio.Task] = None
+        self._warm_tasks: set[asyncio.Task] = set()
+        self.stats = {"hits": 0, "misses": 0, "launched": 0, "warm_failed": 0, "expired": 0}
+
+    # -------------------------
+    # sizing
+    # -------------------------
+    def record_arrival(self):
+        now = self._clock()
+        self._arrivals.append(now)
+        self._prune_arrivals(now)
+
+    def _prune_arrivals(self, now: float):
+        cutoff = now - self.rate_window_s
+        while self._arrivals and self._arrivals[0] < cutoff:
+            self._arrivals.popleft()
+
+    def arrival_rate(self) -> float:
+        """Calls per second over the sliding window."""
+        self._prune_arrivals(self._clock())
+        return len(self._arrivals) / self.rate_window_s
+
+    def target_idle(self) -> int:
+        want = math.ceil(self.arrival_rate() * self._warmup_s * self.headroom)
+        return max(self.min_idle, min(self.max_idle, want))
+
+    # -------------------------
+    # assignment
+    # -------------------------
+    def idle_slots(self) -> int:
+        return sum(a.free for a in self.agents)
+
+    def _pick(self) -> Optional[PoolAgent]:
+        """Best fit: the agent with the fewest free slots left (oldest first on ties)."""
+        candidates = [a for a in self.agents if a.free > 0]
+        return min(candidates, key=lambda a: (a.free, a.ready_at)) if candidates else None
+
+    async def acquire(self, room: str, livekit_token: str) -> Optional[str]:
+        """
+        Hands `room` to an agent with a free slot. Returns its taskArn, or None if
+        the pool is empty (caller falls back to a cold launch).
+        """
+        self.record_arrival()
+        try:
+            while (agent := self._pick()) is not None:
+                agent.rooms.add(room)  # reserve before awaiting so concurrent calls don't double-book
+                ok = await asyncio.to_thread(self._assign, agent.ip, room, self.livekit_url, livekit_token)
+                if ok:
+                    self.stats["hits"] += 1
+                    if self._tracker is not None:
+                        self._tracker.track(agent.task_arn, room)
+                    if agent.capacity == 1:
+                        self._drop(agent)  # dedicated from now on; exits after the call
+                    else:
+                        self._room_agent[room] = agent
+                        self._assigned_at[room] = self._clock()
+                    log.info("Assigned room=%s to pooled task=%s (%d/%d rooms, idle slots=%d)",
+                             room, agent.task_arn, len(agent.rooms), agent.capacity, self.idle_slots())
+                    return agent.task_arn
+                agent.rooms.discard(room)
+                if agent.rooms:
+                    # a worker still serving calls: our view of its slots is stale, not the worker
+                    log.warning("Worker task=%s refused assignment with %d rooms; holding it until its load "
+                                "is re-read", agent.task_arn, len(agent.rooms))
+                    agent.full = True
+                    continue
+                log.warning("Pooled task=%s refused assignment; removing it", agent.task_arn)
+                self._drop(agent)
+                await asyncio.to_thread(self._stop, agent.task_arn)
+            self.stats["misses"] += 1
+            return None
+        finally:
+            self._wake.set()
+
+    def is_shared(self, room: str) -> bool:
+        """True if `room` sits on a multi-room worker."""
+        return room in self._room_agent
+
+    def release(self, room: str) -> bool:
+        """
+        Frees the slot `room` held on a shared worker. Returns True if the room was
+        on a worker, in which case the caller must not stop the task.
+        """
+        agent = self._room_agent.pop(room, None)
+        self._assigned_at.pop(room, None)
+        if agent is None:
+            return False
+        agent.rooms.discard(room)
+        return True
+
+    def _drop(self, agent: PoolAgent):
+        try:
+            self.agents.remove(agent)
+        except ValueError:
+            pass
+
+    # -------------------------
+    # background refill
+    # -------------------------
+    def start(self):
+        if self._runner is None:
+            self._runner = asyncio.create_task(self._run(), name="agent-pool")
+
+    async def close(self, stop_idle: bool = True):
+        if self._runner:
+            self._runner.cancel()
+            self._runner = None
+        for t in list(self._warm_tasks):
+            t.cancel()
+        if stop_idle:
+            for arn in list(self.warming):
+                await asyncio.to_thread(self._stop, arn)
+            for agent in [a for a in self.agents if not a.rooms]:
+                self._drop(agent)
+                await asyncio.to_thread(self._stop, agent.task_arn)
+
+    async def _run(self):
+        while True:
+            try:
+                await self.refill()
+            except Exception:
+                log.exception("pool refill failed")
+            self._wake.clear()
+            try:
+                await asyncio.wait_for(self._wake.wait(), timeout=self.refill_interval_s)
+            except asyncio.TimeoutError:
+                pass
+
+    async def refill(self):
+        await self._expire_idle()
+        target = self.target_idle()
+        have_slots = self.idle_slots() + len(self.warming) * self.slots_per_agent
+        agents = len(self.agents) + len(self.warming)
+        deficit = min(math.ceil((target - have_slots) / self.slots_per_agent), self.max_size - agents)
+        for _ in range(max(0, deficit)):
+            t = asyncio.create_task(self._warm_one())
+            self._warm_tasks.add(t)
+            t.add_done_callback(self._warm_tasks.discard)
+        if deficit > 0:
+            log.info("Pool refill: idle slots=%d warming=%d target=%d rate=%.3f/s warmup=%.1fs → launching %d",
+                     self.idle_slots(), len(self.warming), target, self.arrival_rate(), self._warmup_s, deficit)
+
+    async def _expire_idle(self):
+        """
+        Stops empty agents past their TTL or beyond max_idle slots, and drops any
+        agent that stopped answering (Spot reclaim, crash). A worker's rooms are
+        re-read from its /load: room_finished may reach another controller process,
+        whose release() can't free the slot in this one.
+        """
+        now = self._clock()
+        spare = 0
+        for a in sorted(self.agents, key=lambda a: a.ready_at):
+            if a.rooms or a.full:
+                probed = self._clock()
+                load = await asyncio.to_thread(self._probe, a.ip)
+                if load is None:
+                    log.warning("Worker task=%s with %d rooms stopped answering", a.task_arn, len(a.rooms))
+                    self._drop(a)
+                    for room in a.rooms:
+                        self._room_agent.pop(room, None)
+                        self._assigned_at.pop(room, None)
+                    continue
+                self._resync(a, load, probed)
+                if a.full and load.get("free"):
+                    a.full = False
+                continue
+            too_many = spare + a.free > self.max_idle
+            expired = now - a.ready_at > self.idle_ttl_s and self.idle_slots() - a.free >= self.min_idle
+            if not (too_many or expired) and await asyncio.to_thread(self._probe, a.ip) is not None:
+                spare += a.free
+                continue
+            if a.rooms or a not in self.agents:
+                continue  # assigned while we were probing
+            self._drop(a)
+            self.stats["expired"] += 1
+            await asyncio.to_thread(self._stop, a.task_arn)
+
+    def _resync(self, agent: PoolAgent, load: dict, probed: float):
+        """Frees the slots of rooms the worker no longer serves (assigned before the probe, so not in flight)."""
+        names = load.get("room_names")
+        if names is None:
+            return
+        gone = [r for r in agent.rooms if r not in names and self._assigned_at.get(r, probed) < probed]
+        for room in gone:
+            if self._room_agent.get(room) is agent:
+                self.release(room)
+            else:
+                agent.rooms.discard(room)
+        if gone:
+            log.info("Worker task=%s no longer serves %d rooms; freed their slots", agent.task_arn, len(gone))
+
+    async def _warm_one(self):
+        launched = self._clock()
+        try:
+            if self._bucket is not None:
+                await self._bucket.take()
+            arn = await asyncio.to_thread(self._launch, self.livekit_url)
+        except Exception as e:
+            self.stats["warm_failed"] += 1
+            log.warning("Pool launch failed: %s", e)
+            return
+        self.stats["launched"] += 1
+        self.warming.add(arn)
+        try:
+            ready = await self._wait_ready(arn, launched + self.warm_timeout_s)
+            if ready is None:
+                self.stats["warm_failed"] += 1
+                log.warning("Pooled task=%s did not become ready in %.0fs; stopping", arn, self.warm_timeout_s)
+                await asyncio.to_thread(self._stop, arn)
+                return
+            ip, load = ready
+            now = self._clock()
+            self._warmup_s = 0.8 * self._warmup_s + 0.2 * (now - launched)
+            self.agents.append(PoolAgent(task_arn=arn, ip=ip, launched_at=launched, ready_at=now,
+                                         capacity=int(load.get("capacity") or 1)))
+            log.info("Pooled task=%s ready in %.1fs (idle slots=%d)", arn, now - launched, self.idle_slots())
+        finally:
+            self.warming.discard(arn)
+
+    async def _wait_ready(self, arn: str, deadline: float) -> Optional[tuple[str, dict]]:
+        ip = None
+        if self._tracker is not None:
+            info = await self._tracker.wait_running(arn, max(0.0, deadline - self._clock())) or {}
+            if info.get("lastStatus") != "RUNNING":
+                return None
+            ip = info.get("privateIp")
+        while self._clock() < deadline:
+            if ip is None:
+                info = await asyncio.to_thread(self._describe, arn)
+                status = info.get("lastStatus")
+                if status in ("STOPPED", "DEPROVISIONING", "STOPPING"):
+                    log.warning("Pooled task=%s stopped while warming: %s", arn, info.get("stoppedReason"))
+                    return None
+                if status == "RUNNING":
+                    ip = info.get("privateIp")
+            else:
+                load = await asyncio.to_thread(self._probe, ip)
+                if load and load.get("free"):
+                    return ip, load
+            await asyncio.sleep(2)
+        return None
+
+    def snapshot(self) -> dict:
+        return {
+            "mode": POOL_AGENT_MODE,
+            "agents": len(self.agents),
+            "idle_slots": self.idle_slots(),
+            "warming": len(self.warming),
+            "shared_rooms": len(self._room_agent),
+            "target_idle": self.target_idle(),
+            "arrival_rate_per_s": round(self.arrival_rate(), 4),
+            "warmup_s": round(self._warmup_s, 1),
+            **self.stats,
+        }
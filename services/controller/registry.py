@@ -0,0 +1,204 @@
+# services/controller/registry.py
+"""
+Room → agent registry shared by every controller process.
+
+RoomRegistry is the interface; SQLiteRegistry is the embedded implementation
+(one WAL-mode database file, safe for several uvicorn workers or controller
+containers on the same host). A networked store can implement the same
+interface; the operations map onto Redis as:
+
+    claim        SET room:{r} <record> NX          (Lua to also take over failed records)
+    update       WATCH/MULTI or Lua compare-and-set on the task field
+    release      GETDEL room:{r}
+    by_task      SMEMBERS task:{arn}               (secondary index)
+    seen_event   SET event:{id} 1 NX EX <ttl>
+    forget_event DEL event:{id}
+
+Record fields: room, state, task_arn, owner, shared (room sits on a multi-room
+worker), error, claimed_at, updated_at.
+"""
+import os
+import time
+import socket
+import sqlite3
+import logging
+import threading
+from abc import ABC, abstractmethod
+from typing import Optional
+
+log = logging.getLogger("registry")
+
+REGISTRY_PATH  = os.getenv("REGISTRY_PATH", "controller-registry.db")
+EVENT_TTL_S    = int(os.getenv("REGISTRY_EVENT_TTL_S", "3600"))
+INSTANCE_ID    = os.getenv("CONTROLLER_INSTANCE_ID") or f"{socket.gethostname()}:{os.getpid()}"
+
+_FIELDS = ("room", "state", "task_arn", "owner", "shared", "error", "claimed_at", "updated_at")
+_UNSET = object()
+
+
+class RoomRegistry(ABC):
+    @abstractmethod
+    def claim(self, room: str, owner: str = INSTANCE_ID) -> tuple[bool, dict]:
+        """
+        Atomically creates a pending record for `room` (or takes over a failed one).
+        Returns (claimed, record).
+        """
+        ...
+
+    @abstractmethod
+    def get(self, room: str) -> Optional[dict]:
+        ...
+
+    @abstractmethod
+    def update(self, room: str, *, expect_task_arn=_UNSET, expect_owner=_UNSET, **fields) -> bool:
+        """
+        Updates an existing record; with expect_task_arn / expect_owner only if those
+        still match (compare-and-set). False if the room is gone or the check failed.
+        """
+        ...
+
+    @abstractmethod
+    def release(self, room: str) -> Optional[dict]:
+        """Deletes and returns the record for `room`."""
+        ...
+
+    @abstractmethod
+    def rooms(self) -> list[dict]:
+        ...
+
+    @abstractmethod
+    def by_task(self, task_arn: str) -> list[str]:
+        ...
+
+    @abstractmethod
+    def seen_event(self, event_id: str) -> bool:
+        """Records a webhook event id; True if it had already been recorded."""
+        ...
+
+    @abstractmethod
+    def forget_event(self, event_id: str):
+        """Removes a recorded event id, so a redelivery is handled again."""
+        ...
+
+    def close(self):
+        pass
+
+
+class SQLiteRegistry(RoomRegistry):
+    def __init__(self, path: str = REGISTRY_PATH, event_ttl_s: int = EVENT_TTL_S):
+        self.path = path
+        self.event_ttl_s = event_ttl_s
+        self._local = threading.local()
+        self._last_prune = 0.0
+        with self._tx() as db:
+            db.execute("""CREATE TABLE IF NOT EXISTS rooms (
+                room TEXT PRIMARY KEY, state TEXT NOT NULL, task_arn TEXT, owner TEXT,
+                shared INTEGER NOT NULL DEFAULT 0, error TEXT,
+                claimed_at REAL NOT NULL, updated_at REAL NOT NULL)""")
+            db.execute("CREATE INDEX IF NOT EXISTS rooms_task ON rooms(task_arn)")
+            db.execute("CREATE TABLE IF NOT EXISTS events (id TEXT PRIMARY KEY, seen_at REAL NOT NULL)")
+        log.info("Room registry at %s (instance %s)", path, INSTANCE_ID)
+
+    # -------------------------
+    # connection handling
+    # -------------------------
+    def _db(self) -> sqlite3.Connection:
+        db = getattr(self._local, "db", None)
+        if db is None:
+            db = sqlite3.connect(self.path, timeout=5.0, isolation_level=None, check_same_thread=False)
+            db.execute("PRAGMA journal_mode=WAL")
+            db.execute("PRAGMA synchronous=NORMAL")
+            db.execute("PRAGMA busy_timeout=5000")
+            db.row_factory = sqlite3.Row
+            self._local.db = db
+        return db
+
+    class _Tx:
+        def __init__(self, db: sqlite3.Connection):
+            self.db = db
+
+        def __enter__(self) -> sqlite3.Connection:
+            self.db.execute("BEGIN IMMEDIATE")
+            return self.db
+
+        def __exit__(self, exc_type, *_):
+            self.db.execute("ROLLBACK" if exc_type else "COMMIT")
+
+    def _tx(self) -> "_Tx":
+        return self._Tx(self._db())
+
+    @staticmethod
+    def _row(r: Optional[sqlite3.Row]) -> Optional[dict]:
+        if r is None:
+            return None
+        d = {k: r[k] for k in _FIELDS}
+        d["shared"] = bool(d["shared"])
+        return d
+
+    # -------------------------
+    # RoomRegistry
+    # -------------------------
+    def claim(self, room: str, owner: str = INSTANCE_ID) -> tuple[bool, dict]:
+        now = time.time()
+        with self._tx() as db:
+            cur = db.execute(
+                "INSERT INTO rooms (room, state, owner, claimed_at, updated_at) VALUES (?, 'pending', ?, ?, ?) "
+                "ON CONFLICT(room) DO UPDATE SET state = 'pending', task_arn = NULL, shared = 0, "
+                "owner = excluded.owner, error = NULL, claimed_at = excluded.claimed_at, "
+                "updated_at = excluded.updated_at "
+                "WHERE rooms.state = 'failed'",
+                (room, owner, now, now))
+            rec = self._row(db.execute("SELECT * FROM rooms WHERE room = ?", (room,)).fetchone())
+        return cur.rowcount == 1, rec
+
+    def get(self, room: str) -> Optional[dict]:
+        return self._row(self._db().execute("SELECT * FROM rooms WHERE room = ?", (room,)).fetchone())
+
+    def update(self, room: str, *, expect_task_arn=_UNSET, expect_owner=_UNSET, **fields) -> bool:
+        bad = set(fields) - set(_FIELDS)
+        if bad:
+            raise ValueError(f"unknown registry fields: {sorted(bad)}")
+        fields["updated_at"] = time.time()
+        sets = ", ".join(f"{k} = ?" for k in fields)
+        args = [int(v) if isinstance(v, bool) else v for v in fields.values()] + [room]
+        sql = f"UPDATE rooms SET {sets} WHERE room = ?"
+        if expect_task_arn is not _UNSET:
+            sql += " AND task_arn IS ?"
+            args.append(expect_task_arn)
+        if expect_owner is not _UNSET:
+            sql += " AND owner IS ?"
+            args.append(expect_owner)
+        with self._tx() as db:
+            return db.execute(sql, args).rowcount == 1
+
+    def release(self, room: str) -> Optional[dict]:
+        with self._tx() as db:
+            rec = self._row(db.execute("SELECT * FROM rooms WHERE room = ?", (room,)).fetchone())
+            if rec:
+                db.execute("DELETE FROM rooms WHERE room = ?", (room,))
+        return rec
+
+    def rooms(self) -> list[dict]:
+        return [self._row(r) for r in self._db().execute("SELECT * FROM rooms ORDER BY claimed_at")]
+
+    def by_task(self, task_arn: str) -> list[str]:
+        return [r["room"] for r in self._db().execute("SELECT room FROM rooms WHERE task_arn = ?", (task_arn,))]
+
+    def seen_event(self, event_id: str) -> bool:
+        now = time.time()
+        with self._tx() as db:
+            cur = db.execute("INSERT OR IGNORE INTO events (id, seen_at) VALUES (?, ?)", (event_id, now))
+            if now - self._last_prune > 60:
+                db.execute("DELETE FROM events WHERE seen_at < ?", (now - self.event_ttl_s,))
+                self._last_prune = now
+        return cur.rowcount == 0
+
+    def forget_event(self, event_id: str):
+        with self._tx() as db:
+            db.execute("DELETE FROM events WHERE id = ?", (event_id,))
+
+    def close(self):
+        db = getattr(self._local, "db", None)
+        if db is not None:
+            db.close()
+            self._local.db = None
@@ -0,0 +1,173 @@
+# services/controller/setup_latency.py
+"""
+Call-setup latency: how long a caller waits from room_started until the agent
+is in the room and publishing audio.
+
+Each room claimed by this process gets a timeline of wall-clock stamps
+(time.time(), the clock LaunchQueue already uses):
+
+    webhook     room_started received
+    run_task    first RunTask attempt began (after queueing / rate limiting)
+    launched    RunTask returned a task
+    running     task RUNNING (ECS startedAt when describe_tasks has it, else
+                when the tracker saw it)
+    assigned    pool path: room handed to a warm agent
+    joined      participant_joined for the agent's identity (agent-{room})
+    published   its first track_published (audio)
+
+and the phases below are recorded into process-wide HDR-style histograms,
+per path (cold launch vs. warm pool):
+
+    cold  queue         webhook → run_task
+          runtask       run_task → launched   (includes retries and Spot fallback)
+          provisioning  launched → running    (PROVISIONING → PENDING → RUNNING)
+          room_join     running → joined      (agent process start-up + LiveKit join)
+    pool  assign        webhook → assigned
+          room_join     assigned → joined
+    both  publish       joined → published
+          total         webhook → published
+
+A room is reported once: when its agent publishes, or, incomplete, when the
+room ends first. Each report is logged as a "[setup]" line, appended to
+SETUP_JSONL if set, and the histograms are served under "setup" in /metrics.
+Stamps live in the process that handled room_started (like LaunchQueue.status);
+join events that reach another controller process are ignored there.
+"""
+import os
+import json
+import time
+import logging
+from collections import OrderedDict
+from typing import Optional
+
+from histogram import LatencyHistogram
+
+log = logging.getLogger("setup-latency")
+
+SETUP_JSONL    = os.getenv("SETUP_JSONL", "")                 # per-room results; empty = don't write
+SETUP_MAX_OPEN = int(os.getenv("SETUP_MAX_OPEN", "10000"))    # rooms awaiting their agent
+
+PHASES = {
+    "cold": {
+        "queue":        ("webhook", "run_task"),
+        "runtask":      ("run_task", "launched"),
+        "provisioning": ("launched", "running"),
+        "room_join":    ("running", "joined"),
+        "publish":      ("joined", "published"),
+        "total":        ("webhook", "published"),
+    },
+    "pool": {
+        "assign":       ("webhook", "assigned"),
+        "room_join":    ("assigned", "joined"),
+        "publish":      ("joined", "published"),
+        "total":        ("webhook", "published"),
+    },
+}
+
+
+def _is_audio(track: dict) -> bool:
+    # proto3 JSON leaves out zero-valued enums, and AUDIO is TrackType 0
+    return track.get("type", "AUDIO") in ("AUDIO", 0)
+
+
+class SetupLatency:
+    def __init__(self, jsonl_path: str = SETUP_JSONL, max_open: int = SETUP_MAX_OPEN):
+        self.jsonl_path = jsonl_path
+        self.max_open = max_open
+        self.open: OrderedDict[str, dict] = OrderedDict()
+        self.histograms = {path: {p: LatencyHistogram() for p in phases} for path, phases in PHASES.items()}
+        self.stats = {"completed": 0, "incomplete": 0, "evicted": 0, "relaunches": 0}
+
+    # -------------------------
+    # stamps
+    # -------------------------
+    def start(self, room: str, t: Optional[float] = None):
+        """room_started claimed by this process: opens the room's timeline."""
+        self.open[room] = {"room": room, "path": "cold", "stamps": {"webhook": t or time.time()}, "attempts": 0}
+        while len(self.open) > self.max_open:
+            self.open.popitem(last=False)
+            self.stats["evicted"] += 1
+
+    def assigned(self, room: str):
+        tl = self.open.get(room)
+        if tl:
+            tl["path"] = "pool"
+            tl["stamps"].setdefault("assigned", time.time())
+
+    def launched(self, room: str, st: Optional[dict]):
+        """RunTask returned. Takes the launch's own stamps; a relaunch replaces them."""
+        tl = self.open.get(room)
+        if not tl or not st or "joined" in tl["stamps"]:
+            return
+        s = tl["stamps"]
+        if "launched" in s:
+            self.stats["relaunches"] += 1
+            s.pop("running", None)
+        s["run_task"], s["launched"] = st["startedAt"], st["launchedAt"]
+        tl["attempts"] += st.get("attempts", 1)
+        tl["capacityProvider"] = st.get("capacityProvider")
+
+    def running(self, room: str, info: dict):
+        tl = self.open.get(room)
+        if tl and "launched" in tl["stamps"]:
+            tl["stamps"].setdefault("running", info.get("startedAt") or time.time())
+
+    def agent_event(self, room: str, event: str, data: dict) -> bool:
+        """
+        participant_joined / track_published from LiveKit. Only the agent's own
+        identity counts; True if it moved the room's timeline.
+        """
+        tl = self.open.get(room)
+        participant = data.get("participant") or {}
+        if tl is None or participant.get("identity") != f"agent-{room}":
+            return False
+        s = tl["stamps"]
+        if event == "participant_joined" and "joined" not in s:
+            s["joined"] = time.time()
+            return True
+        if event == "track_published" and _is_audio(data.get("track") or {}):
+            s.setdefault("joined", time.time())  # joined webhook lost or still in flight
+            s["published"] = time.time()
+            self._finish(room, complete=True)
+            return True
+        return False
+
+    def end(self, room: str):
+        """Room ended: a timeline still open never saw its agent publish."""
+        if room in self.open:
+            self._finish(room, complete=False)
+
+    # -------------------------
+    # export
+    # -------------------------
+    def _finish(self, room: str, complete: bool):
+        tl = self.open.pop(room)
+        s = tl["stamps"]
+        phases = {}
+        for phase, (a, b) in PHASES[tl["path"]].items():
+            if a in s and b in s:
+                ms = max(0.0, (s[b] - s[a]) * 1000)
+                phases[phase] = round(ms, 1)
+                if complete:
+                    self.histograms[tl["path"]][phase].record(ms)
+        self.stats["completed" if complete else "incomplete"] += 1
+        row = {"room": room, "path": tl["path"], "complete": complete, "attempts": tl["attempts"],
+               "capacityProvider": tl.get("capacityProvider"), "phases_ms": phases,
+               "stamps": {k: round(v, 3) for k, v in s.items()}}
+        if complete:
+            log.info("[setup] room=%s path=%s total=%s ms (%s)", room, tl["path"], phases.get("total"),
+                     " ".join(f"{k}={v}" for k, v in phases.items() if k != "total"))
+        else:
+            log.info("[setup] room=%s path=%s ended before its agent published (reached %s)",
+                     room, tl["path"], max(s, key=s.get))
+        if self.jsonl_path:
+            try:
+                with open(self.jsonl_path, "a") as f:
+                    f.write(json.dumps(row) + "\n")
+            except OSError as e:
+                log.warning("Could not write setup latency for room=%s: %s", room, e)
+
+    def snapshot(self) -> dict:
+        return {"open": len(self.open), **self.stats,
+                "phases_ms": {path: {p: h.to_dict() for p, h in hs.items()}
+                              for path, hs in self.histograms.items()}}
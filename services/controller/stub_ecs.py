@@ -0,0 +1,157 @@
+# services/controller/stub_ecs.py
+"""
+Local stand-in for the subset of the boto3 ECS client the controller uses
+(run_task / describe_tasks / stop_task / list_tasks).
+
+Tasks walk PROVISIONING → PENDING → RUNNING on a wall-clock schedule so pool,
+tracker and scheduler code can be exercised without AWS. Enable it in the
+controller with ECS_STUB=1.
+
+It can also misbehave like the real thing: run_task is throttled above
+ECS_STUB_RUNTASK_RATE/s (ThrottlingException), and FARGATE_SPOT launches fail
+with a capacity error with probability ECS_STUB_SPOT_FAIL_P.
+"""
+import os
+import time
+import uuid
+import random
+import threading
+from datetime import datetime, timezone
+
+from botocore.exceptions import ClientError
+
+
+class StubECS:
+    def __init__(self,
+                 provision_s: float = float(os.getenv("ECS_STUB_PROVISION_S", "2")),
+                 pending_s: float = float(os.getenv("ECS_STUB_PENDING_S", "3")),
+                 api_latency_s: float = float(os.getenv("ECS_STUB_API_LATENCY_S", "0.05")),
+                 private_ip: str = os.getenv("ECS_STUB_PRIVATE_IP", "127.0.0.1"),
+                 runtask_rate: float = float(os.getenv("ECS_STUB_RUNTASK_RATE", "0")),   # 0 = unlimited
+                 spot_fail_p: float = float(os.getenv("ECS_STUB_SPOT_FAIL_P", "0"))):
+        self.provision_s = provision_s
+        self.pending_s = pending_s
+        self.api_latency_s = api_latency_s
+        self.private_ip = private_ip
+        self.runtask_rate = runtask_rate
+        self.spot_fail_p = spot_fail_p
+        self._rt_tokens = runtask_rate
+        self._rt_last = time.monotonic()
+        self.tasks: dict[str, dict] = {}
+        self.calls: dict[str, int] = {}
+        self._lock = threading.Lock()
+
+    # -------------------------
+    # internals
+    # -------------------------
+    def _bump(self, name: str):
+        with self._lock:
+            self.calls[name] = self.calls.get(name, 0) + 1
+
+    def _call(self, name: str):
+        self._bump(name)
+        if self.api_latency_s > 0:
+            time.sleep(self.api_latency_s)
+
+    def _throttled(self) -> bool:
+        if self.runtask_rate <= 0:
+            return False
+        with self._lock:
+            now = time.monotonic()
+            self._rt_tokens = min(self.runtask_rate, self._rt_tokens + (now - self._rt_last) * self.runtask_rate)
+            self._rt_last = now
+            if self._rt_tokens < 1:
+                return True
+            self._rt_tokens -= 1
+            return False
+
+    def _status(self, t: dict) -> str:
+        if t.get("stoppedAt"):
+            return "STOPPED"
+        age = time.time() - t["createdAt"]
+        if age < self.provision_s:
+            return "PROVISIONING"
+        if age < self.provision_s + self.pending_s:
+            return "PENDING"
+        return "RUNNING"
+
+    def _view(self, t: dict) -> dict:
+        status = self._status(t)
+        running_at = t["createdAt"] + self.provision_s + self.pending_s
+        return {
+            "taskArn": t["taskArn"],
+            "lastStatus": status,
+            "createdAt": datetime.fromtimestamp(t["createdAt"], timezone.utc),
+            "startedAt": (datetime.fromtimestamp(running_at, timezone.utc)
+                          if status == "RUNNING" or t.get("stoppedAt", 0) > running_at else None),
+            "desiredStatus": "STOPPED" if t.get("stoppedAt") else "RUNNING",
+            "capacityProviderName": t["capacityProviderName"],
+            "stoppedReason": t.get("stoppedReason"),
+            "overrides": t["overrides"],
+            "containers": [{"name": "agent", "exitCode": t.get("exitCode")}],
+            "attachments": [{
+                "type": "ElasticNetworkInterface",
+                "details": [{"name": "privateIPv4Address", "value": self.private_ip}],
+            }],
+        }
+
+    # -------------------------
+    # ECS API surface
+    # -------------------------
+    def run_task(self, **kwargs):
+        self._call("run_task")
+        if self._throttled():
+            self._bump("throttled")
+            raise ClientError({"Error": {"Code": "ThrottlingException", "Message": "Rate exceeded"}}, "RunTask")
+        cps = kwargs.get("capacityProviderStrategy") or [{"capacityProvider": "FARGATE"}]
+        if cps[0]["capacityProvider"] == "FARGATE_SPOT" and random.random() < self.spot_fail_p:
+            self._bump("spot_capacity_failures")
+            return {"tasks": [], "failures": [{"reason": "Capacity is unavailable at this time. "
+                                                         "Please try again later or in a different availability zone"}]}
+        arn = f"arn:aws:ecs:stub:000000000000:task/{kwargs.get('cluster', 'stub')}/{uuid.uuid4().hex}"
+        t = {
+            "taskArn": arn,
+            "createdAt": time.time(),
+            "capacityProviderName": cps[0]["capacityProvider"],
+            "overrides": kwargs.get("overrides") or {},
+        }
+        with self._lock:
+            self.tasks[arn] = t
+        return {"tasks": [self._view(t)], "failures": []}
+
+    def describe_tasks(self, cluster: str, tasks: list[str], **_):
+        self._call("describe_tasks")
+        found, failures = [], []
+        with self._lock:
+            for arn in tasks:
+                t = self.tasks.get(arn)
+                if t is None:
+                    failures.append({"arn": arn, "reason": "MISSING"})
+                else:
+                    found.append(self._view(t))
+        return {"tasks": found, "failures": failures}
+
+    def stop_task(self, cluster: str, task: str, reason: str = "", **_):
+        self._call("stop_task")
+        with self._lock:
+            t = self.tasks.get(task)
+            if t is not None and not t.get("stoppedAt"):
+                t["stoppedAt"] = time.time()
+                t["stoppedReason"] = reason
+                t["exitCode"] = 143
+        return {"task": self._view(t) if t else {}}
+
+    def list_tasks(self, cluster: str, desiredStatus: str = "RUNNING", **_):
+        self._call("list_tasks")
+        with self._lock:
+            arns = [a for a, t in self.tasks.items()
+                    if (desiredStatus == "STOPPED") == bool(t.get("stoppedAt"))]
+        return {"taskArns": arns}
+
+    # test helper: simulate a Spot reclaim / crash
+    def kill(self, task_arn: str, reason: str = "Your Spot Task was interrupted."):
+        with self._lock:
+            t = self.tasks.get(task_arn)
+            if t is not None:
+                t["stoppedAt"] = time.time()
+                t["stoppedReason"] = reason
@@ -0,0 +1,200 @@
+# services/controller/task_tracker.py
+"""
+One background poller for every ECS task the controller cares about.
+
+Instead of a describe_tasks loop per task, all tracked ARNs are described in
+batches of up to 100 (the API limit) per poll. The poll interval adapts: fast
+while any task is still on its way to RUNNING, backing off towards
+TRACKER_SLOW_S once everything is steady, and doubling on throttling.
+
+Transitions are published through `on_transition(arn, room, old, new, info)`:
+    RUNNING  task came up
+    STOPPED  task stopped or vanished (Spot reclaim, crash, StopTask)
+    STUCK    task still not RUNNING after TRACKER_STUCK_S (published once)
+"""
+import os
+import time
+import asyncio
+import logging
+from dataclasses import dataclass, field
+from typing import Awaitable, Callable, Optional
+
+from botocore.exceptions import ClientError
+
+from launch_agent import describe_task_batch, DESCRIBE_BATCH
+
+log = logging.getLogger("tracker")
+
+TRACKER_FAST_S  = float(os.getenv("TRACKER_FAST_S", "1"))
+TRACKER_SLOW_S  = float(os.getenv("TRACKER_SLOW_S", "15"))
+TRACKER_STUCK_S = float(os.getenv("TRACKER_STUCK_S", "180"))
+
+TERMINAL = ("STOPPED", "DELETED")
+
+
+@dataclass
+class Tracked:
+    arn: str
+    room: Optional[str]
+    since: float
+    status: Optional[str] = None
+    info: dict = field(default_factory=dict)
+    stuck: bool = False
+    waiters: list[asyncio.Future] = field(default_factory=list)
+
+
+class TaskTracker:
+    def __init__(self,
+                 *,
+                 describe: Callable[[list[str]], list[dict]] = describe_task_batch,
+                 on_transition: Optional[Callable[[str, Optional[str], Optional[str], str, dict], Awaitable[None]]] = None,
+                 run_blocking: Optional[Callable] = None,
+                 fast_s: float = TRACKER_FAST_S,
+                 slow_s: float = TRACKER_SLOW_S,
+                 stuck_s: float = TRACKER_STUCK_S,
+                 batch: int = DESCRIBE_BATCH,
+                 clock: Callable[[], float] = time.monotonic):
+        self._describe = describe
+        self._on_transition = on_transition
+        self._run_blocking = run_blocking or (lambda fn, *a: asyncio.to_thread(fn, *a))
+        self.fast_s, self.slow_s, self.stuck_s = fast_s, slow_s, stuck_s
+        self.batch = batch
+        self._clock = clock
+        self.tasks: dict[str, Tracked] = {}
+        self.interval = fast_s
+        self._wake = asyncio.Event()
+        self._runner: Optional[asyncio.Task] = None
+        self.stats = {"polls": 0, "describe_calls": 0, "throttled": 0, "transitions": 0}
+
+    # -------------------------
+    # API
+    # -------------------------
+    def track(self, arn: str, room: Optional[str] = None):
+        """Starts (or updates the room of) tracking for `arn`."""
+        t = self.tasks.get(arn)
+        if t is None:
+            self.tasks[arn] = Tracked(arn=arn, room=room, since=self._clock())
+            self.interval = self.fast_s
+            self._wake.set()
+        elif room is not None:
+            t.room = room
+
+    def untrack(self, arn: str):
+        t = self.tasks.pop(arn, None)
+        if t:
+            self._resolve(t)
+
+    def status(self, arn: str) -> dict:
+        """Last known summary for `arn` ({} if unknown or not yet polled)."""
+        t = self.tasks.get(arn)
+        return dict(t.info) if t else {}
+
+    async def wait_running(self, arn: str, timeout_s: float) -> Optional[dict]:
+        """
+        Waits until `arn` is RUNNING (or terminal) and returns its summary; None on
+        timeout. Tracks the task if it isn't already.
+        """
+        self.track(arn)
+        t = self.tasks[arn]
+        if t.status == "RUNNING" or t.status in TERMINAL:
+            return dict(t.info)
+        fut = asyncio.get_running_loop().create_future()
+        t.waiters.append(fut)
+        try:
+            return await asyncio.wait_for(fut, timeout=timeout_s)
+        except asyncio.TimeoutError:
+            return None
+
+    def start(self):
+        if self._runner is None:
+            self._runner = asyncio.create_task(self._run(), name="task-tracker")
+
+    async def close(self):
+        if self._runner:
+            self._runner.cancel()
+            self._runner = None
+
+    # -------------------------
+    # polling
+    # -------------------------
+    async def _run(self):
+        while True:
+            if self.tasks:
+                try:
+                    await self.poll()
+                except Exception:
+                    log.exception("tracker poll failed")
+            self._wake.clear()
+            try:
+                await asyncio.wait_for(self._wake.wait(), timeout=self.interval if self.tasks else None)
+            except asyncio.TimeoutError:
+                pass
+
+    async def poll(self):
+        self.stats["polls"] += 1
+        arns = list(self.tasks)
+        throttled = False
+        for i in range(0, len(arns), self.batch):
+            chunk = arns[i:i + self.batch]
+            self.stats["describe_calls"] += 1
+            try:
+                infos = await self._run_blocking(self._describe, chunk)
+            except ClientError as e:
+                code = e.response.get("Error", {}).get("Code", "")
+                log.warning("describe_tasks error (%s) for %d tasks: %s", code, len(chunk), e)
+                throttled = throttled or "Throttl" in code
+                continue
+            for info in infos:
+                await self._update(info)
+        self._adapt(throttled)
+
+    def _adapt(self, throttled: bool):
+        if throttled:
+            self.stats["throttled"] += 1
+            self.interval = min(self.slow_s, self.interval * 2)
+        elif any(t.status not in ("RUNNING",) + TERMINAL for t in self.tasks.values()):
+            self.interval = self.fast_s
+        else:
+            self.interval = min(self.slow_s, self.interval * 1.5)
+
+    async def _update(self, info: dict):
+        t = self.tasks.get(info.get("taskArn"))
+        if t is None:
+            return
+        new = info.get("lastStatus") or "UNKNOWN"
+        old = t.status
+        t.info = info
+        if new != old:
+            t.status = new
+            if new == "RUNNING" or new in TERMINAL:
+                await self._publish(t, old, "STOPPED" if new in TERMINAL else new)
+        if new in TERMINAL:
+            self.untrack(t.arn)
+        elif new == "RUNNING":
+            self._resolve(t)
+        elif not t.stuck and self._clock() - t.since > self.stuck_s:
+            t.stuck = True
+            log.warning("Task %s stuck in %s for %.0fs", t.arn, new, self._clock() - t.since)
+            await self._publish(t, old, "STUCK")
+
+    async def _publish(self, t: Tracked, old: Optional[str], new: str):
+        self.stats["transitions"] += 1
+        log.info("Task %s (room=%s): %s → %s", t.arn, t.room, old, new)
+        if self._on_transition:
+            try:
+                await self._on_transition(t.arn, t.room, old, new, dict(t.info))
+            except Exception:
+                log.exception("on_transition failed for %s", t.arn)
+
+    def _resolve(self, t: Tracked):
+        for fut in t.waiters:
+            if not fut.done():
+                fut.set_result(dict(t.info))
+        t.waiters.clear()
+
+    def snapshot(self) -> dict:
+        by_status: dict[str, int] = {}
+        for t in self.tasks.values():
+            by_status[t.status or "UNKNOWN"] = by_status.get(t.status or "UNKNOWN", 0) + 1
+        return {"tracked": len(self.tasks), "interval_s": round(self.interval, 2),
+                "by_status": by_status, **self.stats}